@@ -1,40 +1,35 @@
 #!/usr/bin/env python3
+import json
 import os
+import sys
 
 import aws_cdk as cdk
 
+from cdk_demo.stack_registry import StackRegistry
+from cdk_demo.stage_matrix import DemoStage, load_stages, select_stages
 
-from cdk_demo.network_stack import NetworkStack
-from cdk_demo.security_stack import *
-from cdk_demo.db_replication_stack import *
-from cdk_demo.elb_stack import *
-from cdk_demo.backend_stack import *
-
-SECONDARY_AZ = ['us-west-2a','us-west-2b','us-west-2c']
-PRIMARY_AZ = ['us-east-1a','us-east-1b','us-east-1c']
-PRIMARY_ENV=cdk.Environment(account='445362076974', region='us-east-1')
-SECONDARY_ENV=cdk.Environment(account='445362076974', region='us-west-2')
+# Stacks, their environments and dependencies are listed in stacks.json.
+# Only the selected stacks and what they depend on are imported and built:
+#   cdk synth -c stacks=backend
+#   cdk synth -c stacks=network,security -c timing=true
+# With -c stages=... the stacks are built once per stage of stages.json
+# instead, each in its own CDK Stage:
+#   cdk synth -c stages=all
+#   cdk synth -c stages=dev-us-east-1,prod-us-east-1
+STACKS_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stacks.json")
 
 app = cdk.App()
-network_stack = NetworkStack(app, "cdk-demo-NetworkStack","cdk-demo-vpc","10.0.0.0/16", availability_zones = PRIMARY_AZ, env=PRIMARY_ENV)
-security_stack = SecurityStack(app, "cdk-demo-SecurityStack", vpc = network_stack.outputs['vpc'],env=PRIMARY_ENV )
-
-elb_props = ElbStackProps(
-    vpc = network_stack.outputs['vpc'],
-    public_subnets = network_stack.outputs['public_subnets'],
-    alb_security_group=security_stack.outputs['ALBSG']
-)
-elb_stack = ElbStack(app, "cdk-demo-ElbStack",elb_props,env=PRIMARY_ENV)
-
-backend_props = BackendStackProps(
-    vpc=network_stack.outputs['vpc'],
-    private_subnets=network_stack.outputs['private_subnets'],
-    resource_prefix="cdk-demo-",
-    environment='dev',
-    db_name="test",
-    db_engine_version="15.3",
-    security_output=security_stack.outputs,
-    elb_output=elb_stack.outputs
-)
-backend_stack = BackendStack(app, "cdk-demo-BackendStack",backend_props,env=PRIMARY_ENV)
+stacks_config_path = app.node.try_get_context("stacks_config") or STACKS_CONFIG
+stage_selection = app.node.try_get_context("stages")
+if stage_selection:
+    with open(stacks_config_path, encoding='utf-8') as config_file:
+        stacks_config = json.load(config_file)
+    registries = [DemoStage(app, stage, stacks_config).registry
+                  for stage in select_stages(load_stages(), stage_selection)]
+else:
+    registries = [StackRegistry.from_file(app, stacks_config_path)]
+    registries[0].build(StackRegistry.parse_selection(app.node.try_get_context("stacks")))
+if str(app.node.try_get_context("timing")).lower() == "true":
+    for registry in registries:
+        print(registry.timing_report(), file=sys.stderr)
 app.synth()
@@ -0,0 +1,93 @@
+"""Warm vs. cold latency of the email Lambda handler.
+
+Cold invocations start from an empty client registry, as a new execution
+environment would; warm invocations reuse the cached clients. Real boto3
+clients are created, but every API call is answered by a botocore Stubber so
+nothing leaves the machine.
+
+    python benchmarks/bench_email_clients.py [iterations]
+"""
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+from botocore.stub import Stubber
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from cdk_demo.lambda_functions import email_sender as email_lambda
+
+BATCH_SIZE = 10
+_stubbers = {}
+
+
+def _stubbed_client(service_name):
+    client = _create_client(service_name)
+    stubber = Stubber(client)
+    stubber.activate()
+    _stubbers[service_name] = stubber
+    return client
+
+
+_create_client = email_lambda._create_client
+email_lambda._create_client = _stubbed_client
+
+
+def make_event():
+    body = json.dumps({
+        'Source': "from@example.com",
+        'Destination': {'ToAddresses': ["to@example.com"]},
+        'Message': {'Subject': {'Data': "Hello"}, 'Body': {'Html': {'Data': "<p>Hello</p>"}}}
+    })
+    return {'Records': [{
+        'messageId': str(i),
+        'receiptHandle': f"handle-{i}",
+        'eventSourceARN': "arn:aws:sqs:us-east-1:123456789012:cdk-demo--dev",
+        'body': body
+    } for i in range(BATCH_SIZE)]}
+
+
+def prime_responses():
+    # Clients are created inside the handler on a cold start, so queue the
+    # responses on first use rather than up front.
+    email_lambda.get_client('ses')
+    for _ in range(BATCH_SIZE):
+        _stubbers['ses'].add_response('send_email', {'MessageId': "id"})
+
+
+def run(iterations, cold):
+    event = make_event()
+    timings = []
+    for _ in range(iterations):
+        if cold:
+            email_lambda.reset_clients()
+            start = time.perf_counter()
+            prime_responses()
+        else:
+            prime_responses()
+            start = time.perf_counter()
+        # The handler prints one EMF metrics line per invocation
+        with contextlib.redirect_stdout(io.StringIO()):
+            email_lambda.lambda_handler(event, None)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(label, timings):
+    print(f"{label:<5} p50={statistics.median(timings):8.3f}ms  "
+          f"mean={statistics.mean(timings):8.3f}ms  max={max(timings):8.3f}ms")
+
+
+if __name__ == '__main__':
+    os.environ.setdefault('AWS_REGION', "us-east-1")
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', "testing")
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', "testing")
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+    print(f"batch of {BATCH_SIZE} records, {iterations} iterations")
+    report("cold", run(iterations, cold=True))
+    report("warm", run(iterations, cold=False))
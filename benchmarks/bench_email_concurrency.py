@@ -0,0 +1,54 @@
+"""Throughput of the email Lambda handler against send concurrency.
+
+A fake SES client sleeps for a fixed latency on every call, standing in for
+the SES round trip, so the numbers show how much of that latency the bounded
+thread pool hides.
+
+    python benchmarks/bench_email_concurrency.py [latency_ms] [batch_size]
+"""
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from cdk_demo.lambda_functions import email_sender as email_lambda
+
+
+class LatencySes:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def send_email(self, **kwargs):
+        time.sleep(self.latency)
+        return {'MessageId': "id"}
+
+
+def make_event(batch_size):
+    body = json.dumps({
+        'Source': "from@example.com",
+        'Destination': {'ToAddresses': ["to@example.com"]},
+        'Message': {'Subject': {'Data': "Hello"}, 'Body': {'Html': {'Data': "<p>Hello</p>"}}}
+    })
+    return {'Records': [{'messageId': str(i), 'receiptHandle': f"handle-{i}", 'body': body}
+                        for i in range(batch_size)]}
+
+
+if __name__ == '__main__':
+    latency = (float(sys.argv[1]) if len(sys.argv) > 1 else 50) / 1000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    email_lambda.set_client('ses', LatencySes(latency))
+    event = make_event(batch_size)
+
+    print(f"batch of {batch_size} records, {latency * 1000:.0f}ms per SES call")
+    for concurrency in (1, 2, 4, 8, 16, 32):
+        os.environ['SEND_CONCURRENCY'] = str(concurrency)
+        start = time.perf_counter()
+        # The handler prints one EMF metrics line per invocation
+        with contextlib.redirect_stdout(io.StringIO()):
+            email_lambda.lambda_handler(event, None)
+        elapsed = time.perf_counter() - start
+        print(f"concurrency={concurrency:<3} {elapsed * 1000:9.1f}ms  {batch_size / elapsed:8.1f} emails/s")
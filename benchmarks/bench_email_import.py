@@ -0,0 +1,40 @@
+"""Import time of the email Lambda handler module, as paid on a cold start.
+
+Every sample starts a fresh interpreter from the function's source folder,
+the way Lambda loads the handler, and subtracts the bare interpreter start.
+
+    python benchmarks/bench_email_import.py [runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SOURCE_DIR = os.path.join(os.path.dirname(__file__), '..', 'cdk_demo', 'lambda_functions')
+
+STATEMENTS = {
+    'interpreter': "pass",
+    'email_sender': "import email_sender",
+    'email_sender + boto3': "import email_sender; import boto3",
+    'email_sender + SES client': "import email_sender; email_sender.get_client('ses')",
+}
+
+
+def sample(statement, runs):
+    env = dict(os.environ, AWS_REGION="us-east-1", PYTHONDONTWRITEBYTECODE="1")
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", statement], cwd=SOURCE_DIR, env=env, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+    baseline = sample(STATEMENTS['interpreter'], runs)
+    print(f"median of {runs} fresh interpreters, interpreter start {baseline:.1f}ms subtracted")
+    for label, statement in list(STATEMENTS.items())[1:]:
+        print(f"{label:<26} {sample(statement, runs) - baseline:8.1f}ms")
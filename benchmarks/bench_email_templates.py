@@ -0,0 +1,54 @@
+"""Template rendering from the in-memory cache against a cold load.
+
+A cold load reads and compiles the template document, either from the
+deployment package or from a fake S3 client that adds a fixed latency; a
+cached render only substitutes the variables.
+
+    python benchmarks/bench_email_templates.py [iterations] [s3_latency_ms]
+"""
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from cdk_demo.lambda_functions import email_sender as email_lambda
+
+VARIABLES = {'name': "Ada", 'account': {'id': "42"}}
+
+
+class LatencyS3:
+    def __init__(self, document, latency):
+        self.document = json.dumps(document).encode()
+        self.latency = latency
+
+    def get_object(self, Bucket, Key):
+        time.sleep(self.latency)
+        return {'Body': io.BytesIO(self.document)}
+
+
+def measure(iterations, cold):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        if cold:
+            email_lambda.reset_templates()
+        email_lambda.get_template('welcome').render(VARIABLES)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    s3_latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000
+
+    print(f"{'cold load (package)':<22} {measure(iterations, cold=True):10.1f}us/render")
+    print(f"{'cached':<22} {measure(iterations, cold=False):10.1f}us/render")
+
+    with open(os.path.join(os.path.dirname(email_lambda.__file__), 'templates', 'welcome.json')) as template_file:
+        document = json.load(template_file)
+    email_lambda.set_client('s3', LatencyS3(document, s3_latency))
+    os.environ.update({'TEMPLATE_DIR': "", 'TEMPLATE_BUCKET': "templates"})
+    s3_iterations = max(1, iterations // 100)
+    print(f"{'cold load (S3)':<22} {measure(s3_iterations, cold=True):10.1f}us/render")
+    print(f"{'cached':<22} {measure(iterations, cold=False):10.1f}us/render")
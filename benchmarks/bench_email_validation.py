@@ -0,0 +1,54 @@
+"""Parse and schema validation overhead of the email Lambda per 1,000 records.
+
+Compares a bare ``json.loads`` of every body against ``parse_record``, which
+also runs the precompiled message schema.
+
+    python benchmarks/bench_email_validation.py [rounds]
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from cdk_demo.lambda_functions import email_sender as email_lambda
+
+RECORDS = 1000
+
+
+def make_records():
+    rendered = json.dumps({
+        'Source': "from@example.com",
+        'Destination': {'ToAddresses': ["to@example.com"], 'CcAddresses': ["cc@example.com"]},
+        'Message': {'Subject': {'Data': "Hello"}, 'Body': {'Html': {'Data': "<p>Hello</p>" * 50}}}
+    })
+    templated = json.dumps({
+        'Source': "from@example.com",
+        'Destination': {'ToAddresses': ["to@example.com"]},
+        'Template': "welcome",
+        'TemplateData': {'name': "Ada", 'account': {'id': "42"}}
+    })
+    return [{'messageId': str(i), 'body': rendered if i % 2 else templated} for i in range(RECORDS)]
+
+
+def measure(rounds, parse):
+    records = make_records()
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for record in records:
+            parse(record)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+if __name__ == '__main__':
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    baseline = measure(rounds, lambda record: json.loads(record['body']))
+    validated = measure(rounds, email_lambda.parse_record)
+    print(f"per {RECORDS} records (best of {rounds})")
+    print(f"json.loads only      {baseline:8.3f}ms")
+    print(f"parse + validate     {validated:8.3f}ms")
+    print(f"validation overhead  {validated - baseline:8.3f}ms ({(validated / baseline - 1) * 100:.0f}%)")
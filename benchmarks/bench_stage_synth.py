@@ -0,0 +1,42 @@
+"""Wall time of synthesizing every stage of stages.json, one process against many.
+
+The sequential run is ``python app.py`` with ``-c stages=all``, one
+interpreter building all stages into one assembly. The parallel run gives
+each stage its own worker process and cloud assembly folder. Parallel synth
+only wins with more than one CPU, each worker pays its own jsii start.
+
+    python benchmarks/bench_stage_synth.py [runs] [workers]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+
+def sample(command, runs, context=None):
+    timings = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as outdir:
+            env = dict(os.environ, CDK_OUTDIR=outdir, CDK_CONTEXT_JSON=json.dumps(context or {}),
+                       JSII_SILENCE_WARNING_DEPRECATED_NODE_VERSION="1")
+            start = time.perf_counter()
+            subprocess.run([*command, *(["--outdir", outdir] if context is None else [])], cwd=APP_DIR, env=env,
+                           check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    workers = sys.argv[2] if len(sys.argv) > 2 else str(os.cpu_count() or 1)
+
+    print(f"median of {runs} synths of all stages, {os.cpu_count()} CPUs")
+    sequential = sample([sys.executable, "app.py"], runs, context={'stages': "all"})
+    parallel = sample([sys.executable, "-m", "cdk_demo.stage_matrix", "--workers", workers], runs)
+    print(f"{'sequential, one process':<34} {sequential:8.1f}ms")
+    print(f"{f'parallel, {workers} workers':<34} {parallel:8.1f}ms")
@@ -0,0 +1,46 @@
+"""Wall time of ``python app.py`` for the full app and for selective synthesis.
+
+Every sample is a fresh interpreter synthesizing into its own temporary
+output folder, so nothing is shared between runs. The selection is passed
+the way ``cdk synth -c stacks=...`` passes it, through CDK_CONTEXT_JSON.
+
+    python benchmarks/bench_synth.py [runs]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+SELECTIONS = {
+    'all stacks': None,
+    'network': "network",
+    'elb (network, security)': "elb",
+    'backend (network, security, elb)': "backend",
+}
+
+
+def sample(selection, runs):
+    context = {'stacks': selection} if selection else {}
+    timings = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as outdir:
+            env = dict(os.environ, CDK_OUTDIR=outdir, CDK_CONTEXT_JSON=json.dumps(context),
+                       JSII_SILENCE_WARNING_DEPRECATED_NODE_VERSION="1")
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "app.py"], cwd=APP_DIR, env=env, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    print(f"median of {runs} synths")
+    for label, selection in SELECTIONS.items():
+        print(f"{label:<34} {sample(selection, runs):8.1f}ms")
@@ -0,0 +1,42 @@
+"""Wall time of the unit test suite with and without shared templates.
+
+"per-test synthesis" sets CDK_TEST_SHARED_TEMPLATES=0, so every test
+synthesizes its stacks again as the suite used to. "shared templates" uses
+the session fixtures of tests/unit/conftest.py. The xdist run spreads the
+shared-template suite over worker processes, it needs more than one CPU to win.
+
+    python benchmarks/bench_unit_tests.py [runs] [workers]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+RUNS = {
+    'per-test synthesis': ([], {'CDK_TEST_SHARED_TEMPLATES': "0"}),
+    'shared templates': ([], {}),
+}
+
+
+def sample(arguments, environment, runs):
+    env = dict(os.environ, JSII_SILENCE_WARNING_DEPRECATED_NODE_VERSION="1", **environment)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-m", "pytest", "-q", "tests/unit", *arguments], cwd=ROOT_DIR, env=env,
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    workers = sys.argv[2] if len(sys.argv) > 2 else "auto"
+    RUNS[f'shared templates, xdist -n {workers}'] = (["-n", workers], {})
+
+    print(f"median of {runs} runs, {os.cpu_count()} CPUs")
+    for label, (arguments, environment) in RUNS.items():
+        print(f"{label:<34} {sample(arguments, environment, runs):8.2f}s")
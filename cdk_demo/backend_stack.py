@@ -6,13 +6,364 @@ from aws_cdk import (
     aws_sqs as sqs,
     aws_lambda as lambda_,
     aws_iam as iam,
+    aws_dynamodb as dynamodb,
+    aws_cloudwatch as cloudwatch,
     aws_rds as rds,
+    aws_kms as kms,
     aws_ecs as ecs,
-    aws_autoscaling as autoscaling
+    aws_elasticloadbalancingv2 as elbv2,
+    aws_autoscaling as autoscaling,
+    aws_applicationautoscaling as appscaling
 )
 from constructs import Construct
+from cdk_demo.lambda_packaging import python_function_code
+from cdk_demo.cache_cluster import CacheCluster, CacheClusterSettings
 import os.path as path
 
+class EmailQueueSettings:
+    """Tuning of the WorkerQueue and the email Lambda that consumes it."""
+
+    MAX_BATCH_SIZE = 10000
+    MAX_BATCHING_WINDOW_SECONDS = 300
+    MAX_DELIVERY_DELAY_SECONDS = 900
+    # AWS recommends a visibility timeout of at least six times the function
+    # timeout so retried batches are not redelivered while still in flight
+    MIN_VISIBILITY_TIMEOUT_RATIO = 6
+
+    def __init__(self, batch_size: int = 10,
+                  max_batching_window: Duration = None,
+                  max_concurrency: int = None,
+                  visibility_timeout: Duration = Duration.seconds(180),
+                  delivery_delay: Duration = Duration.seconds(1),
+                  lambda_timeout: Duration = Duration.seconds(30),
+                  max_receive_count: int = 5):
+        self.batch_size = batch_size
+        self.max_batching_window = max_batching_window
+        self.max_concurrency = max_concurrency
+        self.visibility_timeout = visibility_timeout
+        self.delivery_delay = delivery_delay
+        self.lambda_timeout = lambda_timeout
+        self.max_receive_count = max_receive_count
+
+    def validate(self):
+        if not 1 <= self.batch_size <= self.MAX_BATCH_SIZE:
+            raise ValueError(f"batch_size must be between 1 and {self.MAX_BATCH_SIZE}, got {self.batch_size}")
+        window = self.max_batching_window.to_seconds() if self.max_batching_window else 0
+        if window > self.MAX_BATCHING_WINDOW_SECONDS:
+            raise ValueError(f"max_batching_window must be at most {self.MAX_BATCHING_WINDOW_SECONDS} seconds, got {window}")
+        if self.batch_size > 10 and window < 1:
+            raise ValueError("batch_size above 10 requires a max_batching_window of at least 1 second")
+        if self.max_concurrency is not None and not 2 <= self.max_concurrency <= 1000:
+            raise ValueError(f"max_concurrency must be between 2 and 1000, got {self.max_concurrency}")
+        if self.delivery_delay and self.delivery_delay.to_seconds() > self.MAX_DELIVERY_DELAY_SECONDS:
+            raise ValueError(f"delivery_delay must be at most {self.MAX_DELIVERY_DELAY_SECONDS} seconds")
+        if not 1 <= self.max_receive_count <= 1000:
+            raise ValueError(f"max_receive_count must be between 1 and 1000, got {self.max_receive_count}")
+        visibility = self.visibility_timeout.to_seconds()
+        lambda_timeout = self.lambda_timeout.to_seconds()
+        if visibility < self.MIN_VISIBILITY_TIMEOUT_RATIO * lambda_timeout:
+            raise ValueError(f"visibility_timeout ({visibility}s) must be at least "
+                             f"{self.MIN_VISIBILITY_TIMEOUT_RATIO}x the Lambda timeout ({lambda_timeout}s)")
+
+class IdempotencySettings:
+    """Deduplication of redelivered emails through a DynamoDB table with TTL."""
+
+    KEY_SOURCES = ('message_id', 'content')
+
+    def __init__(self, enabled: bool = True,
+                  key_source: str = 'message_id',
+                  ttl: Duration = Duration.hours(24),
+                  cache_size: int = 1024):
+        self.enabled = enabled
+        self.key_source = key_source
+        self.ttl = ttl
+        self.cache_size = cache_size
+
+    def validate(self):
+        if self.key_source not in self.KEY_SOURCES:
+            raise ValueError(f"key_source must be one of {self.KEY_SOURCES}, got {self.key_source!r}")
+
+class EmailFunctionSettings:
+    """Packaging and sizing of the email Lambda function."""
+
+    def __init__(self, architecture: lambda_.Architecture = lambda_.Architecture.ARM_64,
+                  memory_size: int = 256,
+                  provisioned_concurrency: int = 0):
+        self.architecture = architecture
+        self.memory_size = memory_size
+        # Environments initialised ahead of traffic, served through the "live" alias
+        self.provisioned_concurrency = provisioned_concurrency
+
+    def validate(self):
+        if not 128 <= self.memory_size <= 10240:
+            raise ValueError(f"memory_size must be between 128 and 10240 MB, got {self.memory_size}")
+        if self.provisioned_concurrency < 0:
+            raise ValueError("provisioned_concurrency must not be negative")
+
+class EmailMonitoringSettings:
+    """Dashboard and alarms over the EMF metrics written by the email Lambda."""
+
+    def __init__(self, enabled: bool = True,
+                  namespace: str = "CdkDemo/Email",
+                  ses_error_threshold: int = 1,
+                  batch_latency_alarm_ratio: float = 0.8,
+                  dead_letter_threshold: int = 1):
+        self.enabled = enabled
+        self.namespace = namespace
+        self.ses_error_threshold = ses_error_threshold
+        # Alarm when p99 batch latency exceeds this share of the Lambda timeout
+        self.batch_latency_alarm_ratio = batch_latency_alarm_ratio
+        self.dead_letter_threshold = dead_letter_threshold
+
+class EcsCapacitySettings:
+    """EC2 capacity behind the ECS cluster and its managed scaling."""
+
+    def __init__(self, instance_type: str = "t3.small",
+                  min_capacity: int = 0,
+                  max_capacity: int = 4,
+                  target_capacity_percent: int = 90,
+                  instance_warmup: Duration = Duration.seconds(120),
+                  maximum_scaling_step_size: int = 2):
+        self.instance_type = instance_type
+        self.min_capacity = min_capacity
+        self.max_capacity = max_capacity
+        # Share of the ASG capacity ECS aims to use, the rest is headroom
+        self.target_capacity_percent = target_capacity_percent
+        self.instance_warmup = instance_warmup
+        self.maximum_scaling_step_size = maximum_scaling_step_size
+
+    def validate(self):
+        if not 0 <= self.min_capacity <= self.max_capacity or self.max_capacity < 1:
+            raise ValueError(f"ASG capacity must satisfy 0 <= min <= max and max >= 1, got {self.min_capacity}..{self.max_capacity}")
+        if not 1 <= self.target_capacity_percent <= 100:
+            raise ValueError(f"target_capacity_percent must be between 1 and 100, got {self.target_capacity_percent}")
+
+class ServiceScalingSettings:
+    """Task-level auto scaling of the frontend ECS service."""
+
+    def __init__(self, min_tasks: int = 1,
+                  max_tasks: int = 6,
+                  cpu_target_percent: int = 60,
+                  memory_target_percent: int = 75,
+                  requests_per_target: int = 1000,
+                  cpu_step_scale_out: list = None,
+                  scale_in_cooldown: Duration = Duration.seconds(120),
+                  scale_out_cooldown: Duration = Duration.seconds(30)):
+        self.min_tasks = min_tasks
+        self.max_tasks = max_tasks
+        self.cpu_target_percent = cpu_target_percent
+        self.memory_target_percent = memory_target_percent
+        # ALB RequestCountPerTarget on staging_front_tg, None turns it off
+        self.requests_per_target = requests_per_target
+        # (CPU percent lower bound, tasks to add) steps that react to spikes
+        # faster than target tracking; scale-in is left to target tracking
+        self.cpu_step_scale_out = cpu_step_scale_out if cpu_step_scale_out is not None else [(85, 2), (95, 4)]
+        self.scale_in_cooldown = scale_in_cooldown
+        self.scale_out_cooldown = scale_out_cooldown
+
+    def validate(self):
+        if not 1 <= self.min_tasks <= self.max_tasks:
+            raise ValueError(f"Service scaling must satisfy 1 <= min_tasks <= max_tasks, got {self.min_tasks}..{self.max_tasks}")
+        for name in ('cpu_target_percent', 'memory_target_percent'):
+            if not 1 <= getattr(self, name) <= 100:
+                raise ValueError(f"{name} must be between 1 and 100, got {getattr(self, name)}")
+        thresholds = [threshold for threshold, _ in self.cpu_step_scale_out]
+        if thresholds != sorted(thresholds) or any(not self.cpu_target_percent < t <= 100 for t in thresholds):
+            raise ValueError("cpu_step_scale_out thresholds must be ascending and above cpu_target_percent")
+
+class QueueWorkerSettings:
+    """Which consumers drain the WorkerQueue and how ECS workers scale on its backlog.
+
+    ``lambda`` keeps the email Lambda as the only consumer, ``ecs`` replaces it
+    with a worker service and ``hybrid`` runs both, with the workers only
+    joining in once the backlog stays above ``hybrid_backlog_threshold``.
+    """
+
+    MODES = ('lambda', 'ecs', 'hybrid')
+    # Application Auto Scaling limit on step adjustments per policy
+    MAX_STEP_ADJUSTMENTS = 20
+
+    def __init__(self, mode: str = 'lambda',
+                  worker_image: str = None,
+                  backlog_per_worker: int = 100,
+                  min_workers: int = 0,
+                  max_workers: int = 10,
+                  hybrid_backlog_threshold: int = 1000,
+                  hybrid_sustained_periods: int = 5,
+                  memory_limit_mib: int = 512,
+                  cooldown: Duration = Duration.seconds(60)):
+        self.mode = mode
+        self.worker_image = worker_image
+        # Visible messages one worker task is expected to keep up with
+        self.backlog_per_worker = backlog_per_worker
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.hybrid_backlog_threshold = hybrid_backlog_threshold
+        # Minutes the backlog must stay high before workers start in hybrid mode
+        self.hybrid_sustained_periods = hybrid_sustained_periods
+        self.memory_limit_mib = memory_limit_mib
+        self.cooldown = cooldown
+
+    @property
+    def uses_lambda(self) -> bool:
+        return self.mode in ('lambda', 'hybrid')
+
+    @property
+    def uses_ecs(self) -> bool:
+        return self.mode in ('ecs', 'hybrid')
+
+    def worker_steps(self) -> list:
+        """Worker counts above min_workers the backlog steps scale to, ending at max_workers.
+
+        One step per count while that fits the step adjustment limit, with
+        the step below min_workers taking one; coarser, evenly spaced counts
+        beyond that.
+        """
+        stride = -(-(self.max_workers - self.min_workers) // (self.MAX_STEP_ADJUSTMENTS - 1))
+        return list(range(self.max_workers, self.min_workers, -stride))[::-1]
+
+    def validate(self):
+        if self.mode not in self.MODES:
+            raise ValueError(f"mode must be one of {self.MODES}, got {self.mode!r}")
+        if not self.uses_ecs:
+            return
+        if not self.worker_image:
+            raise ValueError(f"worker_image is required in {self.mode!r} mode")
+        if self.backlog_per_worker < 1:
+            raise ValueError(f"backlog_per_worker must be at least 1, got {self.backlog_per_worker}")
+        if not 0 <= self.min_workers < self.max_workers:
+            raise ValueError(f"Workers must satisfy 0 <= min_workers < max_workers, got {self.min_workers}..{self.max_workers}")
+        if self.mode == 'hybrid' and (self.hybrid_backlog_threshold < 0 or self.hybrid_sustained_periods < 1):
+            raise ValueError("hybrid_backlog_threshold must not be negative and hybrid_sustained_periods must be at least 1")
+
+class DatabaseProxySettings:
+    """RDS Proxy pooling the connections ECS tasks open to the Aurora cluster."""
+
+    def __init__(self, enabled: bool = False,
+                  max_connections_percent: int = 90,
+                  max_idle_connections_percent: int = 50,
+                  idle_client_timeout: Duration = Duration.minutes(30),
+                  borrow_timeout: Duration = Duration.seconds(120),
+                  require_tls: bool = True):
+        self.enabled = enabled
+        # Share of the cluster's max_connections the proxy may hold open
+        self.max_connections_percent = max_connections_percent
+        self.max_idle_connections_percent = max_idle_connections_percent
+        self.idle_client_timeout = idle_client_timeout
+        # How long a client waits for a pooled connection during a storm
+        self.borrow_timeout = borrow_timeout
+        self.require_tls = require_tls
+
+    def validate(self):
+        if not 1 <= self.max_connections_percent <= 100:
+            raise ValueError(f"max_connections_percent must be between 1 and 100, got {self.max_connections_percent}")
+        if not 0 <= self.max_idle_connections_percent <= self.max_connections_percent:
+            raise ValueError("max_idle_connections_percent must be between 0 and max_connections_percent")
+        if not 60 <= self.idle_client_timeout.to_seconds() <= 28800:
+            raise ValueError("idle_client_timeout must be between 1 minute and 8 hours")
+
+class DatabaseReader:
+    """One Aurora reader instance, serverless v2 or provisioned."""
+
+    def __init__(self, name: str,
+                  instance_type: str = None,
+                  scale_with_writer: bool = False,
+                  promotion_tier: int = None):
+        self.name = name
+        # None makes a serverless v2 reader, otherwise e.g. "r6g.large"
+        self.instance_type = instance_type
+        # Serverless v2 readers in promotion tier 0-1 follow the writer's
+        # capacity so they can take over on failover
+        self.scale_with_writer = scale_with_writer
+        # Failover priority of provisioned readers, 0 is promoted first
+        self.promotion_tier = promotion_tier
+
+    @property
+    def serverless(self) -> bool:
+        return self.instance_type is None
+
+    def validate(self):
+        if self.serverless and self.promotion_tier is not None:
+            raise ValueError(f"Reader {self.name!r}: serverless v2 readers set scale_with_writer, not promotion_tier")
+        if not self.serverless and self.scale_with_writer:
+            raise ValueError(f"Reader {self.name!r}: scale_with_writer only applies to serverless v2 readers")
+        if self.promotion_tier is not None and not 0 <= self.promotion_tier <= 15:
+            raise ValueError(f"Reader {self.name!r}: promotion_tier must be between 0 and 15, got {self.promotion_tier}")
+
+    def instance(self) -> rds.IClusterInstance:
+        if self.serverless:
+            return rds.ClusterInstance.serverless_v2(self.name, scale_with_writer=self.scale_with_writer)
+        return rds.ClusterInstance.provisioned(self.name,
+            instance_type=ec2.InstanceType(self.instance_type),
+            promotion_tier=self.promotion_tier
+        )
+
+class DatabaseSettings:
+    """Serverless v2 capacity and reader instances of the Aurora cluster."""
+
+    def __init__(self, min_capacity: float = 0.5,
+                  max_capacity: float = 2,
+                  readers: list = None,
+                  global_cluster_identifier: str = None):
+        # Aurora capacity units, in steps of 0.5
+        self.min_capacity = min_capacity
+        self.max_capacity = max_capacity
+        self.readers = readers or []
+        # Makes the cluster the primary of an Aurora Global Database that
+        # DatabaseReplicationStack clusters in other regions join
+        self.global_cluster_identifier = global_cluster_identifier
+
+    def validate(self):
+        for capacity in (self.min_capacity, self.max_capacity):
+            if not 0.5 <= capacity <= 128 or capacity * 2 != int(capacity * 2):
+                raise ValueError(f"Capacity must be between 0.5 and 128 ACU in steps of 0.5, got {capacity}")
+        if self.min_capacity > self.max_capacity:
+            raise ValueError(f"min_capacity ({self.min_capacity}) must not exceed max_capacity ({self.max_capacity})")
+        names = [reader.name for reader in self.readers]
+        if len(set(names)) != len(names) or "writer" in names:
+            raise ValueError(f"Reader names must be unique and not 'writer', got {names}")
+        for reader in self.readers:
+            reader.validate()
+
+class FargateBurstSettings:
+    """Fargate service that absorbs bursts while the EC2 service carries the baseline.
+
+    ECS does not mix ASG and Fargate capacity providers in one service, so the
+    burst tasks run as a second service behind the same target group, spread
+    over FARGATE and FARGATE_SPOT by weight.
+    """
+
+    def __init__(self, enabled: bool = False,
+                  base: int = 0,
+                  fargate_weight: int = 1,
+                  spot_weight: int = 3,
+                  max_tasks: int = 10,
+                  cpu: int = 256,
+                  memory_limit_mib: int = 512,
+                  scale_out_cpu_percent: int = 80,
+                  scale_in_cpu_percent: int = 50,
+                  scale_out_step: int = 2):
+        self.enabled = enabled
+        # Tasks always kept on on-demand FARGATE before the weights apply
+        self.base = base
+        self.fargate_weight = fargate_weight
+        self.spot_weight = spot_weight
+        self.max_tasks = max_tasks
+        self.cpu = cpu
+        self.memory_limit_mib = memory_limit_mib
+        # Burst tasks follow the EC2 service's average CPU
+        self.scale_out_cpu_percent = scale_out_cpu_percent
+        self.scale_in_cpu_percent = scale_in_cpu_percent
+        self.scale_out_step = scale_out_step
+
+    def validate(self):
+        if not 0 <= self.base <= self.max_tasks or self.max_tasks < 1:
+            raise ValueError(f"Fargate burst tasks must satisfy 0 <= base <= max_tasks and max_tasks >= 1, got {self.base}..{self.max_tasks}")
+        if self.fargate_weight < 0 or self.spot_weight < 0 or self.fargate_weight + self.spot_weight == 0:
+            raise ValueError("fargate_weight and spot_weight must not be negative and at least one must be positive")
+        if not 0 < self.scale_in_cpu_percent < self.scale_out_cpu_percent <= 100:
+            raise ValueError("CPU thresholds must satisfy 0 < scale_in_cpu_percent < scale_out_cpu_percent <= 100")
+
 class BackendStackProps:
     def __init__(self, vpc: ec2.IVpc,
                   private_subnets: list,
@@ -21,7 +372,25 @@ class BackendStackProps:
                   db_name: str, 
                   db_engine_version: str,
                   security_output: dict,
-                  elb_output: dict):
+                  elb_output: dict,
+                  ses_region: str = None,
+                  send_concurrency: int = None,
+                  ses_max_send_rate: float = None,
+                  email_queue: EmailQueueSettings = None,
+                  template_bucket_name: str = None,
+                  template_prefix: str = None,
+                  bulk_send_enabled: bool = False,
+                  idempotency: IdempotencySettings = None,
+                  monitoring: EmailMonitoringSettings = None,
+                  email_function: EmailFunctionSettings = None,
+                  ecs_capacity: EcsCapacitySettings = None,
+                  service_scaling: ServiceScalingSettings = None,
+                  queue_workers: QueueWorkerSettings = None,
+                  db_proxy: DatabaseProxySettings = None,
+                  database: DatabaseSettings = None,
+                  cache: CacheClusterSettings = None,
+                  network_mode: ecs.NetworkMode = ecs.NetworkMode.BRIDGE,
+                  fargate_burst: FargateBurstSettings = None):
         self.vpc = vpc
         self.env = environment
         self.private_subnets = private_subnets
@@ -30,84 +399,292 @@ class BackendStackProps:
         self.db_engine_version = db_engine_version
         self.security_output = security_output
         self.elb_output = elb_output
+        self.ses_region = ses_region
+        self.send_concurrency = send_concurrency
+        self.ses_max_send_rate = ses_max_send_rate
+        self.email_queue = email_queue or EmailQueueSettings()
+        self.template_bucket_name = template_bucket_name
+        self.template_prefix = template_prefix
+        self.bulk_send_enabled = bulk_send_enabled
+        self.idempotency = idempotency or IdempotencySettings()
+        self.monitoring = monitoring or EmailMonitoringSettings()
+        self.email_function = email_function or EmailFunctionSettings()
+        self.ecs_capacity = ecs_capacity or EcsCapacitySettings()
+        self.service_scaling = service_scaling or ServiceScalingSettings()
+        self.queue_workers = queue_workers or QueueWorkerSettings()
+        self.db_proxy = db_proxy or DatabaseProxySettings()
+        self.database = database or DatabaseSettings()
+        self.cache = cache or CacheClusterSettings()
+        # Must match the network_mode given to SecurityStack and ElbStackProps
+        self.network_mode = network_mode
+        self.fargate_burst = fargate_burst or FargateBurstSettings()
+
+    @property
+    def db_cluster_identifier(self) -> str:
+        """Cluster identifier from the prefix and environment, "cdk-demo-" in dev gives "cdkdemodbdev"."""
+        prefix = "".join(character for character in self.resource_prefix.lower() if character.isalnum())
+        return f"{prefix}db{self.env}"
+
+    @property
+    def task_security_group(self) -> ec2.ISecurityGroup:
+        """Security group ECS tasks connect from: their own in awsvpc mode, the instances' otherwise."""
+        if self.network_mode == ecs.NetworkMode.AWS_VPC:
+            return self.security_output['ECSTaskSG']
+        return self.security_output['ECSSG']
         
 class BackendStack(Stack):
 
     def __init__(self, scope: Construct, construct_id: str, props: BackendStackProps, **kwargs):
         super().__init__(scope, construct_id, **kwargs)
 
+        queue_settings = props.email_queue
+        queue_settings.validate()
+        idempotency_settings = props.idempotency
+        idempotency_settings.validate()
+        function_settings = props.email_function
+        function_settings.validate()
+        props.ecs_capacity.validate()
+        props.service_scaling.validate()
+        worker_settings = props.queue_workers
+        worker_settings.validate()
+        props.db_proxy.validate()
+        database_settings = props.database
+        database_settings.validate()
+        props.cache.validate()
+        if props.network_mode == ecs.NetworkMode.AWS_VPC and 'ECSTaskSG' not in props.security_output:
+            raise ValueError("awsvpc network mode needs the ECSTaskSG security group from SecurityStack")
+        props.fargate_burst.validate()
+        # Fargate tasks only register by IP, which the target groups use in awsvpc mode
+        if props.fargate_burst.enabled and props.network_mode != ecs.NetworkMode.AWS_VPC:
+            raise ValueError("Fargate burst capacity needs the awsvpc network mode")
+        self.output_props = {}
+
+        # Messages that fail max_receive_count times, and records the
+        # Lambda rejects as invalid, end up in the dead-letter queue
+        worker_dead_letter_queue = sqs.Queue(self, "WorkerDeadLetterQueue",
+                                    queue_name=f"{props.resource_prefix}-{props.env}-dlq",
+                                    retention_period=Duration.days(14))
+
         worker_queue = sqs.Queue(self, "WorkerQueue",
                                     queue_name=f"{props.resource_prefix}-{props.env}",
-                                    delivery_delay=Duration.seconds(1))
+                                    delivery_delay=queue_settings.delivery_delay,
+                                    visibility_timeout=queue_settings.visibility_timeout,
+                                    dead_letter_queue=sqs.DeadLetterQueue(
+                                        max_receive_count=queue_settings.max_receive_count,
+                                        queue=worker_dead_letter_queue
+                                    ))
 
         # Lambda Function
+        lambda_environment = {
+            'DEAD_LETTER_QUEUE_ARN': worker_dead_letter_queue.queue_arn,
+            'METRICS_NAMESPACE': props.monitoring.namespace
+        }
+        if props.ses_region:
+            lambda_environment['SES_REGION'] = props.ses_region
+        if props.send_concurrency:
+            lambda_environment['SEND_CONCURRENCY'] = str(props.send_concurrency)
+        if props.ses_max_send_rate:
+            lambda_environment['SES_MAX_SEND_RATE'] = str(props.ses_max_send_rate)
+        # Templates not bundled with the function are loaded from this bucket
+        if props.template_bucket_name:
+            lambda_environment['TEMPLATE_BUCKET'] = props.template_bucket_name
+        if props.template_prefix:
+            lambda_environment['TEMPLATE_PREFIX'] = props.template_prefix
+        # Same-template messages go out through SES bulk sends; groups whose
+        # template is not published to SES are rendered and sent singly
+        if props.bulk_send_enabled:
+            lambda_environment['BULK_SEND_ENABLED'] = "true"
+
+        # Idempotency table, redelivered messages are skipped instead of resent
+        if idempotency_settings.enabled:
+            idempotency_table = dynamodb.Table(self, "IdempotencyTable",
+                partition_key=dynamodb.Attribute(name="id", type=dynamodb.AttributeType.STRING),
+                billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+                time_to_live_attribute="expires_at"
+            )
+            lambda_environment.update({
+                'IDEMPOTENCY_TABLE': idempotency_table.table_name,
+                'IDEMPOTENCY_KEY_SOURCE': idempotency_settings.key_source,
+                'IDEMPOTENCY_TTL': str(int(idempotency_settings.ttl.to_seconds())),
+                'IDEMPOTENCY_IN_PROGRESS_TTL': str(int(queue_settings.lambda_timeout.to_seconds())),
+                'IDEMPOTENCY_CACHE_SIZE': str(idempotency_settings.cache_size)
+            })
         lambda_function = lambda_.Function(self, f"{props.resource_prefix}-LambdaFunction",
-                                                          handler="lambda_function.lambda_handler",
+                                                          handler="email_sender.lambda_handler",
                                                           function_name=f"SendEmailFromSQS-{props.env}",
                                                           role=props.security_output['LambdaRole'],  # Adjust this according to your setup
                                                           runtime=lambda_.Runtime.PYTHON_3_11,
-                                                          code=lambda_.Code.from_asset("cdk_demo/lambda_functions"),
-                                                          timeout=Duration.seconds(30))
+                                                          # Only the handler, its templates and pinned requirements
+                                                          code=python_function_code("cdk_demo/lambda_functions", "email_sender",
+                                                                                    data_dirs=["templates"],
+                                                                                    architecture=function_settings.architecture),
+                                                          architecture=function_settings.architecture,
+                                                          memory_size=function_settings.memory_size,
+                                                          environment=lambda_environment,
+                                                          timeout=queue_settings.lambda_timeout)
 
-        # Lambda Event Source Mapping
-        email_lambda_function_event_source_mapping = lambda_.EventSourceMapping(
-            self, "EmailLambdaFunctionEventSourceMapping",
-            batch_size=10,
-            enabled=True,
-            event_source_arn=worker_queue.queue_arn,
-            target=lambda_function
-        )
+        # Provisioned environments run the init phase, including client
+        # creation, before traffic arrives; the queue then invokes the alias
+        lambda_target = lambda_function
+        if function_settings.provisioned_concurrency:
+            lambda_target = lambda_function.add_alias("live",
+                provisioned_concurrent_executions=function_settings.provisioned_concurrency)
+
+        # Lambda Event Source Mapping, absent when only ECS workers consume the queue
+        if worker_settings.uses_lambda:
+            email_lambda_function_event_source_mapping = lambda_.EventSourceMapping(
+                self, "EmailLambdaFunctionEventSourceMapping",
+                batch_size=queue_settings.batch_size,
+                max_batching_window=queue_settings.max_batching_window,
+                max_concurrency=queue_settings.max_concurrency,
+                enabled=True,
+                event_source_arn=worker_queue.queue_arn,
+                target=lambda_target,
+                # The handler returns batchItemFailures, so only failed records
+                # are redelivered and successful ones are deleted by Lambda
+                report_batch_item_failures=True
+            )
+
+        if props.monitoring.enabled:
+            self._add_email_monitoring(props, lambda_function, worker_dead_letter_queue)
 
         subnet_group = rds.SubnetGroup(self, "MySubnetGroup",
             description="description",
             vpc=props.vpc,
 
             # the properties below are optional
-            subnet_group_name="subnetGroup-cdk-demo",
+            subnet_group_name=f"subnetGroup-{props.resource_prefix.strip('-')}",
             vpc_subnets=ec2.SubnetSelection(
                 subnets=props.private_subnets
             )
         )
+        # Encrypted with a key in this region, like the secondary cluster in
+        # DatabaseReplicationStack, since a global database needs every
+        # member encrypted alike
+        database_key = kms.Key(self, "DatabaseKey",
+            description="KMS key for database encryption",
+            enable_key_rotation=True
+        )
         dbcluster = rds.DatabaseCluster(self, "Database",
-            engine=rds.DatabaseClusterEngine.aurora_postgres(version=rds.AuroraPostgresEngineVersion.VER_15_3),
+            engine=rds.DatabaseClusterEngine.aurora_postgres(version=rds.AuroraPostgresEngineVersion.of(
+                props.db_engine_version, props.db_engine_version.split(".")[0])),
             credentials=rds.Credentials.from_generated_secret("clusteradmin"),  # Optional - will default to 'admin' username and generated password
             writer=rds.ClusterInstance.serverless_v2("writer"),
-            serverless_v2_min_capacity=0.5,
-            serverless_v2_max_capacity=2,
+            readers=[reader.instance() for reader in database_settings.readers],
+            serverless_v2_min_capacity=database_settings.min_capacity,
+            serverless_v2_max_capacity=database_settings.max_capacity,
             vpc=props.vpc,
             security_groups=[props.security_output['DBSG']],
-            cluster_identifier="cdkdemodbdev",
+            cluster_identifier=props.db_cluster_identifier,
             default_database_name = props.db_name,
-            subnet_group=subnet_group
+            subnet_group=subnet_group,
+            storage_encrypted=True,
+            storage_encryption_key=database_key
         )
+        if database_settings.global_cluster_identifier:
+            rds.CfnGlobalCluster(self, "GlobalCluster",
+                global_cluster_identifier=database_settings.global_cluster_identifier,
+                source_db_cluster_identifier=dbcluster.cluster_identifier
+            )
+        CfnOutput(self, "DatabaseReaderEndpoint", value=dbcluster.cluster_read_endpoint.hostname)
+
+        # The proxy shares DBSG, so ECS tasks reach it through the existing
+        # ECSSG rule and it reaches the cluster through DBSG's self rule. It
+        # targets a view of the cluster with a literal port, otherwise the
+        # rule CDK adds to DBSG would reference this stack's endpoint port.
+        if props.db_proxy.enabled:
+            proxy_settings = props.db_proxy
+            proxy_target = rds.DatabaseCluster.from_database_cluster_attributes(self, "DatabaseProxyTarget",
+                cluster_identifier=dbcluster.cluster_identifier,
+                engine=dbcluster.engine,
+                port=5432,
+                security_groups=[props.security_output['DBSG']]
+            )
+            db_proxy = rds.DatabaseProxy(self, "DatabaseProxy",
+                proxy_target=rds.ProxyTarget.from_cluster(proxy_target),
+                secrets=[dbcluster.secret],
+                vpc=props.vpc,
+                vpc_subnets=ec2.SubnetSelection(subnets=props.private_subnets),
+                security_groups=[props.security_output['DBSG']],
+                max_connections_percent=proxy_settings.max_connections_percent,
+                max_idle_connections_percent=proxy_settings.max_idle_connections_percent,
+                idle_client_timeout=proxy_settings.idle_client_timeout,
+                borrow_timeout=proxy_settings.borrow_timeout,
+                require_tls=proxy_settings.require_tls
+            )
+            db_proxy.node.add_dependency(dbcluster)
+            CfnOutput(self, "DatabaseProxyEndpoint", value=db_proxy.endpoint)
+            self.output_props['db_proxy'] = db_proxy
+            db_writer_endpoint = db_reader_endpoint = db_proxy.endpoint
+            # Reads through the proxy need its read-only endpoint to reach the readers
+            if database_settings.readers:
+                proxy_reader_endpoint = rds.CfnDBProxyEndpoint(self, "DatabaseProxyReadOnlyEndpoint",
+                    db_proxy_name=db_proxy.db_proxy_name,
+                    db_proxy_endpoint_name=f"{self.stack_name}-reader",
+                    vpc_subnet_ids=[subnet.subnet_id for subnet in props.private_subnets],
+                    vpc_security_group_ids=[props.security_output['DBSG'].security_group_id],
+                    target_role="READ_ONLY"
+                )
+                db_reader_endpoint = proxy_reader_endpoint.attr_endpoint
+                CfnOutput(self, "DatabaseProxyReaderEndpoint", value=db_reader_endpoint)
+        else:
+            db_writer_endpoint = dbcluster.cluster_endpoint.hostname
+            db_reader_endpoint = dbcluster.cluster_read_endpoint.hostname
+        self.output_props['db_cluster'] = dbcluster
+
+        # Web tasks read through the cache before going to Aurora
+        web_environment = {
+            'DB_WRITER_ENDPOINT': db_writer_endpoint,
+            'DB_READER_ENDPOINT': db_reader_endpoint,
+            'DB_PORT': "5432",
+            'DB_NAME': props.db_name
+        }
+        if props.cache.enabled:
+            cache_cluster = CacheCluster(self, "Cache",
+                vpc=props.vpc,
+                subnets=props.private_subnets,
+                allowed_security_group=props.task_security_group,
+                settings=props.cache
+            )
+            web_environment['CACHE_ENDPOINT'] = cache_cluster.endpoint_address
+            web_environment['CACHE_PORT'] = str(cache_cluster.port)
+            CfnOutput(self, "CacheEndpoint", value=cache_cluster.endpoint_address)
+            self.output_props['cache'] = cache_cluster
 
         ecs_cluster = ecs.Cluster(self, "Cluster",
             vpc=props.vpc,
             cluster_name=f"{props.resource_prefix}-{props.env}"
         )
 
+        capacity_settings = props.ecs_capacity
         auto_scaling_group = autoscaling.AutoScalingGroup(self, "ASG",
             vpc=props.vpc,
-            instance_type=ec2.InstanceType("t2.micro"),
+            instance_type=ec2.InstanceType(capacity_settings.instance_type),
             machine_image=ecs.EcsOptimizedImage.amazon_linux2(),
-            min_capacity=0,
-            max_capacity=2,
+            min_capacity=capacity_settings.min_capacity,
+            max_capacity=capacity_settings.max_capacity,
+            default_instance_warmup=capacity_settings.instance_warmup,
             security_group=props.security_output['ECSSG']
         )
 
+        # ECS managed scaling grows the ASG ahead of pending tasks
         capacity_provider = ecs.AsgCapacityProvider(self, "AsgCapacityProvider",
-            auto_scaling_group=auto_scaling_group
+            auto_scaling_group=auto_scaling_group,
+            enable_managed_scaling=True,
+            target_capacity_percent=capacity_settings.target_capacity_percent,
+            maximum_scaling_step_size=capacity_settings.maximum_scaling_step_size
+        )
+        capacity_provider.node.find_child(capacity_provider.node.id).add_property_override(
+            "AutoScalingGroupProvider.ManagedScaling.InstanceWarmupPeriod",
+            int(capacity_settings.instance_warmup.to_seconds())
         )
         ecs_cluster.add_asg_capacity_provider(capacity_provider)
 
         # Create a Task Definition for the container to start
         front_task_definition = ecs.Ec2TaskDefinition(self, "FrontendTaskDef",
-                                                task_role= props.security_output['ECSTaskRole'])
-        front_task_definition.add_container("web",
-            image=ecs.ContainerImage.from_registry("amazon/amazon-ecs-sample"),
-            memory_limit_mib=256,
-            port_mappings = [ecs.PortMapping(container_port=80)]
-        )
+                                                task_role= props.security_output['ECSTaskRole'],
+                                                network_mode=props.network_mode)
+        self._add_web_container(front_task_definition, web_environment)
         front_service = ecs.Ec2Service(self, "EC2Service",
             cluster=ecs_cluster,
             task_definition=front_task_definition,
@@ -115,12 +692,223 @@ class BackendStack(Stack):
                 capacity_provider=capacity_provider.capacity_provider_name,
                 weight=1
             )
-            ]
+            ],
+            **self._service_networking(props)
         )
 
         props.elb_output['staging_front_tg'].add_target(front_service)
 
+        self._add_service_scaling(props.service_scaling, front_service, props.elb_output['staging_front_tg'])
+
+        if props.fargate_burst.enabled:
+            ecs_cluster.enable_fargate_capacity_providers()
+            self._add_fargate_burst(props, ecs_cluster, front_service, web_environment)
+
+        if worker_settings.uses_ecs:
+            self._add_queue_workers(props, worker_queue, lambda_environment, ecs_cluster, capacity_provider)
+
+    @property
+    def outputs(self):
+        return self.output_props
+
+    @staticmethod
+    def _add_web_container(task_definition: ecs.TaskDefinition, environment: dict):
+        task_definition.add_container("web",
+            image=ecs.ContainerImage.from_registry("amazon/amazon-ecs-sample"),
+            memory_limit_mib=256,
+            port_mappings = [ecs.PortMapping(container_port=80)],
+            # Writes go to the writer endpoint, reads can be spread over the readers
+            environment=environment
+        )
+
+    def _add_fargate_burst(self, props: BackendStackProps, cluster: ecs.ICluster, baseline_service: ecs.BaseService,
+                           environment: dict):
+        settings = props.fargate_burst
+        burst_task_definition = ecs.FargateTaskDefinition(self, "FargateBurstTaskDef",
+            cpu=settings.cpu,
+            memory_limit_mib=settings.memory_limit_mib,
+            task_role=props.security_output['ECSTaskRole']
+        )
+        self._add_web_container(burst_task_definition, environment)
+        burst_service = ecs.FargateService(self, "FargateBurstService",
+            cluster=cluster,
+            task_definition=burst_task_definition,
+            desired_count=settings.base,
+            capacity_provider_strategies=[
+                ecs.CapacityProviderStrategy(capacity_provider="FARGATE", base=settings.base, weight=settings.fargate_weight),
+                ecs.CapacityProviderStrategy(capacity_provider="FARGATE_SPOT", weight=settings.spot_weight)
+            ],
+            **self._service_networking(props)
+        )
+        props.elb_output['staging_front_tg'].add_target(burst_service)
+
+        # Fargate tasks start in seconds, so they take the load while the
+        # EC2 service waits for new instances, and leave once it has cooled down
+        scalable_target = burst_service.auto_scale_task_count(
+            min_capacity=settings.base,
+            max_capacity=settings.max_tasks
+        )
+        scalable_target.scale_on_metric("BaselineCpuScaling",
+            metric=baseline_service.metric_cpu_utilization(period=Duration.minutes(1)),
+            scaling_steps=[
+                appscaling.ScalingInterval(upper=settings.scale_in_cpu_percent, change=-1),
+                appscaling.ScalingInterval(lower=settings.scale_out_cpu_percent, change=settings.scale_out_step)
+            ],
+            adjustment_type=appscaling.AdjustmentType.CHANGE_IN_CAPACITY,
+            cooldown=props.service_scaling.scale_out_cooldown
+        )
 
+    @staticmethod
+    def _service_networking(props: BackendStackProps) -> dict:
+        # awsvpc tasks get an ENI in the private subnets with the task security group
+        if props.network_mode != ecs.NetworkMode.AWS_VPC:
+            return {}
+        return dict(
+            security_groups=[props.task_security_group],
+            vpc_subnets=ec2.SubnetSelection(subnets=props.private_subnets)
+        )
 
+    def _add_queue_workers(self, props: BackendStackProps, queue: sqs.IQueue, environment: dict,
+                           cluster: ecs.ICluster, capacity_provider: ecs.AsgCapacityProvider):
+        settings = props.queue_workers
+        worker_task_definition = ecs.Ec2TaskDefinition(self, "QueueWorkerTaskDef",
+                                                task_role=props.security_output['ECSTaskRole'],
+                                                network_mode=props.network_mode)
+        # Workers get the same settings as the email Lambda, plus the queue to poll
+        worker_task_definition.add_container("worker",
+            image=ecs.ContainerImage.from_registry(settings.worker_image),
+            memory_limit_mib=settings.memory_limit_mib,
+            environment={**environment, 'QUEUE_URL': queue.queue_url},
+            logging=ecs.LogDrivers.aws_logs(stream_prefix="queue-worker")
+        )
+        worker_service = ecs.Ec2Service(self, "QueueWorkerService",
+            cluster=cluster,
+            task_definition=worker_task_definition,
+            desired_count=settings.min_workers,
+            capacity_provider_strategies=[ecs.CapacityProviderStrategy(
+                capacity_provider=capacity_provider.capacity_provider_name,
+                weight=1
+            )],
+            **self._service_networking(props)
+        )
 
+        # Backlog per task: each step starts as soon as the backlog is more
+        # than the workers of the step below can drain at backlog_per_worker
+        # messages each, so a running worker never has much more than that.
+        # In hybrid mode the offset leaves the first hybrid_backlog_threshold
+        # messages to Lambda.
+        offset = settings.hybrid_backlog_threshold if settings.mode == 'hybrid' else 0
+        scalable_target = worker_service.auto_scale_task_count(
+            min_capacity=settings.min_workers,
+            max_capacity=settings.max_workers
+        )
+        worker_steps = settings.worker_steps()
+        scalable_target.scale_on_metric("BacklogScaling",
+            metric=queue.metric_approximate_number_of_messages_visible(period=Duration.minutes(1), statistic="Maximum"),
+            scaling_steps=[appscaling.ScalingInterval(upper=offset + settings.min_workers * settings.backlog_per_worker + 1,
+                                                      change=settings.min_workers)] + [
+                appscaling.ScalingInterval(lower=offset + previous * settings.backlog_per_worker + 1, change=workers)
+                for previous, workers in zip([settings.min_workers] + worker_steps, worker_steps)
+            ],
+            adjustment_type=appscaling.AdjustmentType.EXACT_CAPACITY,
+            evaluation_periods=settings.hybrid_sustained_periods if settings.mode == 'hybrid' else 1,
+            cooldown=settings.cooldown
+        )
 
+    def _add_service_scaling(self, settings: ServiceScalingSettings, service: ecs.BaseService,
+                             target_group: elbv2.IApplicationTargetGroup):
+        scalable_target = service.auto_scale_task_count(
+            min_capacity=settings.min_tasks,
+            max_capacity=settings.max_tasks
+        )
+        cooldowns = dict(scale_in_cooldown=settings.scale_in_cooldown, scale_out_cooldown=settings.scale_out_cooldown)
+        scalable_target.scale_on_cpu_utilization("CpuScaling",
+            target_utilization_percent=settings.cpu_target_percent, **cooldowns)
+        scalable_target.scale_on_memory_utilization("MemoryScaling",
+            target_utilization_percent=settings.memory_target_percent, **cooldowns)
+        if settings.requests_per_target:
+            scalable_target.scale_on_request_count("RequestCountScaling",
+                requests_per_target=settings.requests_per_target,
+                target_group=target_group,
+                **cooldowns)
+        if settings.cpu_step_scale_out:
+            # A zero-change interval below the first threshold keeps the
+            # step policy scale-out only
+            scalable_target.scale_on_metric("CpuStepScaling",
+                metric=service.metric_cpu_utilization(period=Duration.minutes(1)),
+                scaling_steps=[appscaling.ScalingInterval(upper=settings.cpu_step_scale_out[0][0], change=0)] + [
+                    appscaling.ScalingInterval(lower=threshold, change=tasks)
+                    for threshold, tasks in settings.cpu_step_scale_out
+                ],
+                adjustment_type=appscaling.AdjustmentType.CHANGE_IN_CAPACITY,
+                cooldown=settings.scale_out_cooldown
+            )
+
+    def _add_email_monitoring(self, props: BackendStackProps, lambda_function: lambda_.IFunction,
+                              dead_letter_queue: sqs.IQueue):
+        settings = props.monitoring
+        dimensions = {'FunctionName': lambda_function.function_name}
+
+        def email_metric(name, statistic, label=None):
+            return cloudwatch.Metric(namespace=settings.namespace, metric_name=name, dimensions_map=dimensions,
+                                     statistic=statistic, period=Duration.minutes(1), label=label)
+
+        ses_errors = email_metric("SesErrors", "Sum")
+        # SesErrors is also written with an ErrorCode dimension per SES error code
+        ses_errors_by_code = cloudwatch.MathExpression(
+            expression=f"SEARCH('{{{settings.namespace},FunctionName,ErrorCode}} MetricName=\"SesErrors\"', 'Sum', 60)",
+            using_metrics={},
+            label="SES errors by code",
+            period=Duration.minutes(1)
+        )
+        dead_letters = dead_letter_queue.metric_approximate_number_of_messages_visible(period=Duration.minutes(1))
+
+        dashboard = cloudwatch.Dashboard(self, "EmailDashboard",
+            dashboard_name=f"{props.resource_prefix}-{props.env}-email"
+        )
+        dashboard.add_widgets(
+            cloudwatch.GraphWidget(title="Batch latency (ms)", left=[
+                email_metric("BatchLatency", "p50", "batch p50"), email_metric("BatchLatency", "p99", "batch p99")
+            ]),
+            cloudwatch.GraphWidget(title="Record latency (ms)", left=[
+                email_metric("RecordLatency", "p50", "record p50"),
+                email_metric("RecordLatency", "p99", "record p99"),
+                email_metric("SesLatency", "p99", "SES call p99"),
+                email_metric("ParseLatency", "p99", "parse p99")
+            ]),
+            cloudwatch.GraphWidget(title="SES errors", left=[ses_errors, ses_errors_by_code])
+        )
+        dashboard.add_widgets(
+            cloudwatch.GraphWidget(title="Batch size", left=[
+                email_metric("BatchSize", "Average", "average"), email_metric("BatchSize", "Maximum", "maximum")
+            ]),
+            cloudwatch.GraphWidget(title="Cold starts", left=[email_metric("ColdStart", "Sum")]),
+            cloudwatch.GraphWidget(title="Failures", left=[
+                email_metric("Failures", "Sum"), email_metric("Rejected", "Sum"),
+                email_metric("Duplicates", "Sum"), dead_letters
+            ])
+        )
+
+        cloudwatch.Alarm(self, "SesErrorsAlarm",
+            metric=ses_errors,
+            threshold=settings.ses_error_threshold,
+            evaluation_periods=5,
+            comparison_operator=cloudwatch.ComparisonOperator.GREATER_THAN_OR_EQUAL_TO_THRESHOLD,
+            treat_missing_data=cloudwatch.TreatMissingData.NOT_BREACHING,
+            alarm_description="SES rejected or failed email sends"
+        )
+        cloudwatch.Alarm(self, "BatchLatencyAlarm",
+            metric=email_metric("BatchLatency", "p99"),
+            threshold=props.email_queue.lambda_timeout.to_milliseconds() * settings.batch_latency_alarm_ratio,
+            evaluation_periods=3,
+            treat_missing_data=cloudwatch.TreatMissingData.NOT_BREACHING,
+            alarm_description="p99 batch latency is close to the Lambda timeout"
+        )
+        cloudwatch.Alarm(self, "DeadLetterAlarm",
+            metric=dead_letters,
+            threshold=settings.dead_letter_threshold,
+            evaluation_periods=1,
+            comparison_operator=cloudwatch.ComparisonOperator.GREATER_THAN_OR_EQUAL_TO_THRESHOLD,
+            treat_missing_data=cloudwatch.TreatMissingData.NOT_BREACHING,
+            alarm_description="Email messages are piling up in the dead-letter queue"
+        )
@@ -0,0 +1,103 @@
+from aws_cdk import (
+    aws_ec2 as ec2,
+    aws_elasticache as elasticache
+)
+from constructs import Construct
+
+
+class CacheClusterSettings:
+    """Redis or Valkey replication group in front of the database."""
+
+    ENGINES = ('redis', 'valkey')
+    # Engine versions and the default parameter group family of each
+    ENGINE_VERSIONS = {
+        'redis': {"6.2": "redis6.x", "7.0": "redis7", "7.1": "redis7"},
+        'valkey': {"7.2": "valkey7", "8.0": "valkey8"},
+    }
+    DEFAULT_ENGINE_VERSIONS = {'redis': "7.1", 'valkey': "7.2"}
+
+    def __init__(self, enabled: bool = False,
+                  engine: str = 'redis',
+                  engine_version: str = None,
+                  node_type: str = "cache.t4g.small",
+                  shards: int = 1,
+                  replicas_per_shard: int = 1,
+                  port: int = 6379):
+        self.enabled = enabled
+        self.engine = engine
+        self.engine_version = engine_version or self.DEFAULT_ENGINE_VERSIONS.get(engine)
+        self.node_type = node_type
+        # More than one shard turns on cluster mode
+        self.shards = shards
+        self.replicas_per_shard = replicas_per_shard
+        self.port = port
+
+    @property
+    def cluster_mode(self) -> bool:
+        return self.shards > 1
+
+    @property
+    def parameter_group_name(self) -> str:
+        family = self.ENGINE_VERSIONS[self.engine][self.engine_version]
+        return f"default.{family}" + (".cluster.on" if self.cluster_mode else "")
+
+    def validate(self):
+        if self.engine not in self.ENGINES:
+            raise ValueError(f"engine must be one of {self.ENGINES}, got {self.engine!r}")
+        if self.engine_version not in self.ENGINE_VERSIONS[self.engine]:
+            raise ValueError(f"engine_version for {self.engine} must be one of "
+                             f"{tuple(self.ENGINE_VERSIONS[self.engine])}, got {self.engine_version!r}")
+        if not 1 <= self.shards <= 500:
+            raise ValueError(f"shards must be between 1 and 500, got {self.shards}")
+        if not 0 <= self.replicas_per_shard <= 5:
+            raise ValueError(f"replicas_per_shard must be between 0 and 5, got {self.replicas_per_shard}")
+
+class CacheCluster(Construct):
+    """ElastiCache replication group reachable only from ``allowed_security_group``."""
+
+    def __init__(self, scope: Construct, construct_id: str, vpc: ec2.IVpc, subnets: list,
+                 allowed_security_group: ec2.ISecurityGroup, settings: CacheClusterSettings):
+        super().__init__(scope, construct_id)
+        settings.validate()
+
+        subnet_group = elasticache.CfnSubnetGroup(self, "SubnetGroup",
+            description="Cache subnets",
+            subnet_ids=[subnet.subnet_id for subnet in subnets]
+        )
+
+        self.security_group = ec2.SecurityGroup(self, "SecurityGroup",
+            vpc=vpc,
+            description="Cache security group",
+            allow_all_outbound=False
+        )
+        self.security_group.add_ingress_rule(
+            allowed_security_group,
+            ec2.Port.tcp(settings.port),
+            'Allow cache inbound from ECS SG'
+        )
+
+        replication_group = elasticache.CfnReplicationGroup(self, "ReplicationGroup",
+            replication_group_description="Backend cache",
+            engine=settings.engine,
+            engine_version=settings.engine_version,
+            cache_node_type=settings.node_type,
+            cache_parameter_group_name=settings.parameter_group_name,
+            cluster_mode="enabled" if settings.cluster_mode else "disabled",
+            num_node_groups=settings.shards,
+            replicas_per_node_group=settings.replicas_per_shard,
+            automatic_failover_enabled=settings.cluster_mode or settings.replicas_per_shard > 0,
+            multi_az_enabled=settings.replicas_per_shard > 0,
+            port=settings.port,
+            cache_subnet_group_name=subnet_group.ref,
+            security_group_ids=[self.security_group.security_group_id],
+            at_rest_encryption_enabled=True,
+            transit_encryption_enabled=True
+        )
+        self.replication_group = replication_group
+
+        # Cluster mode clients discover the shards from the configuration endpoint
+        if settings.cluster_mode:
+            self.endpoint_address = replication_group.attr_configuration_end_point_address
+        else:
+            self.endpoint_address = replication_group.attr_primary_end_point_address
+        self.port = settings.port
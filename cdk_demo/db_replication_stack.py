@@ -1,5 +1,6 @@
 from aws_cdk import (
     Stack,
+    CfnOutput,
     aws_rds as rds,
     aws_kms as kms,
     aws_ec2 as ec2
@@ -8,18 +9,34 @@ from constructs import Construct
 
 class DatabaseReplicationStackProps:
     def __init__(self, vpc: ec2.IVpc, private_subnets: list, security_group_id: str, global_db_name: str, db_engine_version: str,
-                 db_cluster_identifier: str):
+                 db_cluster_identifier: str,
+                 min_capacity: float = 0.5,
+                 max_capacity: float = 2,
+                 reader_count: int = 1):
         self.vpc = vpc
         self.private_subnets = private_subnets
+        # None creates a DB security group that admits PostgreSQL from the VPC
         self.security_group_id = security_group_id
         self.global_db_name = global_db_name
         self.db_engine_version = db_engine_version
         self.db_cluster_identifier = db_cluster_identifier
+        self.min_capacity = min_capacity
+        self.max_capacity = max_capacity
+        # Every instance of a secondary cluster is a reader
+        self.reader_count = reader_count
+
+    def validate(self):
+        if not 0.5 <= self.min_capacity <= self.max_capacity <= 128:
+            raise ValueError(f"Capacity must satisfy 0.5 <= min_capacity <= max_capacity <= 128, got {self.min_capacity}..{self.max_capacity}")
+        if not 1 <= self.reader_count <= 15:
+            raise ValueError(f"reader_count must be between 1 and 15, got {self.reader_count}")
 
 class DatabaseReplicationStack(Stack):
+    """Secondary region cluster of the Aurora Global Database started by BackendStack."""
 
     def __init__(self, scope: Construct, id: str, props: DatabaseReplicationStackProps, **kwargs):
         super().__init__(scope, id, **kwargs)
+        props.validate()
 
         # Create a new KMS key
         dbreplica_key = kms.Key(
@@ -32,10 +49,24 @@ class DatabaseReplicationStack(Stack):
         db_subnet_group = rds.CfnDBSubnetGroup(
             self, "DBSubnetGroup",
             db_subnet_group_description="Subnet group for Aurora database",
-            subnet_ids=props.private_subnets
+            subnet_ids=[subnet.subnet_id for subnet in props.private_subnets]
         )
 
-        # Define the DBCluster
+        security_group_id = props.security_group_id
+        if security_group_id is None:
+            dbsg_sg = ec2.SecurityGroup(
+                self, 'DBSG',
+                vpc=props.vpc,
+                description='Replica DB Security Group'
+            )
+            dbsg_sg.add_ingress_rule(
+                ec2.Peer.ipv4(props.vpc.vpc_cidr_block),
+                ec2.Port.tcp(5432),
+                'Allow PostgreSQL inbound from within VPC'
+            )
+            security_group_id = dbsg_sg.security_group_id
+
+        # Define the DBCluster, a read-only member of the global cluster
         itfolder_db_cluster = rds.CfnDBCluster(
             self, "itfolderDBCluster",
             engine="aurora-postgresql",
@@ -49,22 +80,36 @@ class DatabaseReplicationStack(Stack):
             enable_cloudwatch_logs_exports=["postgresql"],
             port=5432,
             kms_key_id=dbreplica_key.key_arn,  # Use the ARN of the newly created KMS key
-            vpc_security_group_ids=[props.security_group_id],
+            vpc_security_group_ids=[security_group_id],
             serverless_v2_scaling_configuration=rds.CfnDBCluster.ServerlessV2ScalingConfigurationProperty(
-                max_capacity=100,
-                min_capacity=1),
+                max_capacity=props.max_capacity,
+                min_capacity=props.min_capacity),
         )
 
-        # Define the DBInstance
-        aurora_db_instance = rds.CfnDBInstance(
-            self, "AuroraDBInstance",
-            engine="aurora-postgresql",
-            db_instance_class="db.serverless",
-            db_cluster_identifier=itfolder_db_cluster.ref
-        )
+        # Define the DBInstances
+        aurora_db_instances = []
+        for index in range(props.reader_count):
+            aurora_db_instance = rds.CfnDBInstance(
+                self, "AuroraDBInstance" if index == 0 else f"AuroraDBInstance{index + 1}",
+                engine="aurora-postgresql",
+                db_instance_class="db.serverless",
+                db_cluster_identifier=itfolder_db_cluster.ref
+            )
+            aurora_db_instance.add_dependency(db_subnet_group)
+            aurora_db_instances.append(aurora_db_instance)
 
 
         # Set up dependencies
         itfolder_db_cluster.add_dependency(db_subnet_group)
-        aurora_db_instance.add_dependency(db_subnet_group)
 
+        # Services in this region read from the local reader endpoint
+        CfnOutput(self, "DatabaseReaderEndpoint", value=itfolder_db_cluster.attr_read_endpoint_address)
+
+        self.output_props = {}
+        self.output_props['db_cluster'] = itfolder_db_cluster
+        self.output_props['db_instances'] = aurora_db_instances
+        self.output_props['db_reader_endpoint'] = itfolder_db_cluster.attr_read_endpoint_address
+
+    @property
+    def outputs(self):
+        return self.output_props
@@ -3,92 +3,112 @@ from aws_cdk import (
     Duration,
     CfnOutput,
     aws_elasticloadbalancingv2 as elbv2,
-    aws_ec2 as ec2
+    aws_ec2 as ec2,
+    aws_ecs as ecs
 )
 from constructs import Construct
 
+class TargetGroupConfig:
+    """Health check and traffic settings of one ALB target group."""
+
+    def __init__(self, health_check_path: str = "/",
+                  health_check_interval: Duration = Duration.seconds(15),
+                  health_check_timeout: Duration = Duration.seconds(5),
+                  healthy_threshold_count: int = 2,
+                  unhealthy_threshold_count: int = 3,
+                  healthy_http_codes: str = None,
+                  deregistration_delay: Duration = Duration.seconds(30),
+                  slow_start: Duration = None,
+                  load_balancing_algorithm: elbv2.TargetGroupLoadBalancingAlgorithmType =
+                      elbv2.TargetGroupLoadBalancingAlgorithmType.LEAST_OUTSTANDING_REQUESTS,
+                  stickiness_duration: Duration = None,
+                  protocol_version: elbv2.ApplicationProtocolVersion = elbv2.ApplicationProtocolVersion.HTTP1,
+                  port: int = 80):
+        self.health_check_path = health_check_path
+        # A dead target stops receiving traffic after about
+        # interval * unhealthy_threshold_count
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self.healthy_threshold_count = healthy_threshold_count
+        self.unhealthy_threshold_count = unhealthy_threshold_count
+        self.healthy_http_codes = healthy_http_codes
+        self.deregistration_delay = deregistration_delay
+        self.slow_start = slow_start
+        self.load_balancing_algorithm = load_balancing_algorithm
+        # None turns load balancer cookie stickiness off
+        self.stickiness_duration = stickiness_duration
+        # HTTP2 or GRPC to the targets, the ALB listeners always accept HTTP/2
+        self.protocol_version = protocol_version
+        self.port = port
+
+    def validate(self):
+        interval = self.health_check_interval.to_seconds()
+        if not 5 <= interval <= 300:
+            raise ValueError(f"health_check_interval must be between 5 and 300 seconds, got {interval}")
+        if not 2 <= self.health_check_timeout.to_seconds() < interval:
+            raise ValueError("health_check_timeout must be at least 2 seconds and shorter than health_check_interval")
+        for name in ('healthy_threshold_count', 'unhealthy_threshold_count'):
+            if not 2 <= getattr(self, name) <= 10:
+                raise ValueError(f"{name} must be between 2 and 10, got {getattr(self, name)}")
+        if not 0 <= self.deregistration_delay.to_seconds() <= 3600:
+            raise ValueError("deregistration_delay must be at most 3600 seconds")
+        if self.slow_start:
+            if not 30 <= self.slow_start.to_seconds() <= 900:
+                raise ValueError("slow_start must be between 30 and 900 seconds")
+            if self.load_balancing_algorithm == elbv2.TargetGroupLoadBalancingAlgorithmType.LEAST_OUTSTANDING_REQUESTS:
+                raise ValueError("slow_start cannot be combined with the least outstanding requests algorithm")
+        if self.stickiness_duration and not 1 <= self.stickiness_duration.to_seconds() <= 604800:
+            raise ValueError("stickiness_duration must be between 1 second and 7 days")
+
+# The groups the listeners route to; ElbStackProps.target_groups overrides them by name
+DEFAULT_TARGET_GROUPS = {
+    'staging_front': TargetGroupConfig(healthy_http_codes="200-499"),
+    'staging_api': TargetGroupConfig(),
+    'prod_front': TargetGroupConfig(healthy_http_codes="200-499"),
+    'prod_api': TargetGroupConfig()
+}
+
 class ElbStackProps:
-    def __init__(self, vpc: ec2.IVpc, public_subnets: list, alb_security_group: ec2.ISecurityGroup, https_certificate=None):
+    def __init__(self, vpc: ec2.IVpc, public_subnets: list, alb_security_group: ec2.ISecurityGroup, https_certificate=None,
+                  target_groups: dict = None,
+                  idle_timeout: Duration = Duration.seconds(30),
+                  http2_enabled: bool = True,
+                  network_mode: ecs.NetworkMode = ecs.NetworkMode.BRIDGE):
         self.vpc = vpc
         self.public_subnets = public_subnets
         self.alb_security_group = alb_security_group
         self.https_certificate = https_certificate
+        self.target_groups = {**DEFAULT_TARGET_GROUPS, **(target_groups or {})}
+        self.idle_timeout = idle_timeout
+        self.http2_enabled = http2_enabled
+        # awsvpc tasks register by IP, bridge mode tasks by instance and host port
+        self.target_type = elbv2.TargetType.IP if network_mode == ecs.NetworkMode.AWS_VPC else elbv2.TargetType.INSTANCE
 
 class ElbStack(Stack):
 
     def __init__(self, scope: Construct, construct_id: str, props: ElbStackProps, **kwargs):
         super().__init__(scope, construct_id, **kwargs)
 
+        for config in props.target_groups.values():
+            config.validate()
+
         # Application Load Balancer
         ecs_alb = elbv2.ApplicationLoadBalancer(
             self, "ECSALB",
             vpc=props.vpc,
             internet_facing=True,
             vpc_subnets=ec2.SubnetSelection(subnets=props.public_subnets),
-            security_group=props.alb_security_group
+            security_group=props.alb_security_group,
+            idle_timeout=props.idle_timeout,
+            http2_enabled=props.http2_enabled
         )
 
-        ecs_alb.set_attribute("idle_timeout.timeout_seconds", "30")
-
         # Target Groups
-        staging_front_tg = elbv2.ApplicationTargetGroup(
-            self, "stagingFrontTG",
-            vpc=props.vpc,
-            port=80,
-            health_check=elbv2.HealthCheck(
-                interval=Duration.seconds(30),
-                path="/",
-                timeout=Duration.seconds(20),
-                healthy_threshold_count=2,
-                unhealthy_threshold_count=10,
-                healthy_http_codes="200-499"
-            ),
-            target_type=elbv2.TargetType.INSTANCE
-        )
-
-        staging_api_tg = elbv2.ApplicationTargetGroup(
-            self, "stagingApiTG",
-            
-            vpc=props.vpc,
-            port=80,
-            health_check=elbv2.HealthCheck(
-                interval=Duration.seconds(70),
-                path="/",
-                timeout=Duration.seconds(50),
-                healthy_threshold_count=2,
-                unhealthy_threshold_count=10
-            ),
-            target_type=elbv2.TargetType.INSTANCE
-        )
-
-        prod_front_tg = elbv2.ApplicationTargetGroup(
-            self, "prodFrontTG",
-            vpc=props.vpc,
-            port=80,
-            health_check=elbv2.HealthCheck(
-                interval=Duration.seconds(30),
-                path="/",
-                timeout=Duration.seconds(20),
-                healthy_threshold_count=2,
-                unhealthy_threshold_count=10,
-                healthy_http_codes="200-499"
-            ),
-            target_type=elbv2.TargetType.INSTANCE
-        )
-
-        prod_api_tg = elbv2.ApplicationTargetGroup(
-            self, "prodApiTG",
-            vpc=props.vpc,
-            port=80,
-            health_check=elbv2.HealthCheck(
-                interval=Duration.seconds(70),
-                path="/",
-                timeout=Duration.seconds(50),
-                healthy_threshold_count=2,
-                unhealthy_threshold_count=10
-            ),
-            target_type=elbv2.TargetType.INSTANCE
-        )
+        target_groups = {name: self._target_group(name, config, props.vpc, props.target_type)
+                         for name, config in props.target_groups.items()}
+        staging_front_tg = target_groups['staging_front']
+        staging_api_tg = target_groups['staging_api']
+        prod_front_tg = target_groups['prod_front']
 
         # Listeners
         http_listener = ecs_alb.add_listener("HTTPListener",
@@ -120,15 +140,41 @@ class ElbStack(Stack):
 
         # Outputs
         CfnOutput(self, "StackNameOutput", value=self.stack_name)
-        CfnOutput(self, "stagingFrontTGOutput", value=staging_front_tg.target_group_full_name)
-        CfnOutput(self, "stagingApiTGOutput", value=staging_api_tg.target_group_full_name)
-        CfnOutput(self, "prodFrontTGOutput", value=prod_front_tg.target_group_full_name)
-        CfnOutput(self, "prodApiTGOutput", value=prod_api_tg.target_group_full_name)
+        for name, target_group in target_groups.items():
+            CfnOutput(self, f"{self._logical_name(name)}TGOutput", value=target_group.target_group_full_name)
 
         self.output_props = {}
         self.output_props['http_listener'] = http_listener
-        self.output_props['staging_front_tg'] = staging_front_tg
-        self.output_props['staging_api_tg'] = staging_api_tg
+        for name, target_group in target_groups.items():
+            self.output_props[f"{name}_tg"] = target_group
+
+    @staticmethod
+    def _logical_name(name: str) -> str:
+        # staging_front -> stagingFront, matching the original construct ids
+        first, *rest = name.split("_")
+        return first + "".join(part.capitalize() for part in rest)
+
+    def _target_group(self, name: str, config: TargetGroupConfig, vpc: ec2.IVpc,
+                      target_type: elbv2.TargetType) -> elbv2.ApplicationTargetGroup:
+        return elbv2.ApplicationTargetGroup(
+            self, f"{self._logical_name(name)}TG",
+            vpc=vpc,
+            port=config.port,
+            protocol_version=config.protocol_version,
+            health_check=elbv2.HealthCheck(
+                interval=config.health_check_interval,
+                path=config.health_check_path,
+                timeout=config.health_check_timeout,
+                healthy_threshold_count=config.healthy_threshold_count,
+                unhealthy_threshold_count=config.unhealthy_threshold_count,
+                healthy_http_codes=config.healthy_http_codes
+            ),
+            deregistration_delay=config.deregistration_delay,
+            slow_start=config.slow_start,
+            load_balancing_algorithm_type=config.load_balancing_algorithm,
+            stickiness_cookie_duration=config.stickiness_duration,
+            target_type=target_type
+        )
 
     @property
     def outputs(self):
@@ -0,0 +1,1043 @@
+import hashlib
+import html
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Clients are cached per execution environment (one per service) so warm
+# invocations skip endpoint resolution, credential lookup and connection
+# pool setup. boto3 is imported lazily so the module itself stays cheap.
+_clients = {}
+_clients_lock = threading.Lock()
+
+DEFAULT_MAX_POOL_CONNECTIONS = 10
+DEFAULT_SEND_CONCURRENCY = 8
+DEFAULT_TEMPLATE_CACHE_SIZE = 64
+DEFAULT_TEMPLATE_CACHE_TTL = 300
+DEFAULT_BULK_MIN_GROUP_SIZE = 2
+# SendBulkTemplatedEmail accepts at most 50 destinations per call
+BULK_MAX_DESTINATIONS = 50
+DEFAULT_IDEMPOTENCY_TTL = 24 * 60 * 60
+# How long a claim blocks redeliveries when its invocation dies mid-send
+DEFAULT_IDEMPOTENCY_IN_PROGRESS_TTL = 900
+DEFAULT_IDEMPOTENCY_CACHE_SIZE = 1024
+# SendMessageBatch accepts at most 10 entries per call
+SQS_MAX_BATCH_ENTRIES = 10
+DEFAULT_METRICS_NAMESPACE = "CdkDemo/Email"
+# EMF accepts at most 100 values per metric in one document
+EMF_MAX_VALUES = 100
+
+# Only the first invocation of an execution environment is a cold start
+_cold_start = True
+
+# Thread pools and rate limiters live as long as the execution environment,
+# keyed by their size/rate so a configuration change gets a fresh one.
+_send_pools = {}
+_rate_limiters = {}
+_send_lock = threading.Lock()
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+def _region_for(service_name):
+    # A per-service override such as SES_REGION wins, otherwise fall back to
+    # the region the function runs in (AWS_REGION is set by Lambda).
+    return (os.environ.get(f"{service_name.upper()}_REGION")
+            or os.environ.get('AWS_REGION')
+            or os.environ.get('AWS_DEFAULT_REGION'))
+
+
+def _create_client(service_name):
+    import boto3
+    from botocore.config import Config
+
+    # Every send thread needs its own HTTP connection to avoid queueing
+    default_pool_size = max(DEFAULT_MAX_POOL_CONNECTIONS, _send_concurrency())
+    config = Config(
+        max_pool_connections=int(os.environ.get('BOTO_MAX_POOL_CONNECTIONS', default_pool_size)),
+        tcp_keepalive=True
+    )
+    return boto3.client(service_name, region_name=_region_for(service_name), config=config)
+
+
+def get_client(service_name):
+    """Return the shared client for ``service_name``, creating it on first use."""
+    client = _clients.get(service_name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(service_name)
+            if client is None:
+                client = _create_client(service_name)
+                _clients[service_name] = client
+    return client
+
+
+def set_client(service_name, client):
+    """Register ``client`` for ``service_name``; used to inject stubs in tests."""
+    with _clients_lock:
+        _clients[service_name] = client
+
+
+def reset_clients():
+    """Drop every cached client, as a fresh execution environment would."""
+    with _clients_lock:
+        _clients.clear()
+
+
+class TokenBucket:
+    """Thread-safe token bucket that limits callers to ``rate`` acquisitions per second.
+
+    The bucket starts full, so a burst of up to ``capacity`` acquisitions goes
+    through immediately before callers are paced at ``rate``.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+
+
+def _send_concurrency():
+    return max(1, int(os.environ.get('SEND_CONCURRENCY', DEFAULT_SEND_CONCURRENCY)))
+
+
+def _get_send_pool(size):
+    with _send_lock:
+        pool = _send_pools.get(size)
+        if pool is None:
+            pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix="ses-send")
+            _send_pools[size] = pool
+        return pool
+
+
+def _get_rate_limiter():
+    # SES_MAX_SEND_RATE is the account's sends-per-second quota divided by the
+    # number of concurrent execution environments; unset means no limit.
+    rate = float(os.environ.get('SES_MAX_SEND_RATE', 0))
+    if rate <= 0:
+        return None
+    with _send_lock:
+        limiter = _rate_limiters.get(rate)
+        if limiter is None:
+            limiter = TokenBucket(rate)
+            _rate_limiters[rate] = limiter
+        return limiter
+
+
+class Metrics:
+    """Buffers the metrics of one invocation and writes them as a single
+    CloudWatch Embedded Metric Format (EMF) log line.
+
+    Latencies are kept as value arrays so CloudWatch can compute percentiles
+    from them; counters are summed. Counters with extra dimensions, such as
+    SES errors by code, need a dimension value of their own and go out as one
+    more line per set of dimension values.
+    """
+
+    def __init__(self, namespace, dimensions, clock=time.time):
+        self.namespace = namespace
+        self.dimensions = dimensions
+        self.properties = {}
+        self._clock = clock
+        self._values = OrderedDict()
+        self._units = {}
+        self._dimensioned = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, name, value, unit='Milliseconds'):
+        with self._lock:
+            self._values.setdefault(name, []).append(value)
+            self._units[name] = unit
+
+    def count(self, name, value=1, dimensions=None):
+        with self._lock:
+            if dimensions:
+                counts = self._dimensioned.setdefault(tuple(sorted(dimensions.items())), OrderedDict())
+                counts[name] = counts.get(name, 0) + value
+                return
+            self._values[name] = [self._values.get(name, [0])[0] + value]
+            self._units[name] = 'Count'
+
+    def set_property(self, name, value):
+        self.properties[name] = value
+
+    def to_emf(self):
+        with self._lock:
+            document = {
+                '_aws': {
+                    'Timestamp': int(self._clock() * 1000),
+                    'CloudWatchMetrics': [{
+                        'Namespace': self.namespace,
+                        'Dimensions': [sorted(self.dimensions)],
+                        'Metrics': [{'Name': name, 'Unit': self._units[name]} for name in self._values]
+                    }]
+                }
+            }
+            document.update(self.properties)
+            document.update(self.dimensions)
+            for name, values in self._values.items():
+                if len(values) > EMF_MAX_VALUES:
+                    # Sample evenly so the percentiles stay representative
+                    step = len(values) / EMF_MAX_VALUES
+                    values = [values[int(i * step)] for i in range(EMF_MAX_VALUES)]
+                document[name] = values[0] if len(values) == 1 else values
+            return document
+
+    def dimensioned_emf(self):
+        """Return one EMF document per set of extra dimension values."""
+        with self._lock:
+            timestamp = int(self._clock() * 1000)
+            documents = []
+            for extra, counts in self._dimensioned.items():
+                dimensions = dict(self.dimensions, **dict(extra))
+                document = {
+                    '_aws': {
+                        'Timestamp': timestamp,
+                        'CloudWatchMetrics': [{
+                            'Namespace': self.namespace,
+                            'Dimensions': [sorted(dimensions)],
+                            'Metrics': [{'Name': name, 'Unit': 'Count'} for name in counts]
+                        }]
+                    }
+                }
+                document.update(self.properties)
+                document.update(dimensions)
+                document.update(counts)
+                documents.append(document)
+            return documents
+
+    def flush(self):
+        for document in [self.to_emf()] + self.dimensioned_emf():
+            print(json.dumps(document, separators=(",", ":")))
+
+
+def _error_code(error):
+    # botocore ClientErrors carry the service error code, anything else is
+    # reported by exception type
+    code = getattr(error, 'response', {}).get('Error', {}).get('Code')
+    return code or type(error).__name__
+
+
+def get_queue_url_from_arn(arn):
+    parts = arn.split(":")
+    region = parts[3]
+    account_id = parts[4]
+    queue_name = parts[5]
+    return f"https://sqs.{region}.amazonaws.com/{account_id}/{queue_name}"
+
+
+class ValidationError(ValueError):
+    """A record whose body can never be sent, however often it is retried."""
+
+
+_JSON_TYPES = {
+    'object': (dict,),
+    'array': (list,),
+    'string': (str,),
+    'number': (int, float),
+    'boolean': (bool,)
+}
+
+
+def compile_schema(schema, path="$"):
+    """Compile a JSON-Schema subset into a validator function.
+
+    Supports ``type``, ``required``, ``properties``, ``items``, ``minItems``
+    and ``anyOf``. The schema is walked once here, so validating a message
+    only runs the resulting checks.
+    """
+    checks = []
+    if 'type' in schema:
+        names = schema['type'] if isinstance(schema['type'], list) else [schema['type']]
+        types = tuple(python_type for name in names for python_type in _JSON_TYPES[name])
+
+        def check_type(value):
+            if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+                raise ValidationError(f"{path} must be of type {' or '.join(names)}")
+        checks.append(check_type)
+    for key in schema.get('required', ()):
+        def check_required(value, key=key):
+            if isinstance(value, dict) and key not in value:
+                raise ValidationError(f"{path}.{key} is required")
+        checks.append(check_required)
+    for key, subschema in schema.get('properties', {}).items():
+        validate_property = compile_schema(subschema, f"{path}.{key}")
+
+        def check_property(value, key=key, validate_property=validate_property):
+            if isinstance(value, dict) and key in value:
+                validate_property(value[key])
+        checks.append(check_property)
+    if 'items' in schema:
+        validate_item = compile_schema(schema['items'], f"{path}[]")
+
+        def check_items(value):
+            if isinstance(value, list):
+                for item in value:
+                    validate_item(item)
+        checks.append(check_items)
+    if 'minItems' in schema:
+        def check_min_items(value, min_items=schema['minItems']):
+            if isinstance(value, list) and len(value) < min_items:
+                raise ValidationError(f"{path} must have at least {min_items} items")
+        checks.append(check_min_items)
+    if 'anyOf' in schema:
+        alternatives = [compile_schema(subschema, path) for subschema in schema['anyOf']]
+
+        def check_any_of(value):
+            errors = []
+            for alternative in alternatives:
+                try:
+                    alternative(value)
+                    return
+                except ValidationError as error:
+                    errors.append(str(error))
+            raise ValidationError("; ".join(errors))
+        checks.append(check_any_of)
+
+    def validate(value):
+        for check in checks:
+            check(value)
+    return validate
+
+
+# Template names double as file and S3 key names
+TEMPLATE_NAME = re.compile(r"[\w-]+")
+
+
+_ADDRESSES = {'type': 'array', 'items': {'type': 'string'}}
+_CONTENT = {'type': 'object', 'required': ['Data'], 'properties': {'Data': {'type': 'string'}}}
+
+MESSAGE_SCHEMA = {
+    'type': 'object',
+    'required': ['Source', 'Destination'],
+    'properties': {
+        'Source': {'type': 'string'},
+        'Destination': {
+            'type': 'object',
+            'properties': {'ToAddresses': _ADDRESSES, 'CcAddresses': _ADDRESSES, 'BccAddresses': _ADDRESSES},
+            'anyOf': [{'required': ['ToAddresses']}, {'required': ['CcAddresses']}, {'required': ['BccAddresses']}]
+        },
+        'Template': {'type': 'string'},
+        'TemplateData': {'type': ['object', 'string']},
+        'Message': {
+            'type': 'object',
+            'required': ['Subject', 'Body'],
+            'properties': {
+                'Subject': _CONTENT,
+                'Body': {'type': 'object', 'required': ['Html'], 'properties': {'Html': _CONTENT}}
+            }
+        }
+    },
+    # Either a template reference or a pre-rendered message
+    'anyOf': [{'required': ['Template']}, {'required': ['Message']}]
+}
+
+validate_message = compile_schema(MESSAGE_SCHEMA)
+
+
+def parse_record(record):
+    """Parse and validate a record body once, raising ValidationError if it is unusable."""
+    body = record.get('body') or ""
+    # Reject anything that cannot be a JSON object before running the parser
+    if not body.lstrip().startswith("{"):
+        raise ValidationError("body is not a JSON object")
+    try:
+        message = json.loads(body)
+    except ValueError as error:
+        raise ValidationError(f"body is not valid JSON: {error}") from None
+    validate_message(message)
+    # Neither can ever render, retrying them only delays the dead-letter queue
+    if 'Template' in message and not TEMPLATE_NAME.fullmatch(message['Template']):
+        raise ValidationError(f"$.Template {message['Template']!r} is not a valid template name")
+    if isinstance(message.get('TemplateData'), str):
+        try:
+            data = json.loads(message['TemplateData'])
+        except ValueError as error:
+            raise ValidationError(f"$.TemplateData is not valid JSON: {error}") from None
+        if not isinstance(data, dict):
+            raise ValidationError("$.TemplateData must be a JSON object")
+        message['TemplateData'] = data
+    return message
+
+
+def dead_letter(sqs, queue_url, rejected):
+    """Move ``(record, reason)`` pairs to the dead-letter queue.
+
+    Returns the messageIds that were moved; the others stay in the batch.
+    """
+    moved = []
+    for start in range(0, len(rejected), SQS_MAX_BATCH_ENTRIES):
+        chunk = rejected[start:start + SQS_MAX_BATCH_ENTRIES]
+        try:
+            response = sqs.send_message_batch(
+                QueueUrl=queue_url,
+                Entries=[{
+                    'Id': str(index),
+                    'MessageBody': record.get('body') or "",
+                    'MessageAttributes': {
+                        'ValidationError': {'DataType': 'String', 'StringValue': reason[:1024]},
+                        'SourceMessageId': {'DataType': 'String', 'StringValue': record['messageId']}
+                    }
+                } for index, (record, reason) in enumerate(chunk)]
+            )
+        except Exception:
+            logger.exception("Failed to move %d messages to the dead-letter queue", len(chunk))
+            continue
+        moved.extend(chunk[int(entry['Id'])][0]['messageId'] for entry in response.get('Successful', []))
+    return moved
+
+
+# Templates use the SES/Handlebars placeholder syntax, e.g. {{ user.name }}
+_PLACEHOLDER = re.compile(r"{{\s*([\w.]+)\s*}}")
+
+
+class CompiledTemplate:
+    """A template split once into literal text and placeholder lookups."""
+
+    def __init__(self, source, escape=False):
+        self._parts = []
+        position = 0
+        for match in _PLACEHOLDER.finditer(source):
+            self._parts.append((False, source[position:match.start()]))
+            self._parts.append((True, tuple(match.group(1).split("."))))
+            position = match.end()
+        self._parts.append((False, source[position:]))
+        self._escape = escape
+
+    def _lookup(self, variables, path):
+        value = variables
+        for key in path:
+            if not isinstance(value, dict) or key not in value:
+                # Missing variables render empty, as they do in SES templates
+                return ""
+            value = value[key]
+        value = "" if value is None else str(value)
+        return html.escape(value) if self._escape else value
+
+    def render(self, variables):
+        return "".join(self._lookup(variables, part) if is_placeholder else part
+                       for is_placeholder, part in self._parts)
+
+
+class EmailTemplate:
+    """Compiled subject, HTML and optional text parts of one template.
+
+    Template documents use the same shape as the SES CreateTemplate API
+    (``TemplateName``, ``SubjectPart``, ``HtmlPart``, ``TextPart``) so the
+    same file can be published to SES.
+    """
+
+    def __init__(self, document):
+        self.name = document['TemplateName']
+        self.subject = CompiledTemplate(document['SubjectPart'])
+        self.html = CompiledTemplate(document['HtmlPart'], escape=True)
+        self.text = CompiledTemplate(document['TextPart']) if document.get('TextPart') else None
+
+    def render(self, variables):
+        return {
+            'subject': self.subject.render(variables),
+            'html': self.html.render(variables),
+            'text': self.text.render(variables) if self.text else None
+        }
+
+
+class LRUCache:
+    """Thread-safe LRU cache whose entries also expire ``ttl`` seconds after insertion."""
+
+    def __init__(self, max_size, ttl, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if self._clock() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, self._clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TemplateStore:
+    """Loads template documents from the deployment package, then from S3.
+
+    Templates bundled under TEMPLATE_DIR win; anything else is fetched from
+    ``s3://TEMPLATE_BUCKET/TEMPLATE_PREFIX<name>.json`` when a bucket is set.
+    """
+
+    def __init__(self, template_dir=None, bucket=None, prefix=""):
+        self.template_dir = template_dir
+        self.bucket = bucket
+        self.prefix = prefix
+
+    @classmethod
+    def from_environment(cls):
+        return cls(
+            template_dir=os.environ.get('TEMPLATE_DIR', os.path.join(os.path.dirname(__file__), 'templates')),
+            bucket=os.environ.get('TEMPLATE_BUCKET'),
+            prefix=os.environ.get('TEMPLATE_PREFIX', "")
+        )
+
+    def load(self, name):
+        if not TEMPLATE_NAME.fullmatch(name):
+            raise ValueError(f"Invalid template name {name!r}")
+        if self.template_dir:
+            local_path = os.path.join(self.template_dir, f"{name}.json")
+            if os.path.exists(local_path):
+                with open(local_path, encoding='utf-8') as template_file:
+                    return json.load(template_file)
+        if self.bucket:
+            response = get_client('s3').get_object(Bucket=self.bucket, Key=f"{self.prefix}{name}.json")
+            return json.loads(response['Body'].read())
+        raise KeyError(f"Template {name!r} not found")
+
+
+_template_store = None
+_template_cache = None
+# One lock per template name, so a slow load only holds back misses on the same template
+_template_load_locks = {}
+_template_load_locks_lock = threading.Lock()
+
+
+def _get_template_cache():
+    global _template_cache
+    if _template_cache is None:
+        _template_cache = LRUCache(
+            max_size=int(os.environ.get('TEMPLATE_CACHE_SIZE', DEFAULT_TEMPLATE_CACHE_SIZE)),
+            ttl=float(os.environ.get('TEMPLATE_CACHE_TTL', DEFAULT_TEMPLATE_CACHE_TTL))
+        )
+    return _template_cache
+
+
+def _get_template_store():
+    global _template_store
+    if _template_store is None:
+        _template_store = TemplateStore.from_environment()
+    return _template_store
+
+
+def get_template(name):
+    """Return the compiled template ``name``, loading it on a cache miss."""
+    cache = _get_template_cache()
+    template = cache.get(name)
+    if template is None:
+        # Concurrent sends missing on the same template load it only once
+        with _template_load_locks_lock:
+            load_lock = _template_load_locks.setdefault(name, threading.Lock())
+        with load_lock:
+            template = cache.get(name)
+            if template is None:
+                template = EmailTemplate(_get_template_store().load(name))
+                cache.put(name, template)
+    return template
+
+
+def reset_templates():
+    """Forget the template store and every cached template."""
+    global _template_store, _template_cache
+    _template_store = None
+    _template_cache = None
+    with _template_load_locks_lock:
+        _template_load_locks.clear()
+
+
+def template_data(message):
+    # TemplateData may be an object or, as in the SES API, a JSON string
+    data = message.get('TemplateData') or {}
+    return json.loads(data) if isinstance(data, str) else data
+
+
+def render_message(message):
+    """Build the SES ``Message`` for either a template or a pre-rendered message."""
+    if 'Template' in message:
+        rendered = get_template(message['Template']).render(template_data(message))
+        subject, html_body, text_body = rendered['subject'], rendered['html'], rendered['text']
+    else:
+        # Pre-rendered messages carry the final subject and HTML body
+        subject = message['Message']['Subject']['Data']
+        html_body = message['Message']['Body']['Html']['Data']
+        text_body = None
+
+    body = {
+        'Html': {
+            'Data': html_body,
+            'Charset': 'UTF-8'
+        }
+    }
+    if text_body:
+        body['Text'] = {'Data': text_body, 'Charset': 'UTF-8'}
+    return {
+        'Subject': {
+            'Data': subject,
+            'Charset': 'UTF-8'
+        },
+        'Body': body
+    }
+
+
+# Outcomes of claiming an idempotency key
+CLAIMED = 'CLAIMED'
+# Already sent, the record can be dropped
+COMPLETED = 'COMPLETED'
+# Being sent by another invocation that may still fail, the record is retried later
+IN_PROGRESS = 'IN_PROGRESS'
+
+
+class InMemoryIdempotencyStore:
+    """Process-local idempotency store, for local runs and tests.
+
+    Keys are claimed while their email is sent, then either completed (and
+    remembered for ``ttl`` seconds) or released so a redelivery can retry.
+    """
+
+    def __init__(self, ttl=DEFAULT_IDEMPOTENCY_TTL, in_progress_ttl=DEFAULT_IDEMPOTENCY_IN_PROGRESS_TTL,
+                 clock=time.time):
+        self.ttl = ttl
+        self.in_progress_ttl = in_progress_ttl
+        self._clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def claim(self, key):
+        """Return CLAIMED, or the COMPLETED or IN_PROGRESS status of the unexpired existing claim."""
+        with self._lock:
+            now = self._clock()
+            status, expires_at = self._entries.get(key, (None, 0))
+            if expires_at > now:
+                return status
+            self._entries[key] = (IN_PROGRESS, now + self.in_progress_ttl)
+            return CLAIMED
+
+    def complete(self, key):
+        with self._lock:
+            self._entries[key] = (COMPLETED, self._clock() + self.ttl)
+
+    def release(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class DynamoDBIdempotencyStore:
+    """Idempotency store on a DynamoDB table keyed by ``id``.
+
+    Claims are conditional writes, so concurrent invocations holding the same
+    message cannot both win. ``expires_at`` doubles as the table's TTL
+    attribute; since TTL deletion is lazy, expired items are also treated as
+    absent by the condition. An in-progress claim expires after
+    ``in_progress_ttl`` so a crashed invocation does not block redelivery.
+    """
+
+    def __init__(self, table_name, ttl=DEFAULT_IDEMPOTENCY_TTL, in_progress_ttl=DEFAULT_IDEMPOTENCY_IN_PROGRESS_TTL,
+                 client=None, clock=time.time):
+        self.table_name = table_name
+        self.ttl = ttl
+        self.in_progress_ttl = in_progress_ttl
+        self._client = client
+        self._clock = clock
+
+    @property
+    def client(self):
+        return self._client or get_client('dynamodb')
+
+    def _put(self, key, status, ttl, **kwargs):
+        self.client.put_item(
+            TableName=self.table_name,
+            Item={
+                'id': {'S': key},
+                'status': {'S': status},
+                'expires_at': {'N': str(int(self._clock() + ttl))}
+            },
+            **kwargs
+        )
+
+    def claim(self, key):
+        """Return CLAIMED, or the COMPLETED or IN_PROGRESS status of the unexpired existing claim."""
+        try:
+            self._put(key, IN_PROGRESS, self.in_progress_ttl,
+                      ConditionExpression="attribute_not_exists(id) OR expires_at < :now",
+                      ExpressionAttributeValues={':now': {'N': str(int(self._clock()))}},
+                      ReturnValuesOnConditionCheckFailure='ALL_OLD')
+            return CLAIMED
+        except Exception as error:
+            response = getattr(error, 'response', {})
+            if response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                # Without the old item, assume the claim may still fail and retry later
+                status = response.get('Item', {}).get('status', {}).get('S')
+                return COMPLETED if status == COMPLETED else IN_PROGRESS
+            raise
+
+    def complete(self, key):
+        self._put(key, COMPLETED, self.ttl)
+
+    def release(self, key):
+        self.client.delete_item(TableName=self.table_name, Key={'id': {'S': key}})
+
+
+class CachedIdempotencyStore:
+    """Puts an in-process LRU of already completed keys in front of ``store``.
+
+    Hot duplicates are answered from memory; everything else still goes
+    through the backing store so concurrent invocations stay consistent.
+    """
+
+    def __init__(self, store, cache):
+        self.store = store
+        self.cache = cache
+
+    def claim(self, key):
+        if self.cache.get(key):
+            return COMPLETED
+        return self.store.claim(key)
+
+    def complete(self, key):
+        self.store.complete(key)
+        self.cache.put(key, True)
+
+    def release(self, key):
+        self.cache.delete(key)
+        self.store.release(key)
+
+
+_NOT_LOADED = object()
+_idempotency_store = _NOT_LOADED
+
+
+def get_idempotency_store():
+    """Return the store configured by IDEMPOTENCY_TABLE, or None when deduplication is off."""
+    global _idempotency_store
+    if _idempotency_store is _NOT_LOADED:
+        table_name = os.environ.get('IDEMPOTENCY_TABLE')
+        if table_name:
+            ttl = int(os.environ.get('IDEMPOTENCY_TTL', DEFAULT_IDEMPOTENCY_TTL))
+            cache = LRUCache(
+                max_size=int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', DEFAULT_IDEMPOTENCY_CACHE_SIZE)),
+                ttl=ttl
+            )
+            # A claim must outlive the invocation that holds it
+            in_progress_ttl = int(os.environ.get('IDEMPOTENCY_IN_PROGRESS_TTL', DEFAULT_IDEMPOTENCY_IN_PROGRESS_TTL))
+            _idempotency_store = CachedIdempotencyStore(
+                DynamoDBIdempotencyStore(table_name, ttl=ttl, in_progress_ttl=in_progress_ttl), cache)
+        else:
+            _idempotency_store = None
+    return _idempotency_store
+
+
+def set_idempotency_store(store):
+    """Use ``store`` for deduplication; ``None`` turns it off."""
+    global _idempotency_store
+    _idempotency_store = store
+
+
+def reset_idempotency_store():
+    """Rebuild the store from the environment on next use."""
+    global _idempotency_store
+    _idempotency_store = _NOT_LOADED
+
+
+def idempotency_key(record, message):
+    # SQS redeliveries keep their messageId; hashing the content also catches
+    # a producer publishing the same email twice
+    if os.environ.get('IDEMPOTENCY_KEY_SOURCE', 'message_id') == 'content':
+        canonical = json.dumps(message, sort_keys=True, separators=(",", ":"))
+        return "sha256:" + hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+    return record['messageId']
+
+
+def bulk_destination(message):
+    """Return the SES bulk destination of ``message``, raising ValueError if its TemplateData is unusable."""
+    return {
+        'Destination': message['Destination'],
+        'ReplacementTemplateData': json.dumps(template_data(message))
+    }
+
+
+def send_bulk_email(ses, source, template, destinations):
+    """Send ``destinations`` sharing ``source`` and ``template`` in one bulk call.
+
+    The template must also be published to SES under the same name, otherwise
+    SES rejects the call with ``TemplateDoesNotExist``. Returns one status per
+    destination, in order: ``Success`` or the SES error code.
+    """
+    response = ses.send_bulk_templated_email(
+        Source=source,
+        Template=template,
+        DefaultTemplateData="{}",
+        Destinations=destinations
+    )
+    # Statuses come back in the order of the destinations
+    return [status['Status'] for status in response['Status']]
+
+
+def _bulk_settings():
+    enabled = os.environ.get('BULK_SEND_ENABLED', "false").lower() == "true"
+    min_group_size = max(2, int(os.environ.get('BULK_SEND_MIN_GROUP_SIZE', DEFAULT_BULK_MIN_GROUP_SIZE)))
+    return enabled, min_group_size
+
+
+def group_messages(parsed, bulk_enabled=False, min_group_size=DEFAULT_BULK_MIN_GROUP_SIZE):
+    """Split ``(record, message)`` pairs into bulk groups and single sends.
+
+    Templated messages sharing a source and template form a group; groups of
+    at least ``min_group_size`` are chunked to the bulk destination limit and
+    everything else is sent one by one.
+    """
+    groups = OrderedDict()
+    singles = []
+    for record, message in parsed:
+        if bulk_enabled and 'Template' in message:
+            groups.setdefault((message['Source'], message['Template']), []).append((record, message))
+        else:
+            singles.append((record, message))
+
+    bulk_groups = []
+    for members in groups.values():
+        if len(members) < min_group_size:
+            singles.extend(members)
+            continue
+        for start in range(0, len(members), BULK_MAX_DESTINATIONS):
+            bulk_groups.append(members[start:start + BULK_MAX_DESTINATIONS])
+    return bulk_groups, singles
+
+
+def _record_ses_error(metrics, code):
+    metrics.count('SesErrors')
+    metrics.count('SesErrors', dimensions={'ErrorCode': code})
+
+
+def _send_single(ses, record, message, rate_limiter, metrics):
+    start = time.perf_counter()
+    try:
+        rendered = render_message(message)
+    except Exception:
+        logger.exception("Failed to render email for message %s", record['messageId'])
+        metrics.count('RenderErrors')
+        return [(record['messageId'], False)]
+    try:
+        if rate_limiter:
+            rate_limiter.acquire()
+        ses_start = time.perf_counter()
+        ses.send_email(Source=message['Source'], Destination=message['Destination'], Message=rendered)
+        succeeded = True
+    except Exception as error:
+        logger.exception("Failed to send email for message %s", record['messageId'])
+        _record_ses_error(metrics, _error_code(error))
+        succeeded = False
+    end = time.perf_counter()
+    metrics.put('SesLatency', (end - ses_start) * 1000)
+    metrics.put('RecordLatency', (end - start) * 1000)
+    return [(record['messageId'], succeeded)]
+
+
+def _send_group(ses, members, rate_limiter, metrics):
+    # A message whose template data cannot be built fails alone, the rest
+    # of the group is still sent
+    results = []
+    sendable = []
+    destinations = []
+    for record, message in members:
+        try:
+            destinations.append(bulk_destination(message))
+            sendable.append((record, message))
+        except ValueError:
+            logger.exception("Failed to build template data for message %s", record['messageId'])
+            metrics.count('RenderErrors')
+            results.append((record['messageId'], False))
+    if not sendable:
+        return results
+    records = [record for record, _ in sendable]
+
+    source, template = members[0][1]['Source'], members[0][1]['Template']
+    start = time.perf_counter()
+    try:
+        if rate_limiter:
+            for _ in records:
+                rate_limiter.acquire()
+        ses_start = time.perf_counter()
+        codes = send_bulk_email(ses, source, template, destinations)
+        metrics.put('SesLatency', (time.perf_counter() - ses_start) * 1000)
+    except Exception as error:
+        if _error_code(error) == 'TemplateDoesNotExist':
+            # Not published to SES, render the group here and send it one by
+            # one; the rate limiter already granted a send per record
+            logger.warning("Template %s is not published to SES, sending %d emails singly", template, len(records))
+            for record, message in sendable:
+                results.extend(_send_single(ses, record, message, None, metrics))
+            return results
+        logger.exception("Failed to bulk send %d emails", len(records))
+        codes = [_error_code(error)] * len(records)
+    elapsed = (time.perf_counter() - start) * 1000
+    for record, code in zip(records, codes):
+        metrics.put('RecordLatency', elapsed)
+        if code != 'Success':
+            logger.error("Bulk send failed for message %s: %s", record['messageId'], code)
+            _record_ses_error(metrics, code)
+        results.append((record['messageId'], code == 'Success'))
+    return results
+
+
+def _run_all(tasks):
+    # Tasks run concurrently on the bounded send pool, results keep task order
+    if min(_send_concurrency(), len(tasks)) > 1:
+        return list(_get_send_pool(_send_concurrency()).map(lambda task: task(), tasks))
+    return [task() for task in tasks]
+
+
+def _claim(store, record, message):
+    key = idempotency_key(record, message)
+    try:
+        return key, store.claim(key)
+    except Exception:
+        logger.exception("Failed to claim idempotency key for message %s", record['messageId'])
+        return key, None
+
+
+def _settle(store, key, succeeded):
+    try:
+        if succeeded:
+            store.complete(key)
+        else:
+            store.release(key)
+    except Exception:
+        logger.exception("Failed to record idempotency key %s", key)
+
+
+def lambda_handler(event, context):
+    global _cold_start
+    start = time.perf_counter()
+    function_name = getattr(context, 'function_name', None) or os.environ.get('AWS_LAMBDA_FUNCTION_NAME', "local")
+    metrics = Metrics(os.environ.get('METRICS_NAMESPACE', DEFAULT_METRICS_NAMESPACE), {'FunctionName': function_name})
+    metrics.count('ColdStart', 1 if _cold_start else 0)
+    if context is not None:
+        metrics.set_property('RequestId', getattr(context, 'aws_request_id', None))
+    _cold_start = False
+    try:
+        return _handle_batch(event['Records'], metrics)
+    finally:
+        metrics.put('BatchLatency', (time.perf_counter() - start) * 1000)
+        metrics.flush()
+
+
+def _handle_batch(records, metrics):
+    # Reuse the SES client of this execution environment
+    ses = get_client('ses')
+    rate_limiter = _get_rate_limiter()
+    store = get_idempotency_store()
+    outcomes = {}
+    metrics.count('BatchSize', len(records))
+
+    # Parse and validate every body once. Invalid records would fail on
+    # every retry, so they go straight to the dead-letter queue.
+    parse_start = time.perf_counter()
+    parsed = []
+    rejected = []
+    for record in records:
+        try:
+            parsed.append((record, parse_record(record)))
+        except ValidationError as error:
+            logger.warning("Rejecting message %s: %s", record['messageId'], error)
+            rejected.append((record, str(error)))
+            outcomes[record['messageId']] = False
+    metrics.put('ParseLatency', (time.perf_counter() - parse_start) * 1000)
+    metrics.count('Rejected', len(rejected))
+    dead_letter_queue_arn = os.environ.get('DEAD_LETTER_QUEUE_ARN')
+    if rejected and dead_letter_queue_arn:
+        for message_id in dead_letter(get_client('sqs'), get_queue_url_from_arn(dead_letter_queue_arn), rejected):
+            outcomes[message_id] = True
+
+    # Claim every message before sending it; completed duplicates count as
+    # delivered, while in-progress claims and store errors fail the record so
+    # it is retried later.
+    claimed_keys = {}
+    if store:
+        claims = _run_all([lambda pair=pair: _claim(store, *pair) for pair in parsed])
+        fresh = []
+        for (record, message), (key, status) in zip(parsed, claims):
+            if status == CLAIMED:
+                claimed_keys[record['messageId']] = key
+                fresh.append((record, message))
+            elif status == COMPLETED:
+                logger.info("Skipping duplicate message %s", record['messageId'])
+                metrics.count('Duplicates')
+                outcomes[record['messageId']] = True
+            else:
+                # Another invocation holds the claim and may still fail, so
+                # the record comes back after its visibility timeout
+                if status == IN_PROGRESS:
+                    logger.info("Message %s is being sent elsewhere, retrying later", record['messageId'])
+                    metrics.count('InProgress')
+                outcomes[record['messageId']] = False
+        parsed = fresh
+
+    bulk_groups, singles = group_messages(parsed, *_bulk_settings())
+    sends = ([lambda members=members: _send_group(ses, members, rate_limiter, metrics) for members in bulk_groups]
+             + [lambda pair=pair: _send_single(ses, *pair, rate_limiter, metrics) for pair in singles])
+
+    # Sends run concurrently on a bounded pool; every send reports the
+    # outcome of each record it carried.
+    for result in _run_all(sends):
+        outcomes.update(result)
+
+    if claimed_keys:
+        _run_all([lambda message_id=message_id, key=key: _settle(store, key, outcomes.get(message_id))
+                  for message_id, key in claimed_keys.items()])
+
+    # Successful records are deleted by the event source mapping, only the
+    # failed ones are reported back so they alone get redelivered.
+    batch_item_failures = [{'itemIdentifier': record['messageId']}
+                           for record in records if not outcomes.get(record['messageId'])]
+    metrics.count('Failures', len(batch_item_failures))
+    return {'batchItemFailures': batch_item_failures}
+
+
+# Provisioned concurrency runs the init phase ahead of traffic, so create the
+# SES client there instead of on the first request
+if os.environ.get('AWS_LAMBDA_INITIALIZATION_TYPE') == 'provisioned-concurrency':
+    get_client('ses')
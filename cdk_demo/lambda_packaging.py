@@ -0,0 +1,96 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import jsii
+from aws_cdk import (
+    BundlingOptions,
+    ILocalBundling,
+    aws_lambda as lambda_
+)
+
+# Never shipped with a function, whatever the source folder contains
+EXCLUDE_PATTERNS = ["**/__pycache__", "**/*.pyc", "**/.pytest_cache"]
+
+_PIP_PLATFORMS = {
+    'x86_64': "manylinux2014_x86_64",
+    'arm64': "manylinux2014_aarch64"
+}
+
+
+def read_requirements(path: str) -> list:
+    """Return the requirement lines of ``path``, without comments or blanks."""
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as requirements_file:
+        lines = (line.split("#", 1)[0].strip() for line in requirements_file)
+        return [line for line in lines if line]
+
+
+@jsii.implements(ILocalBundling)
+class LocalPythonBundling:
+    """Builds the package on the synth host, so no Docker is needed.
+
+    Only the handler module, the listed data folders and the pinned
+    requirements (built for the function's architecture) are copied.
+    """
+
+    def __init__(self, source_dir: str, handler_module: str, data_dirs: list, requirements_file: str,
+                 architecture: lambda_.Architecture, python_version: str):
+        self.source_dir = source_dir
+        self.handler_module = handler_module
+        self.data_dirs = data_dirs
+        self.requirements_file = requirements_file
+        self.architecture = architecture
+        self.python_version = python_version
+
+    def try_bundle(self, output_dir, *, image, **kwargs) -> bool:
+        shutil.copy2(os.path.join(self.source_dir, f"{self.handler_module}.py"), output_dir)
+        for data_dir in self.data_dirs:
+            shutil.copytree(os.path.join(self.source_dir, data_dir), os.path.join(output_dir, data_dir),
+                            ignore=shutil.ignore_patterns("__pycache__", "*.pyc"), dirs_exist_ok=True)
+
+        requirements = read_requirements(os.path.join(self.source_dir, self.requirements_file))
+        if requirements:
+            subprocess.run([
+                sys.executable, "-m", "pip", "install", "--quiet", "--no-compile",
+                "--target", output_dir,
+                "--platform", _PIP_PLATFORMS[self.architecture.name],
+                "--implementation", "cp",
+                "--python-version", self.python_version,
+                "--only-binary=:all:",
+                *requirements
+            ], check=True)
+        return True
+
+
+def python_function_code(source_dir: str, handler_module: str,
+                         data_dirs: list = None,
+                         requirements_file: str = "requirements.txt",
+                         architecture: lambda_.Architecture = lambda_.Architecture.X86_64,
+                         runtime: lambda_.Runtime = lambda_.Runtime.PYTHON_3_11) -> lambda_.Code:
+    """Return a minimal asset with just ``handler_module`` and what it needs at runtime.
+
+    The package is built locally; the Docker command is only the fallback
+    CDK uses when local bundling is unavailable.
+    """
+    data_dirs = data_dirs or []
+    python_version = runtime.name.replace("python", "")
+    requirements = read_requirements(os.path.join(source_dir, requirements_file))
+
+    copy_commands = [f"cp {handler_module}.py /asset-output/"]
+    copy_commands += [f"cp -r {data_dir} /asset-output/" for data_dir in data_dirs]
+    if requirements:
+        copy_commands.append(f"pip install --no-compile -r {requirements_file} -t /asset-output")
+
+    return lambda_.Code.from_asset(source_dir,
+        exclude=EXCLUDE_PATTERNS,
+        bundling=BundlingOptions(
+            image=runtime.bundling_image,
+            command=["bash", "-c", " && ".join(copy_commands)],
+            platform=architecture.docker_platform,
+            local=LocalPythonBundling(source_dir, handler_module, data_dirs, requirements_file,
+                                      architecture, python_version)
+        )
+    )
@@ -1,38 +1,98 @@
 from aws_cdk import (
     Stack,
     CfnOutput,
+    Fn,
     aws_ec2 as ec2
 )
 from constructs import Construct
 
+# AWS APIs the backend calls from private subnets. SES is left out: the
+# only SES interface endpoint is SMTP, and the email Lambda uses the API.
+DEFAULT_INTERFACE_ENDPOINTS = [
+    ec2.InterfaceVpcEndpointAwsService.SQS,
+    ec2.InterfaceVpcEndpointAwsService.ECR,
+    ec2.InterfaceVpcEndpointAwsService.ECR_DOCKER,
+    ec2.InterfaceVpcEndpointAwsService.CLOUDWATCH_LOGS,
+    ec2.InterfaceVpcEndpointAwsService.SECRETS_MANAGER
+]
+
+def subnet_tiers(public_mask: int = 20, private_mask: int = 20, isolated_db_mask: int = None) -> list:
+    """Return the public and private-egress tiers, plus an isolated-db tier when it has a mask."""
+    tiers = [
+        ec2.SubnetConfiguration(
+            cidr_mask=public_mask,
+            name='public',
+            subnet_type=ec2.SubnetType.PUBLIC
+        ),
+        ec2.SubnetConfiguration(
+            cidr_mask=private_mask,
+            name='private',
+            subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS
+        )]
+    if isolated_db_mask:
+        tiers.append(ec2.SubnetConfiguration(
+            cidr_mask=isolated_db_mask,
+            name='isolated-db',
+            subnet_type=ec2.SubnetType.PRIVATE_ISOLATED
+        ))
+    return tiers
+
 class NetworkStack(Stack):
 
-    def __init__(self, scope: Construct, construct_id: str,vpc_name: str, vpc_cidr: str, availability_zones:list, **kwargs) -> None:
+    def __init__(self, scope: Construct, construct_id: str,vpc_name: str, vpc_cidr: str, availability_zones:list,
+                 interface_endpoints: list = None, nat_gateways: int = None, subnet_configuration: list = None,
+                 ipv6: bool = False, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
-        # The code that defines your stack goes here
+        # One NAT gateway per AZ by default, so no private subnet sends its
+        # traffic through another AZ
+        nat_gateways = len(availability_zones) if nat_gateways is None else nat_gateways
+        if not 1 <= nat_gateways <= len(availability_zones):
+            raise ValueError(f"nat_gateways must be between 1 and the number of AZs ({len(availability_zones)}), got {nat_gateways}")
+        subnet_configuration = subnet_configuration or subnet_tiers()
 
         vpc = ec2.Vpc(self, "vpc",
             ip_addresses=ec2.IpAddresses.cidr(vpc_cidr),
             availability_zones=availability_zones,
-            nat_gateways=2,
+            nat_gateways=nat_gateways,
             vpc_name=vpc_name,
-            subnet_configuration= [
-                ec2.SubnetConfiguration(
-                    cidr_mask=20,
-                    name='public',
-                    subnet_type=ec2.SubnetType.PUBLIC
-                ),
-                ec2.SubnetConfiguration(
-                    cidr_mask=20,
-                    name='private',
-                    subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS
-                )]
+            subnet_configuration=subnet_configuration
+            )
+
+        if ipv6:
+            self._add_ipv6(vpc)
+
+        # S3 and DynamoDB traffic stays off the NAT gateways through free gateway endpoints
+        gateway_endpoints = {
+            's3': vpc.add_gateway_endpoint("S3Endpoint", service=ec2.GatewayVpcEndpointAwsService.S3),
+            'dynamodb': vpc.add_gateway_endpoint("DynamoDBEndpoint", service=ec2.GatewayVpcEndpointAwsService.DYNAMODB)
+        }
+
+        # Interface endpoints in the private subnets, reachable over HTTPS from the VPC
+        endpoint_security_group = ec2.SecurityGroup(self, "EndpointSG",
+            vpc=vpc,
+            description='VPC interface endpoint security group',
+            allow_all_outbound=False
+        )
+        endpoint_security_group.add_ingress_rule(
+            ec2.Peer.ipv4(vpc.vpc_cidr_block),
+            ec2.Port.tcp(443),
+            'Allow HTTPS inbound from within VPC'
+        )
+        interface_endpoints = DEFAULT_INTERFACE_ENDPOINTS if interface_endpoints is None else interface_endpoints
+        endpoints = {}
+        for service in interface_endpoints:
+            endpoints[service.short_name] = vpc.add_interface_endpoint(f"{service.short_name}Endpoint",
+                service=service,
+                subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS),
+                security_groups=[endpoint_security_group],
+                private_dns_enabled=True
             )
 
         # This will export the VPC's ID in CloudFormation under the key
         # 'vpcid'
         CfnOutput(self, "vpcid", value=vpc.vpc_id)
+        CfnOutput(self, "endpointsgid", value=endpoint_security_group.security_group_id)
 
         # Prepares output attributes to be passed into other stacks
         # In this case, it is our VPC and subnets.
@@ -40,6 +100,42 @@ class NetworkStack(Stack):
         self.output_props['vpc'] = vpc
         self.output_props['public_subnets'] = vpc.public_subnets
         self.output_props['private_subnets'] = vpc.private_subnets
+        self.output_props['isolated_subnets'] = vpc.isolated_subnets
+        self.output_props['gateway_endpoints'] = gateway_endpoints
+        self.output_props['interface_endpoints'] = endpoints
+        self.output_props['endpoint_security_group'] = endpoint_security_group
+
+    def _add_ipv6(self, vpc: ec2.Vpc):
+        # CDK's Vpc has no dual-stack option in this version, so an Amazon
+        # provided /56 is attached and split into one /64 per subnet
+        ipv6_block = ec2.CfnVPCCidrBlock(self, "Ipv6CidrBlock",
+            vpc_id=vpc.vpc_id,
+            amazon_provided_ipv6_cidr_block=True
+        )
+        subnets = vpc.public_subnets + vpc.private_subnets + vpc.isolated_subnets
+        subnet_cidrs = Fn.cidr(Fn.select(0, vpc.vpc_ipv6_cidr_blocks), len(subnets), "64")
+        for index, subnet in enumerate(subnets):
+            cfn_subnet = subnet.node.find_child("Subnet")
+            cfn_subnet.ipv6_cidr_block = Fn.select(index, subnet_cidrs)
+            cfn_subnet.assign_ipv6_address_on_creation = True
+            cfn_subnet.add_dependency(ipv6_block)
+
+        # Public subnets reach the internet directly, private ones only
+        # outbound through an egress-only gateway; isolated ones not at all
+        for subnet in vpc.public_subnets:
+            ec2.CfnRoute(subnet, "Ipv6DefaultRoute",
+                route_table_id=subnet.route_table.route_table_id,
+                destination_ipv6_cidr_block="::/0",
+                gateway_id=vpc.internet_gateway_id
+            )
+        if vpc.private_subnets:
+            egress_only_gateway = ec2.CfnEgressOnlyInternetGateway(self, "EgressOnlyInternetGateway", vpc_id=vpc.vpc_id)
+            for subnet in vpc.private_subnets:
+                ec2.CfnRoute(subnet, "Ipv6DefaultRoute",
+                    route_table_id=subnet.route_table.route_table_id,
+                    destination_ipv6_cidr_block="::/0",
+                    egress_only_internet_gateway_id=egress_only_gateway.ref
+                )
 
     @property
     def outputs(self):
@@ -1,6 +1,7 @@
 from aws_cdk import (
     aws_ec2 as ec2,
     aws_iam as iam,
+    aws_ecs as ecs,
     Stack,
     CfnOutput,
     cloudformation_include as cfn_inc
@@ -10,7 +11,8 @@ from constructs import Construct
 
 class SecurityStack(Stack):
 
-    def __init__(self, scope: Construct, construct_id: str, vpc: ec2.Vpc, **kwargs) -> None:
+    def __init__(self, scope: Construct, construct_id: str, vpc: ec2.Vpc,
+                 network_mode: ecs.NetworkMode = ecs.NetworkMode.BRIDGE, container_port: int = 80, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
         # Create the ECS Task Role
@@ -29,7 +31,12 @@ class SecurityStack(Stack):
                             'secretsmanager:*',
                             'quicksight:GetDashboardEmbedUrl',
                             'quicksight:GetAuthCode',
-                            'iam:PassRole'
+                            'iam:PassRole',
+                            'ses:SendEmail',
+                            'ses:SendTemplatedEmail',
+                            'ses:SendBulkTemplatedEmail',
+                            'dynamodb:PutItem',
+                            'dynamodb:DeleteItem'
                         ],
                         effect=iam.Effect.ALLOW,
                         resources=['*']
@@ -96,7 +103,13 @@ class SecurityStack(Stack):
                             'sqs:*',
                             'sns:*',
                             'rds:*',
-                            'lambda:*'
+                            'lambda:*',
+                            's3:GetObject',
+                            'dynamodb:PutItem',
+                            'dynamodb:DeleteItem',
+                            'ses:SendEmail',
+                            'ses:SendTemplatedEmail',
+                            'ses:SendBulkTemplatedEmail'
                         ],
                         effect=iam.Effect.ALLOW,
                         resources=['*']
@@ -167,11 +180,13 @@ class SecurityStack(Stack):
             description='ECS Security Group',
             security_group_name='ECSSG'
         )
-        ecssg_sg.add_ingress_rule(
-            ec2.Peer.security_group_id(alb_sg.security_group_id),
-            ec2.Port.tcp_range(31000, 61000),
-            'Allow ECS inbound from ALB SG'
-        )
+        # Bridge mode tasks listen on dynamic host ports of the instances
+        if network_mode == ecs.NetworkMode.BRIDGE:
+            ecssg_sg.add_ingress_rule(
+                ec2.Peer.security_group_id(alb_sg.security_group_id),
+                ec2.Port.tcp_range(31000, 61000),
+                'Allow ECS inbound from ALB SG'
+            )
         ecssg_sg.add_ingress_rule(
             ec2.Peer.ipv4('10.0.0.0/16'),
             ec2.Port.tcp(22),
@@ -191,6 +206,31 @@ class SecurityStack(Stack):
             ec2.Port.tcp(5432),
             'Allow PostgreSQL inbound from ECS SG'
         )
+        # awsvpc tasks get their own ENI and security group, so the ALB
+        # reaches the container port directly and the instances stay closed
+        if network_mode == ecs.NetworkMode.AWS_VPC:
+            ecs_task_sg = ec2.SecurityGroup(
+                self, 'ECSTaskSG',
+                vpc=vpc,
+                description='ECS task security group',
+                security_group_name='ECSTaskSG'
+            )
+            ecs_task_sg.add_ingress_rule(
+                ec2.Peer.security_group_id(alb_sg.security_group_id),
+                ec2.Port.tcp(container_port),
+                'Allow ECS task inbound from ALB SG'
+            )
+            dbsg_sg.add_ingress_rule(
+                ec2.Peer.security_group_id(ecs_task_sg.security_group_id),
+                ec2.Port.tcp(5432),
+                'Allow PostgreSQL inbound from ECS task SG'
+            )
+        # RDS Proxy runs in DBSG and connects to the cluster on its behalf
+        dbsg_sg.add_ingress_rule(
+            dbsg_sg,
+            ec2.Port.tcp(5432),
+            'Allow PostgreSQL inbound from RDS Proxy in DBSG'
+        )
         # dbsg_sg.node.default_child.override_logical_id('DBSG')
 
 
@@ -203,6 +243,8 @@ class SecurityStack(Stack):
         CfnOutput(self, "ALBSGId", value=alb_sg.security_group_id, export_name=f"{self.stack_name}-ALBSG")
         CfnOutput(self, "ECSSGId", value=ecssg_sg.security_group_id, export_name=f"{self.stack_name}-ECSSG")
         CfnOutput(self, "DBSGId", value=dbsg_sg.security_group_id, export_name=f"{self.stack_name}-DBSG")
+        if network_mode == ecs.NetworkMode.AWS_VPC:
+            CfnOutput(self, "ECSTaskSGId", value=ecs_task_sg.security_group_id, export_name=f"{self.stack_name}-ECSTaskSG")
 
         # Prepares output attributes to be passed into other stacks
         # In this case, it is our VPC and subnets.
@@ -215,6 +257,8 @@ class SecurityStack(Stack):
         self.output_props['DBSG'] = dbsg_sg
         self.output_props['ALBSG'] = alb_sg
         self.output_props['ECSSG'] = ecssg_sg
+        if network_mode == ecs.NetworkMode.AWS_VPC:
+            self.output_props['ECSTaskSG'] = ecs_task_sg
 
     @property
     def outputs(self):
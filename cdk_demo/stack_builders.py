@@ -0,0 +1,93 @@
+"""Builders the stack registry calls for each entry of stacks.json.
+
+Stack modules are imported inside each builder, so selecting one stack
+never pays for importing the others.
+"""
+import aws_cdk as cdk
+
+
+def cdk_environment(environment: dict) -> cdk.Environment:
+    return cdk.Environment(account=environment.get('account'), region=environment.get('region'))
+
+
+def network_mode(settings: dict):
+    from aws_cdk import aws_ecs as ecs
+    # BRIDGE or AWS_VPC, shared by the security groups, target groups and task definitions
+    return ecs.NetworkMode.AWS_VPC if settings.get('network_mode') == 'awsvpc' else ecs.NetworkMode.BRIDGE
+
+
+def build_network(app, construct_id, environment, settings, stacks):
+    from cdk_demo.network_stack import NetworkStack
+    return NetworkStack(app, construct_id, f"{settings.get('resource_prefix', 'cdk-demo-')}vpc", "10.0.0.0/16",
+                        availability_zones=environment['availability_zones'],
+                        nat_gateways=settings.get('nat_gateways'), env=cdk_environment(environment))
+
+
+def build_security(app, construct_id, environment, settings, stacks):
+    from cdk_demo.security_stack import SecurityStack
+    return SecurityStack(app, construct_id, vpc=stacks['network'].outputs['vpc'], network_mode=network_mode(settings),
+                         env=cdk_environment(environment))
+
+
+def build_elb(app, construct_id, environment, settings, stacks):
+    from cdk_demo.elb_stack import ElbStack, ElbStackProps
+    elb_props = ElbStackProps(
+        vpc=stacks['network'].outputs['vpc'],
+        public_subnets=stacks['network'].outputs['public_subnets'],
+        alb_security_group=stacks['security'].outputs['ALBSG'],
+        network_mode=network_mode(settings)
+    )
+    return ElbStack(app, construct_id, elb_props, env=cdk_environment(environment))
+
+
+def build_backend(app, construct_id, environment, settings, stacks):
+    from aws_cdk import Duration
+    from cdk_demo.backend_stack import (BackendStack, BackendStackProps, DatabaseSettings, EcsCapacitySettings,
+                                        EmailQueueSettings)
+    email_queue = dict(settings.get('email_queue', {}))
+    if 'max_batching_window_seconds' in email_queue:
+        email_queue['max_batching_window'] = Duration.seconds(email_queue.pop('max_batching_window_seconds'))
+    backend_props = BackendStackProps(
+        vpc=stacks['network'].outputs['vpc'],
+        private_subnets=stacks['network'].outputs['private_subnets'],
+        resource_prefix=settings.get('resource_prefix', "cdk-demo-"),
+        environment=settings.get('environment', 'dev'),
+        db_name=settings.get('db_name', "test"),
+        db_engine_version=settings.get('db_engine_version', "15.3"),
+        security_output=stacks['security'].outputs,
+        elb_output=stacks['elb'].outputs,
+        ses_region=settings.get('ses_region', "us-west-2"),
+        network_mode=network_mode(settings),
+        # Aurora Global Database: primary here, secondary in db_replication
+        database=DatabaseSettings(global_cluster_identifier=settings.get('global_db_name'),
+                                  **settings.get('database', {})),
+        ecs_capacity=EcsCapacitySettings(**settings.get('ecs_capacity', {})),
+        email_queue=EmailQueueSettings(**email_queue)
+    )
+    return BackendStack(app, construct_id, backend_props, env=cdk_environment(environment))
+
+
+def build_secondary_network(app, construct_id, environment, settings, stacks):
+    from cdk_demo.network_stack import NetworkStack
+    # The secondary region only hosts the replica for now, one NAT gateway is enough
+    return NetworkStack(app, construct_id, f"{settings.get('resource_prefix', 'cdk-demo-')}vpc-west", "10.1.0.0/16",
+                        availability_zones=environment['availability_zones'], nat_gateways=1, interface_endpoints=[],
+                        env=cdk_environment(environment))
+
+
+def build_db_replication(app, construct_id, environment, settings, stacks):
+    from cdk_demo.db_replication_stack import DatabaseReplicationStack, DatabaseReplicationStackProps
+    db_replication_props = DatabaseReplicationStackProps(
+        vpc=stacks['network_west'].outputs['vpc'],
+        private_subnets=stacks['network_west'].outputs['private_subnets'],
+        security_group_id=None,
+        global_db_name=settings['global_db_name'],
+        db_engine_version=settings.get('db_engine_version', "15.3"),
+        db_cluster_identifier=settings['replica_cluster_identifier'],
+        **settings.get('replica_database', {})
+    )
+    db_replication_stack = DatabaseReplicationStack(app, construct_id, db_replication_props,
+                                                    env=cdk_environment(environment))
+    # The global cluster must exist before the secondary cluster joins it
+    db_replication_stack.add_dependency(stacks['backend'])
+    return db_replication_stack
@@ -0,0 +1,95 @@
+import importlib
+import json
+import sys
+import time
+
+import aws_cdk as cdk
+
+
+class StackRegistry:
+    """Builds the stacks listed in a config file, only importing what is requested.
+
+    Each entry names a ``module:function`` builder, the stack ``module`` it
+    imports, the environment it deploys to and the entries it depends on. The
+    stack module is imported here so its cost shows up in the timing report
+    separately from construction. Builders are called as
+    ``builder(app, construct_id, environment, settings, stacks)`` where
+    ``stacks`` holds the already built dependencies by name.
+    """
+
+    def __init__(self, app: cdk.App, config: dict):
+        self.app = app
+        self.environments = config.get('environments', {})
+        self.settings = config.get('settings', {})
+        self.definitions = config['stacks']
+        self.stacks = {}
+        # (kind, name, seconds) in the order the work happened
+        self.timings = []
+
+    @classmethod
+    def from_file(cls, app: cdk.App, path: str) -> "StackRegistry":
+        with open(path, encoding='utf-8') as config_file:
+            return cls(app, json.load(config_file))
+
+    @staticmethod
+    def parse_selection(selection) -> list:
+        """Turn the ``stacks`` context value, a list or a comma separated string, into names."""
+        if not selection:
+            return []
+        if isinstance(selection, str):
+            selection = selection.split(",")
+        return [name.strip() for name in selection if name.strip()]
+
+    def resolve(self, names: list = None) -> list:
+        """Return ``names`` and everything they depend on, dependencies first."""
+        names = names or list(self.definitions)
+        ordered, visiting = [], set()
+
+        def visit(name, path):
+            if name not in self.definitions:
+                raise ValueError(f"Unknown stack {name!r}, expected one of {sorted(self.definitions)}")
+            if name in ordered:
+                return
+            if name in visiting:
+                raise ValueError(f"Stack dependency cycle: {' -> '.join(path + [name])}")
+            visiting.add(name)
+            for dependency in self.definitions[name].get('depends_on', []):
+                visit(dependency, path + [name])
+            visiting.discard(name)
+            ordered.append(name)
+
+        for name in names:
+            visit(name, [])
+        return ordered
+
+    def build(self, names: list = None) -> dict:
+        for name in self.resolve(names):
+            if name in self.stacks:
+                continue
+            definition = self.definitions[name]
+            if definition.get('module'):
+                self._import(definition['module'])
+            module_name, function_name = definition['builder'].split(":")
+            builder = getattr(self._import(module_name), function_name)
+            environment = self.environments.get(definition.get('env'), {})
+            dependencies = {dependency: self.stacks[dependency] for dependency in definition.get('depends_on', [])}
+
+            start = time.perf_counter()
+            self.stacks[name] = builder(self.app, definition['id'], environment, self.settings, dependencies)
+            self.timings.append(('construct', name, time.perf_counter() - start))
+        return self.stacks
+
+    def _import(self, module_name: str):
+        # Only the first import of a module pays, later ones hit sys.modules
+        if module_name in sys.modules:
+            return sys.modules[module_name]
+        start = time.perf_counter()
+        module = importlib.import_module(module_name)
+        self.timings.append(('import', module_name, time.perf_counter() - start))
+        return module
+
+    def timing_report(self) -> str:
+        lines = [f"{kind:<10} {name:<40} {seconds * 1000:8.1f}ms" for kind, name, seconds in self.timings]
+        total = sum(seconds for _, _, seconds in self.timings)
+        lines.append(f"{'total':<10} {'':<40} {total * 1000:8.1f}ms")
+        return "\n".join(lines)
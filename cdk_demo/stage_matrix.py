@@ -0,0 +1,154 @@
+"""One CDK Stage per entry of stages.json, synthesized in parallel.
+
+Each stage builds the stacks of stacks.json through a StackRegistry scoped
+to the stage, with the stage's account, regions, naming and sizing laid
+over the shared settings. Stages share nothing, so each one can be
+synthesized by its own worker process into its own cloud assembly:
+
+    python -m cdk_demo.stage_matrix [--workers N] [--outdir DIR] [stage ...]
+"""
+import argparse
+import copy
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import aws_cdk as cdk
+from constructs import Construct
+
+from cdk_demo.stack_registry import StackRegistry
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+STAGES_CONFIG = os.path.join(ROOT_DIR, "stages.json")
+STACKS_CONFIG = os.path.join(ROOT_DIR, "stacks.json")
+
+
+class StageConfig:
+    """Account, regions, naming and sizing of one stage."""
+
+    ENVIRONMENTS = ('dev', 'staging', 'prod')
+
+    def __init__(self, name: str,
+                  environment: str,
+                  account: str,
+                  region: str,
+                  availability_zones: list,
+                  resource_prefix: str = "cdk-demo-",
+                  db_engine_version: str = "15.3",
+                  stacks: list = None,
+                  secondary: dict = None,
+                  settings: dict = None,
+                  sizing: dict = None):
+        self.name = name
+        self.environment = environment
+        self.account = account
+        self.region = region
+        self.availability_zones = availability_zones
+        self.resource_prefix = resource_prefix
+        self.db_engine_version = db_engine_version
+        # Stacks of stacks.json to build, their dependencies are added
+        self.stacks = stacks
+        # Region and AZs of the "secondary" environment, needed by the replica stacks
+        self.secondary = secondary
+        self.settings = settings or {}
+        # nat_gateways, ecs_capacity, database, replica_database and email_queue
+        self.sizing = sizing or {}
+
+    def validate(self):
+        if self.environment not in self.ENVIRONMENTS:
+            raise ValueError(f"environment must be one of {self.ENVIRONMENTS}, got {self.environment!r}")
+        if not self.availability_zones:
+            raise ValueError(f"Stage {self.name} needs at least one availability zone")
+        if not self.resource_prefix.endswith("-"):
+            raise ValueError(f"resource_prefix must end with '-', got {self.resource_prefix!r}")
+
+    def registry_config(self, stacks_config: dict) -> dict:
+        """Return ``stacks_config`` with this stage's environments and settings."""
+        config = copy.deepcopy(stacks_config)
+        config['environments'] = {
+            'primary': {'account': self.account, 'region': self.region,
+                        'availability_zones': self.availability_zones}
+        }
+        if self.secondary:
+            config['environments']['secondary'] = {'account': self.account, **self.secondary}
+        # Settings without a value in the stage (the global database) are dropped, not inherited
+        config['settings'] = {key: value for key, value in config.get('settings', {}).items()
+                              if key not in ('global_db_name', 'replica_cluster_identifier')}
+        config['settings'].update(self.settings)
+        config['settings'].update(self.sizing)
+        config['settings'].update(environment=self.environment, resource_prefix=self.resource_prefix,
+                                  db_engine_version=self.db_engine_version)
+        return config
+
+
+def load_stages(path: str = STAGES_CONFIG) -> list:
+    with open(path, encoding='utf-8') as config_file:
+        config = json.load(config_file)
+    defaults = config.get('defaults', {})
+    stages = [StageConfig(**{**defaults, **entry}) for entry in config['stages']]
+    names = [stage.name for stage in stages]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Stage names must be unique, got {names}")
+    for stage in stages:
+        stage.validate()
+    return stages
+
+
+def select_stages(stages: list, selection) -> list:
+    """Stages named in ``selection``, a list or comma separated string, "all" for every stage."""
+    names = StackRegistry.parse_selection(selection)
+    if not names or names == ["all"]:
+        return stages
+    by_name = {stage.name: stage for stage in stages}
+    unknown = [name for name in names if name not in by_name]
+    if unknown:
+        raise ValueError(f"Unknown stages {unknown}, expected some of {sorted(by_name)}")
+    return [by_name[name] for name in names]
+
+
+class DemoStage(cdk.Stage):
+
+    def __init__(self, scope: Construct, config: StageConfig, stacks_config: dict, **kwargs):
+        super().__init__(scope, config.name,
+                         env=cdk.Environment(account=config.account, region=config.region), **kwargs)
+        self.registry = StackRegistry(self, config.registry_config(stacks_config))
+        self.registry.build(config.stacks)
+
+
+def synth_stage(name: str, outdir: str, stages_path: str = STAGES_CONFIG, stacks_path: str = STACKS_CONFIG) -> float:
+    """Synthesize stage ``name`` into ``outdir``/``name`` and return the seconds it took."""
+    start = time.perf_counter()
+    with open(stacks_path, encoding='utf-8') as config_file:
+        stacks_config = json.load(config_file)
+    app = cdk.App(outdir=os.path.join(outdir, name))
+    DemoStage(app, select_stages(load_stages(stages_path), [name])[0], stacks_config)
+    app.synth()
+    return time.perf_counter() - start
+
+
+def synth_parallel(names: list, outdir: str, workers: int = None,
+                   stages_path: str = STAGES_CONFIG, stacks_path: str = STACKS_CONFIG) -> dict:
+    """Synthesize each stage in its own process and return the seconds each took."""
+    workers = workers or min(len(names), os.cpu_count() or 1)
+    # Fresh interpreters: a forked child would share the parent's jsii runtime
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = {name: executor.submit(synth_stage, name, outdir, stages_path, stacks_path) for name in names}
+        return {name: future.result() for name, future in futures.items()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Synthesize stages in parallel, one cloud assembly each")
+    parser.add_argument('stages', nargs='*', help="stage names, all stages when omitted")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--outdir', default="cdk.out.stages")
+    args = parser.parse_args()
+
+    selected = [stage.name for stage in select_stages(load_stages(), args.stages)]
+    start = time.perf_counter()
+    timings = synth_parallel(selected, args.outdir, args.workers)
+    for name, seconds in timings.items():
+        print(f"{name:<24} {seconds * 1000:8.1f}ms  {os.path.join(args.outdir, name)}", file=sys.stderr)
+    print(f"{'wall time':<24} {(time.perf_counter() - start) * 1000:8.1f}ms", file=sys.stderr)
@@ -0,0 +1,165 @@
+"""Offline checks on synthesized CloudFormation templates.
+
+``canonicalize`` strips what changes between synths without changing the
+deployed resources, so templates can be kept as snapshots and compared with
+``structural_diff``. ``ResourceBudgets`` flags performance regressions,
+such as slow health checks or a queue that redelivers messages still being
+processed, before anything is deployed:
+
+    python -m cdk_demo.template_checks [cdk.out]
+"""
+import glob
+import json
+import os
+import re
+import sys
+
+# Asset hashes change with every edit of a Lambda source folder
+_ASSET_HASH = re.compile(r"[0-9a-f]{64}")
+# Added by the CDK toolkit to every stack, not part of the application
+_TOOLKIT_PARAMETERS = ('BootstrapVersion',)
+_TOOLKIT_RULES = ('CheckBootstrapVersion',)
+_TOOLKIT_CONDITIONS = ('CDKMetadataAvailable',)
+
+# AWS defaults when a target group leaves the property out
+_DEFAULT_HEALTH_CHECK_INTERVAL = 30
+_DEFAULT_UNHEALTHY_THRESHOLD = 2
+_DEFAULT_LAMBDA_TIMEOUT = 3
+_DEFAULT_VISIBILITY_TIMEOUT = 30
+
+
+def canonicalize(template: dict) -> dict:
+    """Return ``template`` without asset hashes, CDK metadata or bootstrap checks."""
+    def clean(value):
+        if isinstance(value, dict):
+            return {key: clean(item) for key, item in sorted(value.items())}
+        if isinstance(value, list):
+            return [clean(item) for item in value]
+        if isinstance(value, str):
+            return _ASSET_HASH.sub("<asset-hash>", value)
+        return value
+
+    template = dict(template)
+    template['Resources'] = {name: resource for name, resource in template.get('Resources', {}).items()
+                             if resource.get('Type') != "AWS::CDK::Metadata"}
+    for section, names in (('Parameters', _TOOLKIT_PARAMETERS), ('Rules', _TOOLKIT_RULES),
+                           ('Conditions', _TOOLKIT_CONDITIONS)):
+        if section in template:
+            template[section] = {name: value for name, value in template[section].items() if name not in names}
+            if not template[section]:
+                del template[section]
+    return clean(template)
+
+
+def structural_diff(old: dict, new: dict, path: str = "") -> list:
+    """Return one line per added, removed or changed value between two templates."""
+    if isinstance(old, dict) and isinstance(new, dict):
+        changes = []
+        for key in sorted(set(old) | set(new)):
+            child = f"{path}.{key}" if path else key
+            if key not in new:
+                changes.append(f"- {child}")
+            elif key not in old:
+                changes.append(f"+ {child}")
+            else:
+                changes.extend(structural_diff(old[key], new[key], child))
+        return changes
+    if isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        changes = []
+        for index, (old_item, new_item) in enumerate(zip(old, new)):
+            changes.extend(structural_diff(old_item, new_item, f"{path}[{index}]"))
+        return changes
+    if old != new:
+        return [f"~ {path}: {json.dumps(old)} -> {json.dumps(new)}"]
+    return []
+
+
+class ResourceBudgets:
+    """Limits a template must stay within to keep scaling and failover fast."""
+
+    def __init__(self, min_asg_max_capacity: int = 2,
+                  max_health_check_detection_seconds: int = 60,
+                  min_visibility_timeout_ratio: float = 6):
+        # An ASG that cannot grow past this many instances cannot absorb a spike
+        self.min_asg_max_capacity = min_asg_max_capacity
+        # Time an ALB keeps routing to a dead target, interval x unhealthy threshold
+        self.max_health_check_detection_seconds = max_health_check_detection_seconds
+        # SQS visibility timeout over the timeout of the Lambda consuming the queue
+        self.min_visibility_timeout_ratio = min_visibility_timeout_ratio
+
+    def check(self, template: dict) -> list:
+        """Return a message for every resource outside the budgets, empty when all fit."""
+        resources = template.get('Resources', {})
+        return (self._check_asg_capacity(resources) +
+                self._check_health_checks(resources) +
+                self._check_visibility_timeouts(resources))
+
+    def _check_asg_capacity(self, resources: dict) -> list:
+        violations = []
+        for name, resource in _of_type(resources, "AWS::AutoScaling::AutoScalingGroup"):
+            max_size = resource['Properties'].get('MaxSize')
+            if _is_literal(max_size) and int(max_size) < self.min_asg_max_capacity:
+                violations.append(f"{name}: MaxSize {max_size} is below {self.min_asg_max_capacity}")
+        return violations
+
+    def _check_health_checks(self, resources: dict) -> list:
+        violations = []
+        for name, resource in _of_type(resources, "AWS::ElasticLoadBalancingV2::TargetGroup"):
+            properties = resource['Properties']
+            interval = properties.get('HealthCheckIntervalSeconds', _DEFAULT_HEALTH_CHECK_INTERVAL)
+            threshold = properties.get('UnhealthyThresholdCount', _DEFAULT_UNHEALTHY_THRESHOLD)
+            if _is_literal(interval) and _is_literal(threshold):
+                detection = int(interval) * int(threshold)
+                if detection > self.max_health_check_detection_seconds:
+                    violations.append(f"{name}: a dead target is detected after {interval}s x {threshold} = "
+                                      f"{detection}s, budget {self.max_health_check_detection_seconds}s")
+        return violations
+
+    def _check_visibility_timeouts(self, resources: dict) -> list:
+        violations = []
+        for name, mapping in _of_type(resources, "AWS::Lambda::EventSourceMapping"):
+            queue = resources.get(_referenced(mapping['Properties'].get('EventSourceArn')), {})
+            function = resources.get(_referenced(mapping['Properties'].get('FunctionName')), {})
+            # Mappings to an alias take the timeout of the function behind it
+            if function.get('Type') == "AWS::Lambda::Alias":
+                function = resources.get(_referenced(function['Properties'].get('FunctionName')), {})
+            if queue.get('Type') != "AWS::SQS::Queue" or function.get('Type') != "AWS::Lambda::Function":
+                continue
+            visibility = queue['Properties'].get('VisibilityTimeout', _DEFAULT_VISIBILITY_TIMEOUT)
+            timeout = function['Properties'].get('Timeout', _DEFAULT_LAMBDA_TIMEOUT)
+            if _is_literal(visibility) and _is_literal(timeout) and \
+                    int(visibility) < self.min_visibility_timeout_ratio * int(timeout):
+                violations.append(f"{name}: visibility timeout {visibility}s is under "
+                                  f"{self.min_visibility_timeout_ratio}x the Lambda timeout {timeout}s")
+        return violations
+
+
+def _of_type(resources: dict, resource_type: str):
+    return [(name, resource) for name, resource in resources.items() if resource.get('Type') == resource_type]
+
+
+def _is_literal(value) -> bool:
+    return isinstance(value, (int, float)) or (isinstance(value, str) and value.isdigit())
+
+
+def _referenced(value):
+    """Logical id behind a Ref or Fn::GetAtt, None for anything else."""
+    if isinstance(value, dict):
+        if 'Ref' in value:
+            return value['Ref']
+        if 'Fn::GetAtt' in value:
+            return value['Fn::GetAtt'][0]
+    return None
+
+
+if __name__ == '__main__':
+    assembly = sys.argv[1] if len(sys.argv) > 1 else "cdk.out"
+    budgets = ResourceBudgets()
+    failed = False
+    for path in sorted(glob.glob(os.path.join(assembly, "**", "*.template.json"), recursive=True)):
+        with open(path, encoding='utf-8') as template_file:
+            violations = budgets.check(json.load(template_file))
+        for violation in violations:
+            print(f"{os.path.relpath(path, assembly)}: {violation}", file=sys.stderr)
+        failed = failed or bool(violations)
+    sys.exit(1 if failed else 0)
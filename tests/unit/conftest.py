@@ -0,0 +1,78 @@
+"""Templates synthesized once per test session and shared across tests.
+
+Every synth costs hundreds of milliseconds of jsii round trips, so stack
+configurations that several tests only read from are built once here.
+Templates are queried, never changed, which keeps sharing them safe. Under
+pytest-xdist (``python -m pytest -n auto``) each worker process builds its
+own copy on first use. CDK_TEST_SHARED_TEMPLATES=0 synthesizes them again
+for every test, the way the suite used to, for timing comparisons.
+"""
+import os
+
+import pytest
+import aws_cdk as core
+from aws_cdk import aws_ecs as ecs, assertions as assertions
+from cdk_demo.backend_stack import QueueWorkerSettings
+from cdk_demo.stack_registry import StackRegistry
+from cdk_demo.stage_matrix import STACKS_CONFIG
+from tests.unit.templates import build_backend_template, build_network_stack
+
+# Backend configurations every matrix test runs against: network mode x queue consumer
+BACKEND_MATRIX = {
+    f"{network_mode}-{worker_mode}": {
+        'network_mode': ecs.NetworkMode.AWS_VPC if network_mode == 'awsvpc' else ecs.NetworkMode.BRIDGE,
+        'queue_workers': QueueWorkerSettings(mode=worker_mode, worker_image="public.ecr.aws/demo/worker:latest")
+                         if worker_mode != 'lambda' else None
+    }
+    for network_mode in ('bridge', 'awsvpc')
+    for worker_mode in ('lambda', 'ecs', 'hybrid')
+}
+
+
+def _shared_scope(scope):
+    def scope_for(fixture_name, config):
+        return scope if os.environ.get('CDK_TEST_SHARED_TEMPLATES', "1") != "0" else 'function'
+    return scope_for
+
+
+@pytest.fixture(scope=_shared_scope('session'))
+def backend_template():
+    return build_backend_template()
+
+
+@pytest.fixture(scope=_shared_scope('session'))
+def network_stack():
+    return build_network_stack()
+
+
+@pytest.fixture(scope=_shared_scope('session'))
+def app_templates():
+    """Templates of the primary region stacks in stacks.json, by construct id."""
+    registry = StackRegistry.from_file(core.App(), STACKS_CONFIG)
+    stacks = registry.build(["backend"])
+    return {stack.node.id: assertions.Template.from_stack(stack).to_json() for stack in stacks.values()}
+
+
+@pytest.fixture(scope=_shared_scope('session'), params=sorted(BACKEND_MATRIX))
+def backend_matrix(request):
+    """(settings, template) for each entry of BACKEND_MATRIX."""
+    overrides = {key: value for key, value in BACKEND_MATRIX[request.param].items() if value is not None}
+    return overrides, build_backend_template(**overrides)
+
+
+# unittest.TestCase methods cannot take fixtures, these put the shared
+# templates on the class instead, used with @pytest.mark.usefixtures
+
+@pytest.fixture(scope=_shared_scope('class'))
+def shared_backend_template(request, backend_template):
+    request.cls.template = backend_template
+
+
+@pytest.fixture(scope=_shared_scope('class'))
+def shared_app_templates(request, app_templates):
+    request.cls.templates = app_templates
+
+
+@pytest.fixture(scope=_shared_scope('class'))
+def shared_network_stack(request, network_stack):
+    request.cls.stack, request.cls.template = network_stack
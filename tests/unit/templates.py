@@ -0,0 +1,66 @@
+"""Stack builders shared by the unit tests and the session fixtures in conftest.py."""
+import aws_cdk as core
+from aws_cdk import (
+    Stack,
+    aws_ec2 as ec2,
+    aws_iam as iam,
+    aws_elasticloadbalancingv2 as elbv2,
+    aws_ecs as ecs,
+    assertions as assertions
+)
+from cdk_demo.backend_stack import BackendStack, BackendStackProps
+from cdk_demo.network_stack import NetworkStack
+
+AZS = ["us-west-2a", "us-west-2b", "us-west-2c"]
+
+
+def build_backend_template(**props_overrides):
+    app = core.App()
+    props_stack = Stack(app, "props")
+    vpc = ec2.Vpc(props_stack,"Vpc", max_azs=3)
+
+    # Mock the security stack outputs and ELB outputs
+    security_output = {
+        'LambdaRole': iam.Role(props_stack, "LambdaRole", assumed_by=iam.ServicePrincipal("lambda.amazonaws.com")),
+        'DBSG': ec2.SecurityGroup(props_stack, "DBSG", vpc=vpc),
+        'ECSSG': ec2.SecurityGroup(props_stack, "ECSSG", vpc=vpc),
+        'ECSTaskRole': iam.Role(props_stack, "ECSTaskRole", assumed_by=iam.ServicePrincipal("ecs-tasks.amazonaws.com")),
+    }
+    awsvpc = props_overrides.get('network_mode') == ecs.NetworkMode.AWS_VPC
+    if awsvpc:
+        security_output['ECSTaskSG'] = ec2.SecurityGroup(props_stack, "ECSTaskSG", vpc=vpc)
+    target_type = elbv2.TargetType.IP if awsvpc else elbv2.TargetType.INSTANCE
+    staging_front_tg = elbv2.ApplicationTargetGroup(props_stack, "TargetGroup", vpc=vpc,port=80,target_type=target_type)
+    # Request count scaling needs the target group behind a load balancer
+    alb = elbv2.ApplicationLoadBalancer(props_stack, "ALB", vpc=vpc)
+    alb.add_listener("Listener", port=80, default_target_groups=[staging_front_tg])
+    elb_output = {
+        'staging_front_tg': staging_front_tg
+    }
+
+    # Create props for the BackendStack
+    props = BackendStackProps(
+        vpc=vpc,
+        private_subnets=vpc.private_subnets,
+        resource_prefix="MyResource",
+        environment="dev",
+        db_name="mydb",
+        db_engine_version="15.3",
+        security_output=security_output,
+        elb_output=elb_output,
+        **props_overrides
+    )
+
+    # Create the BackendStack
+    stack = BackendStack(app, "BackendStack", props=props)
+
+    # Prepare the assertion
+    return assertions.Template.from_stack(stack)
+
+
+def build_network_stack(**overrides):
+    """Return a NetworkStack over AZS and its template."""
+    app = core.App()
+    stack = NetworkStack(app, "NetworkStack", vpc_name="MyVpc", vpc_cidr="10.0.0.0/16", availability_zones=AZS,
+                         **overrides)
+    return stack, assertions.Template.from_stack(stack)
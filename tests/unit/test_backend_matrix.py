@@ -0,0 +1,44 @@
+"""Invariants every backend configuration of conftest.BACKEND_MATRIX must keep.
+
+Each configuration is synthesized once per session by the ``backend_matrix``
+fixture and shared by all the tests below.
+"""
+from aws_cdk import aws_ecs as ecs, assertions as assertions
+
+
+def test_task_definitions_use_the_network_mode(backend_matrix):
+    settings, template = backend_matrix
+    awsvpc = settings.get('network_mode') == ecs.NetworkMode.AWS_VPC
+    task_definitions = template.find_resources("AWS::ECS::TaskDefinition")
+
+    assert task_definitions
+    for task_definition in task_definitions.values():
+        assert task_definition["Properties"]["NetworkMode"] == ("awsvpc" if awsvpc else "bridge")
+
+
+def test_services_in_awsvpc_mode_have_network_configuration(backend_matrix):
+    settings, template = backend_matrix
+    awsvpc = settings.get('network_mode') == ecs.NetworkMode.AWS_VPC
+
+    for service in template.find_resources("AWS::ECS::Service").values():
+        assert ("NetworkConfiguration" in service["Properties"]) == awsvpc
+
+
+def test_queue_is_consumed_by_the_configured_workers(backend_matrix):
+    settings, template = backend_matrix
+    workers = settings.get('queue_workers')
+    uses_lambda = workers is None or workers.uses_lambda
+    uses_ecs = workers is not None and workers.uses_ecs
+
+    template.resource_count_is("AWS::Lambda::EventSourceMapping", 1 if uses_lambda else 0)
+    template.resource_count_is("AWS::ECS::Service", 2 if uses_ecs else 1)
+
+
+def test_database_and_queues_exist_in_every_configuration(backend_matrix):
+    _, template = backend_matrix
+
+    template.resource_count_is("AWS::RDS::DBCluster", 1)
+    template.resource_count_is("AWS::SQS::Queue", 2)
+    template.has_resource_properties("AWS::SQS::Queue", {
+        "RedrivePolicy": assertions.Match.object_like({"maxReceiveCount": assertions.Match.any_value()})
+    })
@@ -1,4 +1,5 @@
 import unittest
+import pytest
 import aws_cdk as core
 from aws_cdk import (
     Stack,
@@ -7,50 +8,23 @@ from aws_cdk import (
     aws_lambda as lambda_,
     aws_iam as iam,
     aws_elasticloadbalancingv2 as elbv2,
+    aws_ecs as ecs,
     assertions as assertions
 )
 from cdk_demo.backend_stack import *
+from tests.unit.templates import build_backend_template
 
-# example tests. To run these tests, uncomment this file along with the example
-# resource in cdk_demo/cdk_demo_stack.py
+
+@pytest.mark.usefixtures("shared_backend_template")
 class BackendStackTest(unittest.TestCase):
+    # self.template is the default configuration, synthesized once per session
+
     def test_resources_created(self):
-        app = core.App()
-        props_stack = Stack(app, "props")
-        vpc = ec2.Vpc(props_stack,"Vpc", max_azs=3)
-
-        # Mock the security stack outputs and ELB outputs
-        security_output = {
-            'LambdaRole': iam.Role(props_stack, "LambdaRole", assumed_by=iam.ServicePrincipal("lambda.amazonaws.com")),
-            'DBSG': ec2.SecurityGroup(props_stack, "DBSG", vpc=vpc),
-            'ECSSG': ec2.SecurityGroup(props_stack, "ECSSG", vpc=vpc),
-            'ECSTaskRole': iam.Role(props_stack, "ECSTaskRole", assumed_by=iam.ServicePrincipal("ecs-tasks.amazonaws.com")),
-        }
-        elb_output = {
-            'staging_front_tg': elbv2.ApplicationTargetGroup(props_stack, "TargetGroup", vpc=vpc,port=80,target_type=elbv2.TargetType.INSTANCE)
-        }
-
-        # Create props for the BackendStack
-        props = BackendStackProps(
-            vpc=vpc,
-            private_subnets=vpc.private_subnets,
-            resource_prefix="MyResource",
-            environment="dev",
-            db_name="mydb",
-            db_engine_version="5.7",
-            security_output=security_output,
-            elb_output=elb_output
-        )
-
-        # Create the BackendStack
-        stack = BackendStack(app, "BackendStack", props=props)
-
-        # Prepare the assertion
-        template = assertions.Template.from_stack(stack)
+        template = self.template
 
         # Assertions
-        # Example: Assert SQS Queue creation
-        template.resource_count_is("AWS::SQS::Queue", 1)
+        # Example: Assert SQS Queue creation, the worker queue and its DLQ
+        template.resource_count_is("AWS::SQS::Queue", 2)
 
         # Assert Lambda Function creation
         template.resource_count_is("AWS::Lambda::Function", 1)
@@ -64,4 +38,584 @@ class BackendStackTest(unittest.TestCase):
         # Assert EC2 AutoScaling Group creation
         template.resource_count_is("AWS::AutoScaling::AutoScalingGroup", 1)
 
+    def test_event_source_mapping_reports_batch_item_failures(self):
+        template = self.template
+
+        template.has_resource_properties("AWS::Lambda::EventSourceMapping", {
+            "FunctionResponseTypes": ["ReportBatchItemFailures"]
+        })
+
+    def test_lambda_environment_from_props(self):
+        template = build_backend_template(ses_region="us-west-2", send_concurrency=16, ses_max_send_rate=14,
+                                          template_bucket_name="email-templates", template_prefix="v1/",
+                                          bulk_send_enabled=True)
+
+        template.has_resource_properties("AWS::Lambda::Function", {
+            "Environment": {"Variables": {
+                "SES_REGION": "us-west-2",
+                "SEND_CONCURRENCY": "16",
+                "SES_MAX_SEND_RATE": "14",
+                "TEMPLATE_BUCKET": "email-templates",
+                "TEMPLATE_PREFIX": "v1/",
+                "BULK_SEND_ENABLED": "true"
+            }}
+        })
+
+    def test_default_queue_settings(self):
+        template = self.template
+
+        template.has_resource_properties("AWS::SQS::Queue", {
+            "DelaySeconds": 1,
+            "VisibilityTimeout": 180,
+            "RedrivePolicy": {
+                "deadLetterTargetArn": {"Fn::GetAtt": [assertions.Match.string_like_regexp("WorkerDeadLetterQueue"), "Arn"]},
+                "maxReceiveCount": 5
+            }
+        })
+        template.has_resource_properties("AWS::SQS::Queue", {
+            "QueueName": "MyResource-dev-dlq",
+            "MessageRetentionPeriod": 1209600
+        })
+        template.has_resource_properties("AWS::Lambda::Function", {
+            "Environment": {"Variables": assertions.Match.object_like({
+                "DEAD_LETTER_QUEUE_ARN": {"Fn::GetAtt": [assertions.Match.string_like_regexp("WorkerDeadLetterQueue"), "Arn"]}
+            })}
+        })
+        template.has_resource_properties("AWS::Lambda::EventSourceMapping", {
+            "BatchSize": 10,
+            "MaximumBatchingWindowInSeconds": assertions.Match.absent(),
+            "ScalingConfig": assertions.Match.absent()
+        })
+        template.has_resource_properties("AWS::Lambda::Function", {"Timeout": 30})
+
+    def test_custom_queue_settings(self):
+        template = build_backend_template(email_queue=EmailQueueSettings(
+            batch_size=10000,
+            max_batching_window=core.Duration.seconds(20),
+            max_concurrency=50,
+            visibility_timeout=core.Duration.minutes(6),
+            delivery_delay=core.Duration.seconds(0),
+            lambda_timeout=core.Duration.minutes(1),
+            max_receive_count=3
+        ))
+
+        template.has_resource_properties("AWS::SQS::Queue", {
+            "DelaySeconds": 0,
+            "VisibilityTimeout": 360,
+            "RedrivePolicy": assertions.Match.object_like({"maxReceiveCount": 3})
+        })
+        template.has_resource_properties("AWS::Lambda::EventSourceMapping", {
+            "BatchSize": 10000,
+            "MaximumBatchingWindowInSeconds": 20,
+            "ScalingConfig": {"MaximumConcurrency": 50}
+        })
+        template.has_resource_properties("AWS::Lambda::Function", {"Timeout": 60})
+
+    def test_invalid_queue_settings_fail_synth(self):
+        invalid_settings = [
+            EmailQueueSettings(batch_size=10001, max_batching_window=core.Duration.seconds(1)),
+            EmailQueueSettings(batch_size=100),
+            EmailQueueSettings(max_batching_window=core.Duration.minutes(6)),
+            EmailQueueSettings(max_concurrency=1),
+            EmailQueueSettings(delivery_delay=core.Duration.minutes(16)),
+            EmailQueueSettings(visibility_timeout=core.Duration.seconds(30)),
+            EmailQueueSettings(max_receive_count=0),
+        ]
+        for settings in invalid_settings:
+            with self.assertRaises(ValueError):
+                settings.validate()
+
+        with self.assertRaisesRegex(ValueError, "visibility_timeout"):
+            build_backend_template(email_queue=EmailQueueSettings(lambda_timeout=core.Duration.minutes(1)))
+
+    def test_idempotency_table(self):
+        template = build_backend_template(idempotency=IdempotencySettings(key_source='content', ttl=core.Duration.hours(2)))
+
+        template.has_resource_properties("AWS::DynamoDB::Table", {
+            "KeySchema": [{"AttributeName": "id", "KeyType": "HASH"}],
+            "BillingMode": "PAY_PER_REQUEST",
+            "TimeToLiveSpecification": {"AttributeName": "expires_at", "Enabled": True}
+        })
+        template.has_resource_properties("AWS::Lambda::Function", {
+            "Environment": {"Variables": assertions.Match.object_like({
+                "IDEMPOTENCY_TABLE": {"Ref": assertions.Match.string_like_regexp("IdempotencyTable")},
+                "IDEMPOTENCY_KEY_SOURCE": "content",
+                "IDEMPOTENCY_TTL": "7200",
+                "IDEMPOTENCY_IN_PROGRESS_TTL": "30"
+            })}
+        })
+
+    def test_idempotency_can_be_disabled(self):
+        template = build_backend_template(idempotency=IdempotencySettings(enabled=False))
+
+        template.resource_count_is("AWS::DynamoDB::Table", 0)
+
+        with self.assertRaises(ValueError):
+            IdempotencySettings(key_source='body').validate()
+
+    def test_email_dashboard_and_alarms(self):
+        template = build_backend_template(monitoring=EmailMonitoringSettings(namespace="Test/Email", ses_error_threshold=3))
+
+        template.resource_count_is("AWS::CloudWatch::Dashboard", 1)
+        template.has_resource_properties("AWS::CloudWatch::Dashboard", {"DashboardName": "MyResource-dev-email"})
+        dashboard = next(iter(template.find_resources("AWS::CloudWatch::Dashboard").values()))
+        body = "".join(part for part in dashboard['Properties']['DashboardBody']['Fn::Join'][1] if isinstance(part, str))
+        self.assertIn('{Test/Email,FunctionName,ErrorCode} MetricName=\\"SesErrors\\"', body)
+        # The three email alarms plus the service's CPU step scaling alarm
+        template.resource_count_is("AWS::CloudWatch::Alarm", 4)
+        template.has_resource_properties("AWS::CloudWatch::Alarm", {
+            "Namespace": "Test/Email",
+            "MetricName": "SesErrors",
+            "Statistic": "Sum",
+            "Threshold": 3
+        })
+        template.has_resource_properties("AWS::CloudWatch::Alarm", {
+            "MetricName": "BatchLatency",
+            "ExtendedStatistic": "p99",
+            "Threshold": 24000
+        })
+        template.has_resource_properties("AWS::CloudWatch::Alarm", {
+            "Namespace": "AWS/SQS",
+            "MetricName": "ApproximateNumberOfMessagesVisible"
+        })
+        template.has_resource_properties("AWS::Lambda::Function", {
+            "Environment": {"Variables": assertions.Match.object_like({"METRICS_NAMESPACE": "Test/Email"})}
+        })
+
+    def test_email_monitoring_can_be_disabled(self):
+        template = build_backend_template(monitoring=EmailMonitoringSettings(enabled=False))
+
+        template.resource_count_is("AWS::CloudWatch::Dashboard", 0)
+        alarms = template.find_resources("AWS::CloudWatch::Alarm")
+        self.assertEqual([alarm["Properties"]["Namespace"] for alarm in alarms.values()], ["AWS/ECS"])
+
+    def test_email_function_packaging_and_sizing(self):
+        template = self.template
+
+        template.has_resource_properties("AWS::Lambda::Function", {
+            "Handler": "email_sender.lambda_handler",
+            "Architectures": ["arm64"],
+            "MemorySize": 256
+        })
+        template.resource_count_is("AWS::Lambda::Alias", 0)
+
+    def test_provisioned_concurrency_alias_is_the_queue_target(self):
+        template = build_backend_template(email_function=EmailFunctionSettings(
+            architecture=lambda_.Architecture.X86_64,
+            memory_size=1024,
+            provisioned_concurrency=2
+        ))
+
+        template.has_resource_properties("AWS::Lambda::Function", {
+            "Architectures": ["x86_64"],
+            "MemorySize": 1024
+        })
+        template.has_resource_properties("AWS::Lambda::Alias", {
+            "Name": "live",
+            "ProvisionedConcurrencyConfig": {"ProvisionedConcurrentExecutions": 2}
+        })
+        template.has_resource_properties("AWS::Lambda::EventSourceMapping", {
+            "FunctionName": {"Fn::Join": ["", assertions.Match.array_with([":live"])]}
+        })
+
+        with self.assertRaises(ValueError):
+            EmailFunctionSettings(memory_size=64).validate()
+
+    def test_ecs_capacity_and_managed_scaling(self):
+        template = build_backend_template(ecs_capacity=EcsCapacitySettings(
+            instance_type="c6i.large", min_capacity=1, max_capacity=10, target_capacity_percent=80,
+            instance_warmup=core.Duration.seconds(90)
+        ))
+
+        template.has_resource_properties("AWS::AutoScaling::AutoScalingGroup", {
+            "MinSize": "1",
+            "MaxSize": "10",
+            "DefaultInstanceWarmup": 90
+        })
+        template.has_resource_properties("AWS::AutoScaling::LaunchConfiguration", {
+            "InstanceType": "c6i.large"
+        })
+        template.has_resource_properties("AWS::ECS::CapacityProvider", {
+            "AutoScalingGroupProvider": assertions.Match.object_like({
+                "ManagedScaling": {
+                    "Status": "ENABLED",
+                    "TargetCapacity": 80,
+                    "MaximumScalingStepSize": 2,
+                    "InstanceWarmupPeriod": 90
+                }
+            })
+        })
+
+    def test_service_auto_scaling(self):
+        template = build_backend_template(service_scaling=ServiceScalingSettings(
+            min_tasks=2, max_tasks=20, cpu_target_percent=50, memory_target_percent=70, requests_per_target=500
+        ))
+
+        template.has_resource_properties("AWS::ApplicationAutoScaling::ScalableTarget", {
+            "MinCapacity": 2,
+            "MaxCapacity": 20,
+            "ScalableDimension": "ecs:service:DesiredCount"
+        })
+        for metric_type, target in [("ECSServiceAverageCPUUtilization", 50),
+                                    ("ECSServiceAverageMemoryUtilization", 70),
+                                    ("ALBRequestCountPerTarget", 500)]:
+            template.has_resource_properties("AWS::ApplicationAutoScaling::ScalingPolicy", {
+                "PolicyType": "TargetTrackingScaling",
+                "TargetTrackingScalingPolicyConfiguration": assertions.Match.object_like({
+                    "PredefinedMetricSpecification": assertions.Match.object_like({"PredefinedMetricType": metric_type}),
+                    "TargetValue": target,
+                    "ScaleInCooldown": 120,
+                    "ScaleOutCooldown": 30
+                })
+            })
+        template.has_resource_properties("AWS::ApplicationAutoScaling::ScalingPolicy", {
+            "PolicyType": "StepScaling",
+            "StepScalingPolicyConfiguration": assertions.Match.object_like({
+                "AdjustmentType": "ChangeInCapacity",
+                "StepAdjustments": [
+                    {"MetricIntervalLowerBound": 0, "MetricIntervalUpperBound": 10, "ScalingAdjustment": 2},
+                    {"MetricIntervalLowerBound": 10, "ScalingAdjustment": 4}
+                ]
+            })
+        })
+
+    def test_invalid_scaling_settings_fail_synth(self):
+        for settings in [EcsCapacitySettings(min_capacity=3, max_capacity=2),
+                         EcsCapacitySettings(target_capacity_percent=0),
+                         ServiceScalingSettings(min_tasks=0),
+                         ServiceScalingSettings(cpu_target_percent=90),
+                         ServiceScalingSettings(cpu_step_scale_out=[(95, 4), (85, 2)])]:
+            with self.assertRaises(ValueError):
+                settings.validate()
+
+    def test_lambda_is_the_only_queue_consumer_by_default(self):
+        template = self.template
+
+        template.resource_count_is("AWS::Lambda::EventSourceMapping", 1)
+        template.resource_count_is("AWS::ECS::Service", 1)
+
+    def test_many_queue_workers_stay_within_the_step_adjustment_limit(self):
+        settings = QueueWorkerSettings(mode='ecs', worker_image="example/worker:1", backlog_per_worker=10,
+                                       max_workers=100)
+        self.assertEqual(settings.worker_steps(), list(range(4, 101, 6)))
+
+        template = build_backend_template(queue_workers=settings)
+
+        policies = template.find_resources("AWS::ApplicationAutoScaling::ScalingPolicy", {
+            "Properties": {"StepScalingPolicyConfiguration": {"AdjustmentType": "ExactCapacity"}}
+        })
+        steps = [step for policy in policies.values()
+                 for step in policy["Properties"]["StepScalingPolicyConfiguration"]["StepAdjustments"]]
+        self.assertLessEqual(len(steps), QueueWorkerSettings.MAX_STEP_ADJUSTMENTS)
+        self.assertEqual(max(step["ScalingAdjustment"] for step in steps), 100)
+
+    def test_ecs_queue_workers_scale_on_backlog_per_task(self):
+        template = build_backend_template(queue_workers=QueueWorkerSettings(
+            mode='ecs', worker_image="example/worker:1", backlog_per_worker=50, max_workers=3
+        ))
+
+        template.resource_count_is("AWS::Lambda::EventSourceMapping", 0)
+        template.resource_count_is("AWS::ECS::Service", 2)
+        template.has_resource_properties("AWS::ECS::TaskDefinition", {
+            "ContainerDefinitions": [assertions.Match.object_like({
+                "Image": "example/worker:1",
+                "Environment": assertions.Match.array_with([
+                    {"Name": "QUEUE_URL", "Value": assertions.Match.any_value()}
+                ])
+            })]
+        })
+        template.has_resource_properties("AWS::ApplicationAutoScaling::ScalableTarget", {
+            "MinCapacity": 0,
+            "MaxCapacity": 3
+        })
+        # One worker per 50 visible messages, none when the queue is empty;
+        # CDK splits the steps into a lower and an upper alarm at 51 messages
+        template.has_resource_properties("AWS::ApplicationAutoScaling::ScalingPolicy", {
+            "StepScalingPolicyConfiguration": assertions.Match.object_like({
+                "AdjustmentType": "ExactCapacity",
+                "StepAdjustments": [
+                    {"MetricIntervalLowerBound": -50, "MetricIntervalUpperBound": 0, "ScalingAdjustment": 1},
+                    {"MetricIntervalUpperBound": -50, "ScalingAdjustment": 0}
+                ]
+            })
+        })
+        template.has_resource_properties("AWS::ApplicationAutoScaling::ScalingPolicy", {
+            "StepScalingPolicyConfiguration": assertions.Match.object_like({
+                "AdjustmentType": "ExactCapacity",
+                "StepAdjustments": [
+                    {"MetricIntervalLowerBound": 0, "MetricIntervalUpperBound": 50, "ScalingAdjustment": 2},
+                    {"MetricIntervalLowerBound": 50, "ScalingAdjustment": 3}
+                ]
+            })
+        })
+        template.has_resource_properties("AWS::CloudWatch::Alarm", {
+            "MetricName": "ApproximateNumberOfMessagesVisible",
+            "Statistic": "Maximum",
+            "Threshold": 51,
+            "EvaluationPeriods": 1,
+            "ComparisonOperator": "GreaterThanOrEqualToThreshold"
+        })
+
+    def test_hybrid_workers_take_over_sustained_backlogs(self):
+        template = build_backend_template(queue_workers=QueueWorkerSettings(
+            mode='hybrid', worker_image="example/worker:1", hybrid_backlog_threshold=500, hybrid_sustained_periods=3
+        ))
+
+        template.resource_count_is("AWS::Lambda::EventSourceMapping", 1)
+        template.resource_count_is("AWS::ECS::Service", 2)
+        # The first 500 messages are left to Lambda
+        template.has_resource_properties("AWS::ApplicationAutoScaling::ScalingPolicy", {
+            "StepScalingPolicyConfiguration": assertions.Match.object_like({
+                "StepAdjustments": assertions.Match.array_with([
+                    {"MetricIntervalLowerBound": -400, "MetricIntervalUpperBound": -300, "ScalingAdjustment": 1},
+                    {"MetricIntervalUpperBound": -400, "ScalingAdjustment": 0}
+                ])
+            })
+        })
+        template.has_resource_properties("AWS::CloudWatch::Alarm", {
+            "MetricName": "ApproximateNumberOfMessagesVisible",
+            "Threshold": 901,
+            "EvaluationPeriods": 3
+        })
+
+    def test_invalid_queue_worker_settings_fail_synth(self):
+        for settings in [QueueWorkerSettings(mode='batch'),
+                         QueueWorkerSettings(mode='ecs'),
+                         QueueWorkerSettings(mode='hybrid', worker_image="example/worker:1", min_workers=5, max_workers=5)]:
+            with self.assertRaises(ValueError):
+                build_backend_template(queue_workers=settings)
+
+    def test_database_proxy_is_optional(self):
+        template = self.template
+
+        template.resource_count_is("AWS::RDS::DBProxy", 0)
+
+    def test_database_proxy(self):
+        template = build_backend_template(db_proxy=DatabaseProxySettings(
+            enabled=True, max_connections_percent=75, idle_client_timeout=core.Duration.minutes(10)
+        ))
+
+        template.has_resource_properties("AWS::RDS::DBProxy", {
+            "EngineFamily": "POSTGRESQL",
+            "IdleClientTimeout": 600,
+            "RequireTLS": True,
+            "VpcSecurityGroupIds": [{"Fn::ImportValue": assertions.Match.string_like_regexp("DBSG")}]
+        })
+        template.has_resource_properties("AWS::RDS::DBProxyTargetGroup", {
+            "ConnectionPoolConfigurationInfo": {
+                "ConnectionBorrowTimeout": 120,
+                "MaxConnectionsPercent": 75,
+                "MaxIdleConnectionsPercent": 50
+            },
+            "DBClusterIdentifiers": [{"Ref": assertions.Match.string_like_regexp("Database")}]
+        })
+        template.has_output("DatabaseProxyEndpoint", {
+            "Value": {"Fn::GetAtt": [assertions.Match.string_like_regexp("DatabaseProxy"), "Endpoint"]}
+        })
+
+    def test_invalid_database_proxy_settings_fail_synth(self):
+        for settings in [DatabaseProxySettings(max_connections_percent=0),
+                         DatabaseProxySettings(max_idle_connections_percent=95),
+                         DatabaseProxySettings(idle_client_timeout=core.Duration.hours(12))]:
+            with self.assertRaises(ValueError):
+                settings.validate()
+
+    def test_database_readers_and_capacity(self):
+        template = build_backend_template(database=DatabaseSettings(min_capacity=1, max_capacity=8, readers=[
+            DatabaseReader("reader1", scale_with_writer=True),
+            DatabaseReader("reader2"),
+            DatabaseReader("reporting", instance_type="r6g.large", promotion_tier=15)
+        ]))
+
+        template.resource_count_is("AWS::RDS::DBInstance", 4)
+        template.has_resource_properties("AWS::RDS::DBCluster", {
+            "ServerlessV2ScalingConfiguration": {"MinCapacity": 1, "MaxCapacity": 8}
+        })
+        template.has_resource_properties("AWS::RDS::DBInstance", {
+            "DBInstanceClass": "db.serverless",
+            "PromotionTier": 1
+        })
+        template.has_resource_properties("AWS::RDS::DBInstance", {
+            "DBInstanceClass": "db.serverless",
+            "PromotionTier": 2
+        })
+        template.has_resource_properties("AWS::RDS::DBInstance", {
+            "DBInstanceClass": "db.r6g.large",
+            "PromotionTier": 15
+        })
+
+    def test_database_endpoints_in_container_environment(self):
+        template = build_backend_template(database=DatabaseSettings(readers=[DatabaseReader("reader1")]))
+
+        template.resource_count_is("AWS::RDS::DBInstance", 2)
+        template.has_resource_properties("AWS::ECS::TaskDefinition", {
+            "ContainerDefinitions": [assertions.Match.object_like({
+                "Name": "web",
+                "Environment": assertions.Match.array_with([
+                    {"Name": "DB_WRITER_ENDPOINT",
+                     "Value": {"Fn::GetAtt": [assertions.Match.string_like_regexp("Database"), "Endpoint.Address"]}},
+                    {"Name": "DB_READER_ENDPOINT",
+                     "Value": {"Fn::GetAtt": [assertions.Match.string_like_regexp("Database"), "ReadEndpoint.Address"]}}
+                ])
+            })]
+        })
+
+    def test_database_endpoints_through_proxy(self):
+        template = build_backend_template(db_proxy=DatabaseProxySettings(enabled=True),
+                                          database=DatabaseSettings(readers=[DatabaseReader("reader1")]))
+
+        template.has_resource_properties("AWS::RDS::DBProxyEndpoint", {"TargetRole": "READ_ONLY"})
+        template.has_resource_properties("AWS::ECS::TaskDefinition", {
+            "ContainerDefinitions": [assertions.Match.object_like({
+                "Name": "web",
+                "Environment": assertions.Match.array_with([
+                    {"Name": "DB_WRITER_ENDPOINT",
+                     "Value": {"Fn::GetAtt": [assertions.Match.string_like_regexp("DatabaseProxy"), "Endpoint"]}},
+                    {"Name": "DB_READER_ENDPOINT",
+                     "Value": {"Fn::GetAtt": [assertions.Match.string_like_regexp("DatabaseProxyReadOnlyEndpoint"), "Endpoint"]}}
+                ])
+            })]
+        })
+
+    def test_invalid_database_settings_fail_synth(self):
+        for settings in [DatabaseSettings(min_capacity=0.25),
+                         DatabaseSettings(min_capacity=4, max_capacity=2),
+                         DatabaseSettings(max_capacity=2.3),
+                         DatabaseSettings(readers=[DatabaseReader("reader1"), DatabaseReader("reader1")]),
+                         DatabaseSettings(readers=[DatabaseReader("reader1", promotion_tier=1)]),
+                         DatabaseSettings(readers=[DatabaseReader("reader1", instance_type="r6g.large", scale_with_writer=True)])]:
+            with self.assertRaises(ValueError):
+                settings.validate()
+
+    def test_cache_is_optional(self):
+        template = self.template
+
+        template.resource_count_is("AWS::ElastiCache::ReplicationGroup", 0)
+
+    def test_cache_endpoint_in_container_environment(self):
+        template = build_backend_template(cache=CacheClusterSettings(enabled=True))
+
+        template.resource_count_is("AWS::ElastiCache::ReplicationGroup", 1)
+        template.has_resource_properties("AWS::ECS::TaskDefinition", {
+            "ContainerDefinitions": [assertions.Match.object_like({
+                "Name": "web",
+                "Environment": assertions.Match.array_with([
+                    {"Name": "CACHE_ENDPOINT",
+                     "Value": {"Fn::GetAtt": [assertions.Match.string_like_regexp("Cache"), "PrimaryEndPoint.Address"]}},
+                    {"Name": "CACHE_PORT", "Value": "6379"}
+                ])
+            })]
+        })
+        template.has_output("CacheEndpoint", {})
+
+    def test_bridge_network_mode(self):
+        template = self.template
+
+        template.has_resource_properties("AWS::ECS::TaskDefinition", {
+            "NetworkMode": "bridge",
+            "ContainerDefinitions": [assertions.Match.object_like({
+                "Name": "web",
+                "PortMappings": [{"ContainerPort": 80, "HostPort": 0, "Protocol": "tcp"}]
+            })]
+        })
+        template.has_resource_properties("AWS::ECS::Service", {
+            "NetworkConfiguration": assertions.Match.absent()
+        })
+
+    def test_awsvpc_network_mode(self):
+        template = build_backend_template(network_mode=ecs.NetworkMode.AWS_VPC,
+                                          cache=CacheClusterSettings(enabled=True))
+
+        template.has_resource_properties("AWS::ECS::TaskDefinition", {
+            "NetworkMode": "awsvpc",
+            "ContainerDefinitions": [assertions.Match.object_like({
+                "Name": "web",
+                "PortMappings": [{"ContainerPort": 80, "Protocol": "tcp"}]
+            })]
+        })
+        task_sg = {"Fn::ImportValue": assertions.Match.string_like_regexp("ECSTaskSG")}
+        template.has_resource_properties("AWS::ECS::Service", {
+            "NetworkConfiguration": {
+                "AwsvpcConfiguration": assertions.Match.object_like({"SecurityGroups": [task_sg]})
+            },
+            "LoadBalancers": [assertions.Match.object_like({"ContainerPort": 80})]
+        })
+        # The cache admits the tasks' own security group
+        template.has_resource_properties("AWS::EC2::SecurityGroupIngress", {
+            "FromPort": 6379,
+            "SourceSecurityGroupId": task_sg
+        })
+
+    def test_awsvpc_network_mode_needs_task_security_group(self):
+        app = core.App()
+        props_stack = Stack(app, "props")
+        vpc = ec2.Vpc(props_stack, "Vpc", max_azs=2)
+        props = BackendStackProps(vpc=vpc, private_subnets=vpc.private_subnets, resource_prefix="MyResource",
+                                  environment="dev", db_name="mydb", db_engine_version="15.3",
+                                  security_output={}, elb_output={}, network_mode=ecs.NetworkMode.AWS_VPC)
+        with self.assertRaises(ValueError):
+            BackendStack(app, "BackendStack", props=props)
+
+    def test_fargate_burst_service(self):
+        template = build_backend_template(network_mode=ecs.NetworkMode.AWS_VPC, fargate_burst=FargateBurstSettings(
+            enabled=True, base=1, fargate_weight=1, spot_weight=4, max_tasks=8
+        ))
+
+        template.has_resource_properties("AWS::ECS::ClusterCapacityProviderAssociations", {
+            "CapacityProviders": assertions.Match.array_with(["FARGATE", "FARGATE_SPOT"])
+        })
+        template.has_resource_properties("AWS::ECS::Service", {
+            "CapacityProviderStrategy": [
+                {"CapacityProvider": "FARGATE", "Base": 1, "Weight": 1},
+                {"CapacityProvider": "FARGATE_SPOT", "Weight": 4}
+            ],
+            "DesiredCount": 1,
+            "LoadBalancers": [assertions.Match.object_like({"ContainerName": "web", "ContainerPort": 80})]
+        })
+        template.has_resource_properties("AWS::ECS::TaskDefinition", {
+            "RequiresCompatibilities": ["FARGATE"],
+            "NetworkMode": "awsvpc"
+        })
+        template.has_resource_properties("AWS::ApplicationAutoScaling::ScalableTarget", {
+            "MinCapacity": 1,
+            "MaxCapacity": 8
+        })
+        # Bursts scale out on the EC2 service's CPU and back in once it cools down
+        template.has_resource_properties("AWS::CloudWatch::Alarm", {
+            "MetricName": "CPUUtilization",
+            "Threshold": 80,
+            "ComparisonOperator": "GreaterThanOrEqualToThreshold",
+            "Dimensions": assertions.Match.array_with([
+                {"Name": "ServiceName", "Value": {"Fn::GetAtt": [assertions.Match.string_like_regexp("EC2Service"), "Name"]}}
+            ])
+        })
+        template.has_resource_properties("AWS::CloudWatch::Alarm", {
+            "MetricName": "CPUUtilization",
+            "Threshold": 50,
+            "ComparisonOperator": "LessThanOrEqualToThreshold"
+        })
+
+    def test_fargate_burst_requires_awsvpc(self):
+        with self.assertRaises(ValueError):
+            build_backend_template(fargate_burst=FargateBurstSettings(enabled=True))
+        for settings in [FargateBurstSettings(base=11),
+                         FargateBurstSettings(fargate_weight=0, spot_weight=0),
+                         FargateBurstSettings(scale_in_cpu_percent=90)]:
+            with self.assertRaises(ValueError):
+                settings.validate()
+
+    def test_global_database_primary(self):
+        template = build_backend_template(database=DatabaseSettings(global_cluster_identifier="global-db"))
+
+        template.has_resource_properties("AWS::RDS::GlobalCluster", {
+            "GlobalClusterIdentifier": "global-db",
+            "SourceDBClusterIdentifier": {"Ref": assertions.Match.string_like_regexp("Database")}
+        })
+        template.has_output("DatabaseReaderEndpoint", {
+            "Value": {"Fn::GetAtt": [assertions.Match.string_like_regexp("Database"), "ReadEndpoint.Address"]}
+        })
+
+    def test_no_global_database_by_default(self):
+        template = self.template
 
+        template.resource_count_is("AWS::RDS::GlobalCluster", 0)
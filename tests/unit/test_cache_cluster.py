@@ -0,0 +1,85 @@
+import unittest
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+from aws_cdk import aws_ec2 as ec2
+from cdk_demo.cache_cluster import CacheCluster, CacheClusterSettings
+
+
+def build_cache_template(settings):
+    app = core.App()
+    stack = core.Stack(app, "CacheStack")
+    vpc = ec2.Vpc(stack, "Vpc", max_azs=2)
+    ecs_sg = ec2.SecurityGroup(stack, "ECSSG", vpc=vpc)
+    CacheCluster(stack, "Cache", vpc=vpc, subnets=vpc.private_subnets, allowed_security_group=ecs_sg,
+                 settings=settings)
+    return assertions.Template.from_stack(stack)
+
+
+class CacheClusterTest(unittest.TestCase):
+
+    def test_single_shard_replication_group(self):
+        template = build_cache_template(CacheClusterSettings(enabled=True))
+
+        template.has_resource_properties("AWS::ElastiCache::SubnetGroup", {
+            "SubnetIds": [{"Ref": assertions.Match.string_like_regexp("PrivateSubnet1")},
+                          {"Ref": assertions.Match.string_like_regexp("PrivateSubnet2")}]
+        })
+        template.has_resource_properties("AWS::ElastiCache::ReplicationGroup", {
+            "Engine": "redis",
+            "EngineVersion": "7.1",
+            "CacheNodeType": "cache.t4g.small",
+            "CacheParameterGroupName": "default.redis7",
+            "ClusterMode": "disabled",
+            "NumNodeGroups": 1,
+            "ReplicasPerNodeGroup": 1,
+            "AutomaticFailoverEnabled": True,
+            "TransitEncryptionEnabled": True
+        })
+
+    def test_only_ecs_security_group_is_admitted(self):
+        template = build_cache_template(CacheClusterSettings(enabled=True))
+
+        template.has_resource_properties("AWS::EC2::SecurityGroup", {
+            "GroupDescription": "Cache security group",
+            "SecurityGroupIngress": assertions.Match.absent()
+        })
+        template.resource_count_is("AWS::EC2::SecurityGroupIngress", 1)
+        template.has_resource_properties("AWS::EC2::SecurityGroupIngress", {
+            "IpProtocol": "tcp",
+            "FromPort": 6379,
+            "ToPort": 6379,
+            "GroupId": {"Fn::GetAtt": [assertions.Match.string_like_regexp("CacheSecurityGroup"), "GroupId"]},
+            "SourceSecurityGroupId": {"Fn::GetAtt": [assertions.Match.string_like_regexp("ECSSG"), "GroupId"]}
+        })
+
+    def test_sharded_valkey_uses_cluster_mode(self):
+        template = build_cache_template(CacheClusterSettings(
+            enabled=True, engine='valkey', node_type="cache.r7g.large", shards=3, replicas_per_shard=2
+        ))
+
+        template.has_resource_properties("AWS::ElastiCache::ReplicationGroup", {
+            "Engine": "valkey",
+            "EngineVersion": "7.2",
+            "CacheNodeType": "cache.r7g.large",
+            "CacheParameterGroupName": "default.valkey7.cluster.on",
+            "ClusterMode": "enabled",
+            "NumNodeGroups": 3,
+            "ReplicasPerNodeGroup": 2
+        })
+
+    def test_invalid_settings(self):
+        for settings in [CacheClusterSettings(engine='memcached'),
+                         CacheClusterSettings(engine_version="7.2"),
+                         CacheClusterSettings(engine='valkey', engine_version="7.1"),
+                         CacheClusterSettings(shards=0),
+                         CacheClusterSettings(replicas_per_shard=6)]:
+            with self.assertRaises(ValueError):
+                settings.validate()
+
+    def test_parameter_group_matches_engine_version(self):
+        for engine, version, cluster_mode, name in [('redis', "6.2", False, "default.redis6.x"),
+                                                    ('redis', "7.0", True, "default.redis7.cluster.on"),
+                                                    ('valkey', "8.0", False, "default.valkey8")]:
+            settings = CacheClusterSettings(engine=engine, engine_version=version, shards=2 if cluster_mode else 1)
+            settings.validate()
+            self.assertEqual(settings.parameter_group_name, name)
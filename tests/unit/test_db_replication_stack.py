@@ -0,0 +1,71 @@
+import unittest
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+from aws_cdk import aws_ec2 as ec2
+from cdk_demo.backend_stack import DatabaseSettings
+from cdk_demo.db_replication_stack import *
+from tests.unit.templates import build_backend_template
+
+SECONDARY_ENV = core.Environment(account='123456789012', region='us-west-2')
+
+
+def build_replication_template(**props_overrides):
+    app = core.App()
+    network_stack = core.Stack(app, "NetworkStackWest", env=SECONDARY_ENV)
+    vpc = ec2.Vpc(network_stack, "Vpc", max_azs=2)
+    props = DatabaseReplicationStackProps(
+        vpc=vpc,
+        private_subnets=vpc.private_subnets,
+        security_group_id=None,
+        global_db_name="global-db",
+        db_engine_version="15.3",
+        db_cluster_identifier="replica",
+        **props_overrides
+    )
+    stack = DatabaseReplicationStack(app, "DatabaseReplicationStack", props, env=SECONDARY_ENV)
+    return assertions.Template.from_stack(stack)
+
+
+class DatabaseReplicationStackTest(unittest.TestCase):
+
+    def test_secondary_cluster_joins_global_database(self):
+        template = build_replication_template(min_capacity=1, max_capacity=16, reader_count=2)
+
+        template.has_resource_properties("AWS::RDS::DBCluster", {
+            "GlobalClusterIdentifier": "global-db",
+            "EngineVersion": "15.3",
+            "ServerlessV2ScalingConfiguration": {"MinCapacity": 1, "MaxCapacity": 16}
+        })
+        template.resource_count_is("AWS::RDS::DBInstance", 2)
+        template.has_resource_properties("AWS::RDS::DBSubnetGroup", {
+            "SubnetIds": [{"Fn::ImportValue": assertions.Match.string_like_regexp("PrivateSubnet1")},
+                          {"Fn::ImportValue": assertions.Match.string_like_regexp("PrivateSubnet2")}]
+        })
+
+    def test_local_reader_endpoint_output(self):
+        template = build_replication_template()
+
+        template.resource_count_is("AWS::RDS::DBInstance", 1)
+        template.has_output("DatabaseReaderEndpoint", {
+            "Value": {"Fn::GetAtt": [assertions.Match.string_like_regexp("itfolderDBCluster"), "ReadEndpoint.Address"]}
+        })
+        template.has_resource_properties("AWS::EC2::SecurityGroup", {
+            "SecurityGroupIngress": [assertions.Match.object_like({"FromPort": 5432, "ToPort": 5432})]
+        })
+
+    def test_invalid_props(self):
+        for overrides in [dict(min_capacity=4, max_capacity=2), dict(reader_count=0)]:
+            with self.assertRaises(ValueError):
+                build_replication_template(**overrides)
+
+    def test_primary_and_secondary_clusters_agree_on_encryption(self):
+        primary = build_backend_template(database=DatabaseSettings(global_cluster_identifier="global-db"))
+        secondary = build_replication_template()
+
+        for template in [primary, secondary]:
+            clusters = template.find_resources("AWS::RDS::DBCluster")
+            self.assertEqual(len(clusters), 1)
+            properties = next(iter(clusters.values()))['Properties']
+            self.assertTrue(properties.get('StorageEncrypted'))
+            key = properties['KmsKeyId']['Fn::GetAtt'][0]
+            self.assertEqual(template.to_json()['Resources'][key]['Type'], "AWS::KMS::Key")
@@ -0,0 +1,114 @@
+import unittest
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+from aws_cdk import (
+    Stack,
+    aws_ec2 as ec2,
+    aws_elasticloadbalancingv2 as elbv2,
+    aws_ecs as ecs
+)
+from cdk_demo.elb_stack import *
+
+
+def build_elb_stack(**props_overrides):
+    app = core.App()
+    props_stack = Stack(app, "props")
+    vpc = ec2.Vpc(props_stack, "Vpc", max_azs=2)
+    props = ElbStackProps(
+        vpc=vpc,
+        public_subnets=vpc.public_subnets,
+        alb_security_group=ec2.SecurityGroup(props_stack, "ALBSG", vpc=vpc),
+        **props_overrides
+    )
+    return ElbStack(app, "ElbStack", props)
+
+
+def target_group_attributes(template, logical_id_prefix):
+    target_groups = template.find_resources("AWS::ElasticLoadBalancingV2::TargetGroup")
+    properties = next(resource["Properties"] for logical_id, resource in target_groups.items()
+                      if logical_id.startswith(logical_id_prefix))
+    return properties, {attribute["Key"]: attribute["Value"] for attribute in properties["TargetGroupAttributes"]}
+
+
+class ElbStackTest(unittest.TestCase):
+
+    def test_default_target_groups(self):
+        stack = build_elb_stack()
+        template = assertions.Template.from_stack(stack)
+
+        template.resource_count_is("AWS::ElasticLoadBalancingV2::TargetGroup", 4)
+        properties, attributes = target_group_attributes(template, "stagingApiTG")
+        # A dead target is out of rotation after 3 failed checks 15s apart
+        self.assertEqual(properties["HealthCheckIntervalSeconds"], 15)
+        self.assertEqual(properties["HealthCheckTimeoutSeconds"], 5)
+        self.assertEqual(properties["HealthyThresholdCount"], 2)
+        self.assertEqual(properties["UnhealthyThresholdCount"], 3)
+        self.assertEqual(properties["ProtocolVersion"], "HTTP1")
+        self.assertEqual(attributes["deregistration_delay.timeout_seconds"], "30")
+        self.assertEqual(attributes["load_balancing.algorithm.type"], "least_outstanding_requests")
+        self.assertEqual(attributes["stickiness.enabled"], "false")
+        self.assertNotIn("slow_start.duration_seconds", attributes)
+
+        properties, _ = target_group_attributes(template, "stagingFrontTG")
+        self.assertEqual(properties["Matcher"], {"HttpCode": "200-499"})
+        self.assertEqual(set(stack.outputs),
+                         {"http_listener", "staging_front_tg", "staging_api_tg", "prod_front_tg", "prod_api_tg"})
+
+    def test_load_balancer_attributes(self):
+        template = assertions.Template.from_stack(build_elb_stack(idle_timeout=core.Duration.seconds(120),
+                                                                  http2_enabled=False))
+
+        for attribute in [{"Key": "idle_timeout.timeout_seconds", "Value": "120"},
+                          {"Key": "routing.http2.enabled", "Value": "false"}]:
+            template.has_resource_properties("AWS::ElasticLoadBalancingV2::LoadBalancer", {
+                "LoadBalancerAttributes": assertions.Match.array_with([attribute])
+            })
+
+    def test_per_group_config(self):
+        stack = build_elb_stack(target_groups={
+            'prod_api': TargetGroupConfig(
+                health_check_path="/health",
+                health_check_interval=core.Duration.seconds(10),
+                health_check_timeout=core.Duration.seconds(4),
+                unhealthy_threshold_count=2,
+                deregistration_delay=core.Duration.seconds(60),
+                slow_start=core.Duration.seconds(90),
+                load_balancing_algorithm=elbv2.TargetGroupLoadBalancingAlgorithmType.ROUND_ROBIN,
+                stickiness_duration=core.Duration.hours(1),
+                protocol_version=elbv2.ApplicationProtocolVersion.HTTP2
+            )
+        })
+        template = assertions.Template.from_stack(stack)
+
+        properties, attributes = target_group_attributes(template, "prodApiTG")
+        self.assertEqual(properties["HealthCheckPath"], "/health")
+        self.assertEqual(properties["HealthCheckIntervalSeconds"], 10)
+        self.assertEqual(properties["HealthCheckTimeoutSeconds"], 4)
+        self.assertEqual(properties["UnhealthyThresholdCount"], 2)
+        self.assertEqual(properties["ProtocolVersion"], "HTTP2")
+        self.assertEqual(attributes["deregistration_delay.timeout_seconds"], "60")
+        self.assertEqual(attributes["slow_start.duration_seconds"], "90")
+        self.assertEqual(attributes["load_balancing.algorithm.type"], "round_robin")
+        self.assertEqual(attributes["stickiness.enabled"], "true")
+        self.assertEqual(attributes["stickiness.type"], "lb_cookie")
+        self.assertEqual(attributes["stickiness.lb_cookie.duration_seconds"], "3600")
+
+        # Groups that are not overridden keep their defaults
+        properties, _ = target_group_attributes(template, "stagingApiTG")
+        self.assertEqual(properties["HealthCheckIntervalSeconds"], 15)
+
+    def test_invalid_target_group_config(self):
+        for config in [TargetGroupConfig(health_check_interval=core.Duration.seconds(5),
+                                         health_check_timeout=core.Duration.seconds(5)),
+                       TargetGroupConfig(unhealthy_threshold_count=11),
+                       TargetGroupConfig(slow_start=core.Duration.seconds(60)),
+                       TargetGroupConfig(stickiness_duration=core.Duration.days(8))]:
+            with self.assertRaises(ValueError):
+                build_elb_stack(target_groups={'staging_api': config})
+
+    def test_target_type_follows_network_mode(self):
+        for network_mode, target_type in [(ecs.NetworkMode.BRIDGE, "instance"), (ecs.NetworkMode.AWS_VPC, "ip")]:
+            template = assertions.Template.from_stack(build_elb_stack(network_mode=network_mode))
+
+            target_groups = template.find_resources("AWS::ElasticLoadBalancingV2::TargetGroup")
+            self.assertEqual({group["Properties"]["TargetType"] for group in target_groups.values()}, {target_type})
@@ -0,0 +1,723 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from cdk_demo.lambda_functions import email_sender as email_lambda
+
+
+class FakeClient:
+    """Records every API call made against it instead of talking to AWS."""
+
+    def __init__(self, failing_recipients=()):
+        self.calls = []
+        self.failing_recipients = set(failing_recipients)
+
+    def __getattr__(self, operation):
+        def call(**kwargs):
+            self.calls.append((operation, kwargs))
+            if set(kwargs.get('Destination', {}).get('ToAddresses', [])) & self.failing_recipients:
+                raise RuntimeError("MessageRejected")
+            return {}
+        return call
+
+    def operations(self):
+        return [operation for operation, _ in self.calls]
+
+
+class FakeS3:
+    def __init__(self, objects):
+        self.objects = objects
+        self.keys = []
+
+    def get_object(self, Bucket, Key):
+        self.keys.append(Key)
+        return {'Body': io.BytesIO(json.dumps(self.objects[Key]).encode())}
+
+
+def make_record(message_id="1", to="to@example.com"):
+    return {
+        'messageId': message_id,
+        'receiptHandle': f"handle-{message_id}",
+        'eventSourceARN': "arn:aws:sqs:us-east-1:123456789012:cdk-demo--dev",
+        'body': json.dumps({
+            'Source': "from@example.com",
+            'Destination': {'ToAddresses': [to]},
+            'Message': {
+                'Subject': {'Data': "Hello"},
+                'Body': {'Html': {'Data': "<p>Hello</p>"}}
+            }
+        })
+    }
+
+
+def make_template_record(message_id="1", template="welcome", data=None, to="to@example.com", source="from@example.com"):
+    record = make_record(message_id)
+    record['body'] = json.dumps({
+        'Source': source,
+        'Destination': {'ToAddresses': [to]},
+        'Template': template,
+        'TemplateData': data if data is not None else {'name': "Ada", 'account': {'id': "42"}}
+    })
+    return record
+
+
+class ClientRegistryTest(unittest.TestCase):
+    def setUp(self):
+        email_lambda.reset_clients()
+        self.addCleanup(email_lambda.reset_clients)
+
+    def test_clients_created_once_per_environment(self):
+        with mock.patch.object(email_lambda, '_create_client', side_effect=lambda name: FakeClient()) as create:
+            event = {'Records': [make_record("1"), make_record("2")]}
+            email_lambda.lambda_handler(event, None)
+            email_lambda.lambda_handler(event, None)
+
+        self.assertEqual([call.args[0] for call in create.call_args_list], ['ses'])
+
+    def test_region_from_environment(self):
+        with mock.patch.dict('os.environ', {'AWS_REGION': "us-east-1", 'SES_REGION': "us-west-2"}):
+            self.assertEqual(email_lambda._region_for('ses'), "us-west-2")
+            self.assertEqual(email_lambda._region_for('sqs'), "us-east-1")
+
+    def test_client_config_uses_pool_size(self):
+        with mock.patch.dict('os.environ', {'AWS_REGION': "us-east-1", 'BOTO_MAX_POOL_CONNECTIONS': "25"}):
+            client = email_lambda._create_client('ses')
+
+        self.assertEqual(client.meta.region_name, "us-east-1")
+        self.assertEqual(client.meta.config.max_pool_connections, 25)
+        self.assertTrue(client.meta.config.tcp_keepalive)
+
+
+class PartialBatchResponseTest(unittest.TestCase):
+    def setUp(self):
+        self.ses = FakeClient(failing_recipients=["bounce@example.com"])
+        self.sqs = FakeClient()
+        email_lambda.set_client('ses', self.ses)
+        email_lambda.set_client('sqs', self.sqs)
+        self.addCleanup(email_lambda.reset_clients)
+
+    def test_happy_path_makes_one_ses_call_per_email_and_no_sqs_calls(self):
+        event = {'Records': [make_record(str(i)) for i in range(10)]}
+
+        response = email_lambda.lambda_handler(event, None)
+
+        self.assertEqual(response, {'batchItemFailures': []})
+        self.assertEqual(self.ses.operations(), ['send_email'] * 10)
+        self.assertEqual(self.sqs.calls, [])
+
+    def test_only_failed_records_are_reported(self):
+        malformed = make_record("3")
+        malformed['body'] = "not json"
+        event = {'Records': [make_record("1"), make_record("2", to="bounce@example.com"), malformed]}
+
+        response = email_lambda.lambda_handler(event, None)
+
+        self.assertEqual(response, {'batchItemFailures': [{'itemIdentifier': "2"}, {'itemIdentifier': "3"}]})
+        self.assertEqual(len(self.ses.calls), 2)
+        self.assertEqual(self.sqs.calls, [])
+
+
+class ConcurrentSendTest(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(email_lambda.reset_clients)
+
+    def test_sends_run_concurrently_up_to_the_pool_size(self):
+        lock = threading.Lock()
+        state = {'active': 0, 'peak': 0}
+
+        class SlowSes(FakeClient):
+            def send_email(self, **kwargs):
+                with lock:
+                    state['active'] += 1
+                    state['peak'] = max(state['peak'], state['active'])
+                time.sleep(0.02)
+                with lock:
+                    state['active'] -= 1
+                return super().__getattr__('send_email')(**kwargs)
+
+        email_lambda.set_client('ses', SlowSes())
+        event = {'Records': [make_record(str(i)) for i in range(12)]}
+        with mock.patch.dict('os.environ', {'SEND_CONCURRENCY': "4"}):
+            response = email_lambda.lambda_handler(event, None)
+
+        self.assertEqual(response, {'batchItemFailures': []})
+        self.assertEqual(state['peak'], 4)
+
+    def test_failures_map_back_to_their_records(self):
+        email_lambda.set_client('ses', FakeClient(failing_recipients=["bounce@example.com"]))
+        recipients = ["bounce@example.com" if i % 3 == 0 else "to@example.com" for i in range(9)]
+        event = {'Records': [make_record(str(i), to=to) for i, to in enumerate(recipients)]}
+        with mock.patch.dict('os.environ', {'SEND_CONCURRENCY': "3"}):
+            response = email_lambda.lambda_handler(event, None)
+
+        self.assertEqual(response, {'batchItemFailures': [{'itemIdentifier': i} for i in ["0", "3", "6"]]})
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_paces_acquisitions_at_the_configured_rate(self):
+        now = [0.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+
+        bucket = email_lambda.TokenBucket(rate=2, capacity=2, clock=lambda: now[0], sleep=sleep)
+        for _ in range(6):
+            bucket.acquire()
+
+        # Two tokens of burst, then one token every half second
+        self.assertEqual(sleeps, [0.5, 0.5, 0.5, 0.5])
+        self.assertEqual(now[0], 2.0)
+
+    def test_rejects_non_positive_rate(self):
+        with self.assertRaises(ValueError):
+            email_lambda.TokenBucket(rate=0)
+
+
+class TemplateRenderingTest(unittest.TestCase):
+    def setUp(self):
+        self.ses = FakeClient()
+        email_lambda.set_client('ses', self.ses)
+        email_lambda.reset_templates()
+        self.addCleanup(email_lambda.reset_clients)
+        self.addCleanup(email_lambda.reset_templates)
+
+    def test_renders_bundled_template(self):
+        response = email_lambda.lambda_handler({'Records': [make_template_record()]}, None)
+
+        self.assertEqual(response, {'batchItemFailures': []})
+        message = self.ses.calls[0][1]['Message']
+        self.assertEqual(message['Subject']['Data'], "Welcome to CDK Demo, Ada")
+        self.assertIn("<strong>42</strong>", message['Body']['Html']['Data'])
+        self.assertEqual(message['Body']['Text']['Data'], "Hello Ada,\r\nYour account 42 is ready.")
+
+    def test_html_variables_are_escaped_and_missing_ones_render_empty(self):
+        template = email_lambda.EmailTemplate({
+            'TemplateName': "t",
+            'SubjectPart': "Hi {{ name }}",
+            'HtmlPart': "<p>{{name}}{{missing.key}}</p>"
+        })
+
+        rendered = template.render({'name': "<Ada & Co>"})
+
+        self.assertEqual(rendered['subject'], "Hi <Ada & Co>")
+        self.assertEqual(rendered['html'], "<p>&lt;Ada &amp; Co&gt;</p>")
+        self.assertIsNone(rendered['text'])
+
+    def test_template_data_may_be_a_json_string(self):
+        record = make_template_record(data=json.dumps({'name': "Grace"}))
+
+        email_lambda.lambda_handler({'Records': [record]}, None)
+
+        self.assertEqual(self.ses.calls[0][1]['Message']['Subject']['Data'], "Welcome to CDK Demo, Grace")
+
+    def test_pre_rendered_messages_still_work(self):
+        email_lambda.lambda_handler({'Records': [make_record()]}, None)
+
+        self.assertEqual(self.ses.calls[0][1]['Message'], {
+            'Subject': {'Data': "Hello", 'Charset': 'UTF-8'},
+            'Body': {'Html': {'Data': "<p>Hello</p>", 'Charset': 'UTF-8'}}
+        })
+
+    def test_templates_are_loaded_once_and_served_from_cache(self):
+        s3 = FakeS3({'v1/promo.json': {'TemplateName': "promo", 'SubjectPart': "Sale", 'HtmlPart': "<p>{{pct}}%</p>"}})
+        email_lambda.set_client('s3', s3)
+        env = {'TEMPLATE_DIR': tempfile.mkdtemp(), 'TEMPLATE_BUCKET': "templates", 'TEMPLATE_PREFIX': "v1/"}
+        with mock.patch.dict('os.environ', env):
+            event = {'Records': [make_template_record(str(i), template="promo", data={'pct': 10}) for i in range(5)]}
+            email_lambda.lambda_handler(event, None)
+            email_lambda.lambda_handler(event, None)
+
+        self.assertEqual(s3.keys, ["v1/promo.json"])
+        self.assertEqual(len(self.ses.calls), 10)
+        self.assertEqual(self.ses.calls[-1][1]['Message']['Body']['Html']['Data'], "<p>10%</p>")
+
+    def test_concurrent_misses_load_each_template_once_without_blocking_others(self):
+        promo_started = threading.Event()
+        release_promo = threading.Event()
+        promo_loaded = threading.Event()
+        loads = []
+
+        class SlowStore:
+            def load(self, name):
+                loads.append(name)
+                if name == "promo":
+                    promo_started.set()
+                    release_promo.wait(5)
+                    promo_loaded.set()
+                return {'TemplateName': name, 'SubjectPart': name, 'HtmlPart': "<p></p>"}
+
+        with mock.patch.object(email_lambda, '_template_store', SlowStore()):
+            promo_threads = [threading.Thread(target=email_lambda.get_template, args=("promo",)) for _ in range(3)]
+            for thread in promo_threads:
+                thread.start()
+            promo_started.wait(5)
+            # A different template loads while promo is still loading
+            self.assertEqual(email_lambda.get_template("welcome").render({})['subject'], "welcome")
+            self.assertFalse(promo_loaded.is_set())
+            release_promo.set()
+            for thread in promo_threads:
+                thread.join(5)
+
+        self.assertEqual(sorted(loads), ["promo", "welcome"])
+
+    def test_unknown_template_fails_only_its_record(self):
+        event = {'Records': [make_template_record("1", template="missing"), make_template_record("2")]}
+        with mock.patch.dict('os.environ', {'SEND_CONCURRENCY': "1"}):
+            response = email_lambda.lambda_handler(event, None)
+
+        self.assertEqual(response, {'batchItemFailures': [{'itemIdentifier': "1"}]})
+
+    def test_rejects_template_names_with_path_separators(self):
+        with self.assertRaises(ValueError):
+            email_lambda.TemplateStore(template_dir=os.path.dirname(__file__)).load("../test_email_lambda")
+
+
+class LRUCacheTest(unittest.TestCase):
+    def test_evicts_least_recently_used_entry(self):
+        cache = email_lambda.LRUCache(max_size=2, ttl=60)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(len(cache), 2)
+
+    def test_entries_expire_after_ttl(self):
+        now = [0.0]
+        cache = email_lambda.LRUCache(max_size=2, ttl=10, clock=lambda: now[0])
+        cache.put('a', 1)
+
+        now[0] = 9.9
+        self.assertEqual(cache.get('a'), 1)
+        now[0] = 10
+        self.assertIsNone(cache.get('a'))
+
+
+class BulkSes(FakeClient):
+    """SES stub whose bulk sends fail for the configured recipients."""
+
+    def send_bulk_templated_email(self, **kwargs):
+        self.calls.append(('send_bulk_templated_email', kwargs))
+        statuses = []
+        for destination in kwargs['Destinations']:
+            if set(destination['Destination']['ToAddresses']) & self.failing_recipients:
+                statuses.append({'Status': 'MessageRejected', 'Error': "rejected"})
+            else:
+                statuses.append({'Status': 'Success', 'MessageId': "id"})
+        return {'Status': statuses}
+
+
+class BulkSendTest(unittest.TestCase):
+    def setUp(self):
+        self.ses = BulkSes(failing_recipients=["bounce@example.com"])
+        email_lambda.set_client('ses', self.ses)
+        email_lambda.reset_templates()
+        self.addCleanup(email_lambda.reset_clients)
+        self.addCleanup(email_lambda.reset_templates)
+        patcher = mock.patch.dict('os.environ', {'BULK_SEND_ENABLED': "true"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_same_template_messages_are_sent_in_chunks_of_50(self):
+        event = {'Records': [make_template_record(str(i), to=f"user{i}@example.com") for i in range(120)]}
+
+        response = email_lambda.lambda_handler(event, None)
+
+        self.assertEqual(response, {'batchItemFailures': []})
+        self.assertEqual(self.ses.operations(), ['send_bulk_templated_email'] * 3)
+        sizes = sorted(len(kwargs['Destinations']) for _, kwargs in self.ses.calls)
+        self.assertEqual(sizes, [20, 50, 50])
+        first = self.ses.calls[0][1]
+        self.assertEqual(first['Template'], "welcome")
+        self.assertEqual(json.loads(first['Destinations'][0]['ReplacementTemplateData'])['name'], "Ada")
+
+    def test_per_destination_failures_map_back_to_records(self):
+        recipients = ["to@example.com", "bounce@example.com", "to@example.com", "bounce@example.com"]
+        event = {'Records': [make_template_record(str(i), to=to) for i, to in enumerate(recipients)]}
+
+        response = email_lambda.lambda_handler(event, None)
+
+        self.assertEqual(response, {'batchItemFailures': [{'itemIdentifier': "1"}, {'itemIdentifier': "3"}]})
+        self.assertEqual(self.ses.operations(), ['send_bulk_templated_email'])
+
+    def test_failed_bulk_call_fails_every_record_of_the_group(self):
+        self.ses.send_bulk_templated_email = mock.Mock(side_effect=RuntimeError("Throttling"))
+        event = {'Records': [make_template_record("1"), make_template_record("2"), make_record("3")]}
+
+        response = email_lambda.lambda_handler(event, None)
+
+        self.assertEqual(response, {'batchItemFailures': [{'itemIdentifier': "1"}, {'itemIdentifier': "2"}]})
+
+    def test_unpublished_templates_fall_back_to_single_sends(self):
+        error = RuntimeError("TemplateDoesNotExist")
+        error.response = {'Error': {'Code': 'TemplateDoesNotExist'}}
+        self.ses.send_bulk_templated_email = mock.Mock(side_effect=error)
+        recipients = ["to@example.com", "bounce@example.com", "to@example.com"]
+        event = {'Records': [make_template_record(str(i), to=to) for i, to in enumerate(recipients)]}
+
+        response = email_lambda.lambda_handler(event, None)
+
+        self.assertEqual(response, {'batchItemFailures': [{'itemIdentifier': "1"}]})
+        self.ses.send_bulk_templated_email.assert_called_once()
+        self.assertEqual(self.ses.operations(), ['send_email'] * 3)
+        self.assertIn("Ada", self.ses.calls[0][1]['Message']['Body']['Text']['Data'])
+
+    def test_unusable_template_data_fails_only_its_record(self):
+        # parse_record rejects such messages, the group still guards against them
+        records = [make_template_record(str(i), to=f"user{i}@example.com") for i in range(6)]
+        members = [(record, json.loads(record['body'])) for record in records]
+        members[5][1]['TemplateData'] = "{not json"
+        metrics = email_lambda.Metrics("Test/Email", {'FunctionName': "f"})
+
+        results = email_lambda._send_group(self.ses, members, None, metrics)
+
+        self.assertEqual(sorted(results), [(str(i), i != 5) for i in range(6)])
+        self.assertEqual(self.ses.operations(), ['send_bulk_templated_email'])
+        self.assertEqual(len(self.ses.calls[0][1]['Destinations']), 5)
+        document = metrics.to_emf()
+        self.assertEqual(document['RenderErrors'], 1)
+        self.assertNotIn('SesErrors', document)
+
+    def test_grouping_splits_bulk_groups_from_single_sends(self):
+        records = [
+            make_template_record("0", template="welcome"),
+            make_template_record("1", template="welcome"),
+            make_template_record("2", template="welcome", source="other@example.com"),
+            make_template_record("3", template="promo"),
+            make_record("4"),
+        ]
+        parsed = [(record, json.loads(record['body'])) for record in records]
+
+        bulk_groups, singles = email_lambda.group_messages(parsed, bulk_enabled=True)
+
+        self.assertEqual([[record['messageId'] for record, _ in group] for group in bulk_groups], [["0", "1"]])
+        self.assertEqual(sorted(record['messageId'] for record, _ in singles), ["2", "3", "4"])
+
+    def test_bulk_send_is_opt_in(self):
+        records = [make_template_record(str(i)) for i in range(3)]
+        parsed = [(record, json.loads(record['body'])) for record in records]
+
+        bulk_groups, singles = email_lambda.group_messages(parsed)
+
+        self.assertEqual(bulk_groups, [])
+        self.assertEqual(len(singles), 3)
+
+
+class IdempotencyTest(unittest.TestCase):
+    def setUp(self):
+        self.ses = FakeClient(failing_recipients=["bounce@example.com"])
+        self.store = email_lambda.InMemoryIdempotencyStore()
+        email_lambda.set_client('ses', self.ses)
+        email_lambda.set_idempotency_store(self.store)
+        self.addCleanup(email_lambda.reset_clients)
+        self.addCleanup(email_lambda.reset_idempotency_store)
+
+    def test_redelivered_message_is_not_sent_again(self):
+        event = {'Records': [make_record("1"), make_record("2")]}
+
+        email_lambda.lambda_handler(event, None)
+        response = email_lambda.lambda_handler(event, None)
+
+        self.assertEqual(response, {'batchItemFailures': []})
+        self.assertEqual(len(self.ses.calls), 2)
+
+    def test_failed_send_releases_its_claim(self):
+        event = {'Records': [make_record("1", to="bounce@example.com")]}
+
+        email_lambda.lambda_handler(event, None)
+        self.ses.failing_recipients.clear()
+        response = email_lambda.lambda_handler(event, None)
+
+        self.assertEqual(response, {'batchItemFailures': []})
+        self.assertEqual(len(self.ses.calls), 2)
+
+    def test_content_hash_deduplicates_identical_messages(self):
+        event = {'Records': [make_record("1"), make_record("2"), make_record("3", to="other@example.com")]}
+        with mock.patch.dict('os.environ', {'IDEMPOTENCY_KEY_SOURCE': "content"}):
+            response = email_lambda.lambda_handler(event, None)
+            failed = response['batchItemFailures']
+            redelivered = [record for record in event['Records'] if {'itemIdentifier': record['messageId']} in failed]
+            retry = email_lambda.lambda_handler({'Records': redelivered}, None)
+
+        # One of the identical pair loses the claim race and is retried, then skipped as sent
+        self.assertEqual(len(failed), 1)
+        self.assertIn(failed[0]['itemIdentifier'], ["1", "2"])
+        self.assertEqual(retry, {'batchItemFailures': []})
+        self.assertEqual(len(self.ses.calls), 2)
+
+    def test_in_progress_claims_are_retried(self):
+        event = {'Records': [make_record("1")]}
+        key = email_lambda.idempotency_key(event['Records'][0], email_lambda.parse_record(event['Records'][0]))
+        self.store.claim(key)
+
+        response = email_lambda.lambda_handler(event, None)
+        self.assertEqual(response, {'batchItemFailures': [{'itemIdentifier': "1"}]})
+        self.assertEqual(self.ses.calls, [])
+
+        self.store.release(key)
+        response = email_lambda.lambda_handler(event, None)
+        self.assertEqual(response, {'batchItemFailures': []})
+        self.assertEqual(len(self.ses.calls), 1)
+
+    def test_store_errors_fail_the_record(self):
+        self.store.claim = mock.Mock(side_effect=RuntimeError("ProvisionedThroughputExceeded"))
+
+        response = email_lambda.lambda_handler({'Records': [make_record("1")]}, None)
+
+        self.assertEqual(response, {'batchItemFailures': [{'itemIdentifier': "1"}]})
+        self.assertEqual(self.ses.calls, [])
+
+    def test_claims_expire(self):
+        now = [0.0]
+        store = email_lambda.InMemoryIdempotencyStore(ttl=60, in_progress_ttl=10, clock=lambda: now[0])
+        self.assertEqual(store.claim("key"), email_lambda.CLAIMED)
+        now[0] = 9
+        self.assertEqual(store.claim("key"), email_lambda.IN_PROGRESS)
+        store.complete("key")
+
+        now[0] = 68
+        self.assertEqual(store.claim("key"), email_lambda.COMPLETED)
+        now[0] = 69
+        self.assertEqual(store.claim("key"), email_lambda.CLAIMED)
+        now[0] = 79
+        self.assertEqual(store.claim("key"), email_lambda.CLAIMED)
+
+    def test_cache_answers_hot_duplicates_without_the_backing_store(self):
+        backing = mock.Mock(wraps=email_lambda.InMemoryIdempotencyStore())
+        store = email_lambda.CachedIdempotencyStore(backing, email_lambda.LRUCache(max_size=10, ttl=60))
+
+        self.assertEqual(store.claim("key"), email_lambda.CLAIMED)
+        store.complete("key")
+        self.assertEqual(store.claim("key"), email_lambda.COMPLETED)
+
+        self.assertEqual(backing.claim.call_count, 1)
+
+
+class ConditionalCheckFailed(Exception):
+    def __init__(self, item=None):
+        super().__init__("ConditionalCheckFailedException")
+        self.response = {'Error': {'Code': 'ConditionalCheckFailedException'}}
+        if item is not None:
+            self.response['Item'] = item
+
+
+class DynamoDBIdempotencyStoreTest(unittest.TestCase):
+    def test_claim_is_a_conditional_write(self):
+        client = FakeClient()
+        store = email_lambda.DynamoDBIdempotencyStore("table", ttl=60, in_progress_ttl=30, client=client, clock=lambda: 1000)
+
+        self.assertEqual(store.claim("key"), email_lambda.CLAIMED)
+        store.complete("key")
+        store.release("key")
+
+        (_, claim), (_, complete), (_, release) = client.calls
+        self.assertEqual(claim['ConditionExpression'], "attribute_not_exists(id) OR expires_at < :now")
+        self.assertEqual(claim['ExpressionAttributeValues'], {':now': {'N': "1000"}})
+        self.assertEqual(claim['ReturnValuesOnConditionCheckFailure'], "ALL_OLD")
+        self.assertEqual(claim['Item'], {'id': {'S': "key"}, 'status': {'S': "IN_PROGRESS"}, 'expires_at': {'N': "1030"}})
+        self.assertEqual(complete['Item']['status'], {'S': "COMPLETED"})
+        self.assertEqual(complete['Item']['expires_at'], {'N': "1060"})
+        self.assertEqual(release, {'TableName': "table", 'Key': {'id': {'S': "key"}}})
+
+    def test_completed_conflicts_are_duplicates(self):
+        client = mock.Mock()
+        client.put_item.side_effect = ConditionalCheckFailed({'id': {'S': "key"}, 'status': {'S': "COMPLETED"}})
+        store = email_lambda.DynamoDBIdempotencyStore("table", client=client)
+
+        self.assertEqual(store.claim("key"), email_lambda.COMPLETED)
+
+    def test_in_progress_conflicts_are_retried(self):
+        client = mock.Mock()
+        store = email_lambda.DynamoDBIdempotencyStore("table", client=client)
+
+        for error in [ConditionalCheckFailed({'id': {'S': "key"}, 'status': {'S': "IN_PROGRESS"}}),
+                      ConditionalCheckFailed()]:
+            client.put_item.side_effect = error
+            self.assertEqual(store.claim("key"), email_lambda.IN_PROGRESS)
+
+    def test_other_errors_propagate(self):
+        client = mock.Mock()
+        client.put_item.side_effect = RuntimeError("AccessDenied")
+        store = email_lambda.DynamoDBIdempotencyStore("table", client=client)
+
+        with self.assertRaises(RuntimeError):
+            store.claim("key")
+
+
+class ValidationTest(unittest.TestCase):
+    DLQ_ARN = "arn:aws:sqs:us-east-1:123456789012:cdk-demo--dev-dlq"
+
+    def setUp(self):
+        self.ses = FakeClient()
+        self.sqs = mock.Mock()
+        self.sqs.send_message_batch.side_effect = lambda QueueUrl, Entries: {
+            'Successful': [{'Id': entry['Id']} for entry in Entries]}
+        email_lambda.set_client('ses', self.ses)
+        email_lambda.set_client('sqs', self.sqs)
+        self.addCleanup(email_lambda.reset_clients)
+        patcher = mock.patch.dict('os.environ', {'DEAD_LETTER_QUEUE_ARN': self.DLQ_ARN})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_invalid_records(self):
+        not_json = make_record("2")
+        not_json['body'] = "{not json"
+        not_object = make_record("3")
+        not_object['body'] = "[1, 2]"
+        missing_subject = make_record("4")
+        body = json.loads(missing_subject['body'])
+        del body['Message']['Subject']
+        missing_subject['body'] = json.dumps(body)
+        return [not_json, not_object, missing_subject]
+
+    def test_invalid_records_go_to_the_dead_letter_queue_without_retry(self):
+        event = {'Records': [make_record("1")] + self.make_invalid_records()}
+
+        response = email_lambda.lambda_handler(event, None)
+
+        self.assertEqual(response, {'batchItemFailures': []})
+        self.assertEqual(len(self.ses.calls), 1)
+        self.sqs.send_message_batch.assert_called_once()
+        kwargs = self.sqs.send_message_batch.call_args.kwargs
+        self.assertEqual(kwargs['QueueUrl'], "https://sqs.us-east-1.amazonaws.com/123456789012/cdk-demo--dev-dlq")
+        self.assertEqual([entry['MessageAttributes']['SourceMessageId']['StringValue'] for entry in kwargs['Entries']],
+                         ["2", "3", "4"])
+        self.assertEqual(kwargs['Entries'][2]['MessageAttributes']['ValidationError']['StringValue'],
+                         "$.Message.Subject is required")
+
+    def test_invalid_records_are_retried_when_the_dead_letter_queue_is_unavailable(self):
+        self.sqs.send_message_batch.side_effect = RuntimeError("AccessDenied")
+
+        response = email_lambda.lambda_handler({'Records': self.make_invalid_records()}, None)
+
+        self.assertEqual(response, {'batchItemFailures': [{'itemIdentifier': i} for i in ["2", "3", "4"]]})
+
+    def test_happy_path_makes_no_sqs_calls(self):
+        email_lambda.lambda_handler({'Records': [make_record("1"), make_template_record("2")]}, None)
+
+        self.sqs.send_message_batch.assert_not_called()
+
+    def test_schema(self):
+        valid = [
+            json.loads(make_record()['body']),
+            json.loads(make_template_record()['body']),
+            {'Source': "a@example.com", 'Destination': {'BccAddresses': ["b@example.com"]}, 'Template': "t",
+             'TemplateData': "{}"},
+        ]
+        invalid = [
+            {'Destination': {'ToAddresses': ["b@example.com"]}, 'Template': "t"},
+            {'Source': "a@example.com", 'Destination': {}, 'Template': "t"},
+            {'Source': "a@example.com", 'Destination': {'ToAddresses': "b@example.com"}, 'Template': "t"},
+            {'Source': "a@example.com", 'Destination': {'ToAddresses': ["b@example.com"]}},
+            {'Source': "a@example.com", 'Destination': {'ToAddresses': ["b@example.com"]}, 'Template': 1},
+            {'Source': "a@example.com", 'Destination': {'ToAddresses': ["b@example.com"]}, 'Template': "t",
+             'TemplateData': True},
+        ]
+        for message in valid:
+            email_lambda.validate_message(message)
+        for message in invalid:
+            with self.assertRaises(email_lambda.ValidationError):
+                email_lambda.validate_message(message)
+
+    def test_unrenderable_templates_are_rejected(self):
+        for template, data in [("welcome", "{not json"), ("welcome", "[1, 2]"), ("../welcome", {})]:
+            record = make_template_record(template=template, data=data)
+            with self.assertRaises(email_lambda.ValidationError):
+                email_lambda.parse_record(record)
+
+        message = email_lambda.parse_record(make_template_record(data='{"name": "Ada"}'))
+        self.assertEqual(message['TemplateData'], {'name': "Ada"})
+
+
+class ThrottledSes(FakeClient):
+    def send_email(self, **kwargs):
+        self.calls.append(('send_email', kwargs))
+        if kwargs['Destination']['ToAddresses'] == ["bounce@example.com"]:
+            error = RuntimeError("Throttling")
+            error.response = {'Error': {'Code': 'Throttling'}}
+            raise error
+        return {}
+
+
+class EmbeddedMetricsTest(unittest.TestCase):
+    def setUp(self):
+        email_lambda.set_client('ses', ThrottledSes())
+        self.addCleanup(email_lambda.reset_clients)
+        patcher = mock.patch.dict('os.environ', {'METRICS_NAMESPACE': "Test/Email", 'SEND_CONCURRENCY': "1"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def invoke(self, event):
+        context = mock.Mock(function_name="SendEmailFromSQS-dev", aws_request_id="request-1")
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            email_lambda.lambda_handler(event, context)
+        return output.getvalue().splitlines()
+
+    def test_one_emf_line_per_invocation_and_error_code(self):
+        malformed = make_record("4")
+        malformed['body'] = "oops"
+        event = {'Records': [make_record("1"), make_record("2"), make_record("3", to="bounce@example.com"), malformed]}
+        with mock.patch.object(email_lambda, '_cold_start', True):
+            lines = self.invoke(event)
+
+        self.assertEqual(len(lines), 2)
+        document, by_code = [json.loads(line) for line in lines]
+        directive = document['_aws']['CloudWatchMetrics'][0]
+        self.assertEqual(directive['Namespace'], "Test/Email")
+        self.assertEqual(directive['Dimensions'], [["FunctionName"]])
+        units = {metric['Name']: metric['Unit'] for metric in directive['Metrics']}
+        self.assertEqual(units['BatchLatency'], 'Milliseconds')
+        self.assertEqual(set(units), {
+            'ColdStart', 'BatchSize', 'ParseLatency', 'Rejected', 'SesLatency', 'RecordLatency',
+            'SesErrors', 'Failures', 'BatchLatency'
+        })
+        self.assertEqual(document['FunctionName'], "SendEmailFromSQS-dev")
+        self.assertEqual(document['RequestId'], "request-1")
+        self.assertEqual(document['ColdStart'], 1)
+        self.assertEqual(document['BatchSize'], 4)
+        self.assertEqual(document['Rejected'], 1)
+        self.assertEqual(document['SesErrors'], 1)
+        self.assertEqual(document['Failures'], 2)
+        self.assertEqual(len(document['RecordLatency']), 3)
+        self.assertIsInstance(document['BatchLatency'], float)
+
+        directive = by_code['_aws']['CloudWatchMetrics'][0]
+        self.assertEqual(directive['Dimensions'], [["ErrorCode", "FunctionName"]])
+        self.assertEqual(directive['Metrics'], [{'Name': 'SesErrors', 'Unit': 'Count'}])
+        self.assertEqual(by_code['ErrorCode'], "Throttling")
+        self.assertEqual(by_code['FunctionName'], "SendEmailFromSQS-dev")
+        self.assertEqual(by_code['SesErrors'], 1)
+
+    def test_only_the_first_invocation_is_a_cold_start(self):
+        with mock.patch.object(email_lambda, '_cold_start', True):
+            first = json.loads(self.invoke({'Records': [make_record("1")]})[0])
+            second = json.loads(self.invoke({'Records': [make_record("2")]})[0])
+
+        self.assertEqual(first['ColdStart'], 1)
+        self.assertEqual(second['ColdStart'], 0)
+
+    def test_latency_values_are_capped_at_the_emf_limit(self):
+        metrics = email_lambda.Metrics("Test/Email", {'FunctionName': "f"}, clock=lambda: 1.5)
+        for value in range(250):
+            metrics.put('RecordLatency', value)
+
+        document = metrics.to_emf()
+
+        self.assertEqual(document['_aws']['Timestamp'], 1500)
+        self.assertEqual(len(document['RecordLatency']), 100)
+        self.assertEqual(document['RecordLatency'][:3], [0, 2, 5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from aws_cdk import DockerImage, aws_lambda as lambda_
+from cdk_demo.lambda_packaging import LocalPythonBundling, read_requirements
+
+SOURCE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "cdk_demo", "lambda_functions")
+
+
+class LambdaPackagingTest(unittest.TestCase):
+    def temp_dir(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        return temp_dir.name
+
+    def bundle(self, source_dir, architecture=lambda_.Architecture.ARM_64):
+        output_dir = self.temp_dir()
+        bundling = LocalPythonBundling(source_dir, "email_sender", ["templates"], "requirements.txt",
+                                       architecture, "3.11")
+        self.assertTrue(bundling.try_bundle(output_dir, image=DockerImage.from_registry("python")))
+        return output_dir
+
+    def test_bundle_contains_only_the_handler_and_its_templates(self):
+        # A copy of the sources, so the build leftovers never touch the real tree
+        source_dir = os.path.join(self.temp_dir(), "lambda_functions")
+        shutil.copytree(SOURCE_DIR, source_dir, ignore=shutil.ignore_patterns("__pycache__"))
+        os.makedirs(os.path.join(source_dir, "__pycache__"))
+        open(os.path.join(source_dir, "__pycache__", "email_sender.cpython-311.pyc"), "w").close()
+
+        output_dir = self.bundle(source_dir)
+
+        files = sorted(os.path.relpath(os.path.join(root, name), output_dir)
+                       for root, _, names in os.walk(output_dir) for name in names)
+        self.assertEqual(files, ["email_sender.py", os.path.join("templates", "welcome.json")])
+
+    def test_pinned_requirements_are_installed_for_the_architecture(self):
+        source_dir = self.temp_dir()
+        os.makedirs(os.path.join(source_dir, "templates"))
+        open(os.path.join(source_dir, "email_sender.py"), "w").close()
+        with open(os.path.join(source_dir, "requirements.txt"), "w") as requirements_file:
+            requirements_file.write("# pinned\nrequests==2.31.0  # http\n\n")
+
+        with mock.patch("subprocess.run") as run:
+            output_dir = self.bundle(source_dir)
+
+        command = run.call_args.args[0]
+        self.assertEqual(command[command.index("--target") + 1], output_dir)
+        self.assertEqual(command[command.index("--platform") + 1], "manylinux2014_aarch64")
+        self.assertEqual(command[-1], "requests==2.31.0")
+
+    def test_read_requirements_skips_comments(self):
+        self.assertEqual(read_requirements(os.path.join(SOURCE_DIR, "requirements.txt")), [])
+        self.assertEqual(read_requirements(os.path.join(SOURCE_DIR, "missing.txt")), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,17 +1,25 @@
 import unittest
+import pytest
 import aws_cdk as core
 import aws_cdk.assertions as assertions
-from cdk_demo.network_stack import NetworkStack  # Replace with your actual import
+from aws_cdk import aws_ec2 as ec2
+from cdk_demo.network_stack import NetworkStack, subnet_tiers  # Replace with your actual import
+from tests.unit.templates import AZS
 
+
+def private_subnet_nat_routes(template):
+    """Map each private subnet's default route to the NAT gateway it uses."""
+    routes = template.find_resources("AWS::EC2::Route", {"Properties": {"NatGatewayId": assertions.Match.any_value()}})
+    return {name.split("DefaultRoute")[0]: route["Properties"]["NatGatewayId"]["Ref"].split("NATGateway")[0]
+            for name, route in routes.items()}
+
+
+@pytest.mark.usefixtures("shared_network_stack")
 class NetworkStackTest(unittest.TestCase):
+    # self.stack and self.template are the default configuration, synthesized once per session
 
     def test_vpc_creation(self):
-        # Create the app and the stack
-        app = core.App()
-        stack = NetworkStack(app, "NetworkStack", vpc_name="MyVpc", vpc_cidr="10.0.0.0/16", availability_zones=["us-west-2a", "us-west-2b", "us-west-2c"])
-
-        # Prepare the assertion
-        template = assertions.Template.from_stack(stack)
+        template = self.template
 
         # Assert the VPC is created with the correct properties
         template.resource_count_is("AWS::EC2::VPC", 1)
@@ -27,9 +35,121 @@ class NetworkStackTest(unittest.TestCase):
         template.resource_count_is("AWS::EC2::Subnet", 6)  # Adjust count based on your subnet configuration
 
         # Assert the NAT gateways are created
-        template.resource_count_is("AWS::EC2::NatGateway", 2)
+        # One per AZ by default
+        template.resource_count_is("AWS::EC2::NatGateway", 3)
 
         # Additional assertions can be made depending on your requirements
 
+    def test_gateway_endpoints(self):
+        stack, template = self.stack, self.template
+
+        for service in ["s3", "dynamodb"]:
+            template.has_resource_properties("AWS::EC2::VPCEndpoint", {
+                "VpcEndpointType": "Gateway",
+                "ServiceName": {"Fn::Join": ["", ["com.amazonaws.", {"Ref": "AWS::Region"}, f".{service}"]]}
+            })
+        self.assertEqual(set(stack.outputs['gateway_endpoints']), {"s3", "dynamodb"})
+
+    def test_default_interface_endpoints(self):
+        stack, template = self.stack, self.template
+
+        interface_endpoints = template.find_resources("AWS::EC2::VPCEndpoint", {"Properties": {"VpcEndpointType": "Interface"}})
+        self.assertEqual(len(interface_endpoints), 5)
+        template.has_resource_properties("AWS::EC2::VPCEndpoint", {
+            "VpcEndpointType": "Interface",
+            "ServiceName": {"Fn::Join": ["", ["com.amazonaws.", {"Ref": "AWS::Region"}, ".sqs"]]},
+            "PrivateDnsEnabled": True,
+            "SecurityGroupIds": [{"Fn::GetAtt": [assertions.Match.string_like_regexp("EndpointSG"), "GroupId"]}]
+        })
+        template.has_resource_properties("AWS::EC2::SecurityGroup", {
+            "GroupDescription": "VPC interface endpoint security group",
+            "SecurityGroupIngress": [assertions.Match.object_like({
+                "CidrIp": {"Fn::GetAtt": [assertions.Match.any_value(), "CidrBlock"]},
+                "FromPort": 443,
+                "ToPort": 443
+            })]
+        })
+        self.assertEqual(set(stack.outputs['interface_endpoints']),
+                         {"sqs", "ecr.api", "ecr.dkr", "logs", "secretsmanager"})
+
+    def test_custom_interface_endpoints(self):
+        app = core.App()
+        stack = NetworkStack(app, "NetworkStack", vpc_name="MyVpc", vpc_cidr="10.0.0.0/16", availability_zones=["us-west-2a", "us-west-2b", "us-west-2c"],
+                             interface_endpoints=[ec2.InterfaceVpcEndpointAwsService.STS])
+
+        template = assertions.Template.from_stack(stack)
+
+        # The two gateway endpoints plus STS
+        template.resource_count_is("AWS::EC2::VPCEndpoint", 3)
+        template.has_resource_properties("AWS::EC2::VPCEndpoint", {
+            "VpcEndpointType": "Interface",
+            "ServiceName": {"Fn::Join": ["", ["com.amazonaws.", {"Ref": "AWS::Region"}, ".sts"]]}
+        })
+
+    def test_private_subnets_route_to_nat_in_their_own_az(self):
+        template = self.template
+
+        self.assertEqual(private_subnet_nat_routes(template), {
+            "vpcprivateSubnet1": "vpcpublicSubnet1",
+            "vpcprivateSubnet2": "vpcpublicSubnet2",
+            "vpcprivateSubnet3": "vpcpublicSubnet3"
+        })
+
+    def test_single_nat_gateway_topology(self):
+        app = core.App()
+        stack = NetworkStack(app, "NetworkStack", vpc_name="MyVpc", vpc_cidr="10.0.0.0/16", availability_zones=AZS,
+                             nat_gateways=1)
+
+        template = assertions.Template.from_stack(stack)
+
+        template.resource_count_is("AWS::EC2::NatGateway", 1)
+        self.assertEqual(set(private_subnet_nat_routes(template).values()), {"vpcpublicSubnet1"})
+
+    def test_isolated_db_tier_with_custom_masks(self):
+        app = core.App()
+        stack = NetworkStack(app, "NetworkStack", vpc_name="MyVpc", vpc_cidr="10.0.0.0/16", availability_zones=AZS,
+                             subnet_configuration=subnet_tiers(public_mask=24, private_mask=19, isolated_db_mask=26))
+
+        template = assertions.Template.from_stack(stack)
+
+        template.resource_count_is("AWS::EC2::Subnet", 9)
+        template.has_resource_properties("AWS::EC2::Subnet", {"CidrBlock": "10.0.0.0/24"})
+        template.has_resource_properties("AWS::EC2::Subnet", {"CidrBlock": "10.0.32.0/19"})
+        template.has_resource_properties("AWS::EC2::Subnet", {"CidrBlock": "10.0.128.0/26"})
+        # Isolated route tables have no default route at all
+        isolated_routes = [name for name in template.find_resources("AWS::EC2::Route") if "isolated" in name]
+        self.assertEqual(isolated_routes, [])
+        self.assertEqual(len(stack.outputs['isolated_subnets']), 3)
+
+    def test_ipv6_dual_stack(self):
+        app = core.App()
+        stack = NetworkStack(app, "NetworkStack", vpc_name="MyVpc", vpc_cidr="10.0.0.0/16", availability_zones=AZS,
+                             ipv6=True)
+
+        template = assertions.Template.from_stack(stack)
+
+        template.has_resource_properties("AWS::EC2::VPCCidrBlock", {"AmazonProvidedIpv6CidrBlock": True})
+        subnets = template.find_resources("AWS::EC2::Subnet")
+        self.assertTrue(all("Ipv6CidrBlock" in subnet["Properties"] for subnet in subnets.values()))
+        self.assertTrue(all("Ipv6CidrBlock" in subnet["DependsOn"][0] for subnet in subnets.values()))
+        template.resource_count_is("AWS::EC2::EgressOnlyInternetGateway", 1)
+        ipv6_routes = template.find_resources("AWS::EC2::Route", {"Properties": {"DestinationIpv6CidrBlock": "::/0"}})
+        self.assertEqual(len(ipv6_routes), 6)
+        template.has_resource_properties("AWS::EC2::Route", {
+            "DestinationIpv6CidrBlock": "::/0",
+            "GatewayId": {"Ref": assertions.Match.string_like_regexp("vpcIGW")}
+        })
+        template.has_resource_properties("AWS::EC2::Route", {
+            "DestinationIpv6CidrBlock": "::/0",
+            "EgressOnlyInternetGatewayId": {"Ref": assertions.Match.string_like_regexp("EgressOnlyInternetGateway")}
+        })
+
+    def test_invalid_nat_gateway_count(self):
+        app = core.App()
+        with self.assertRaises(ValueError):
+            NetworkStack(app, "NetworkStack", vpc_name="MyVpc", vpc_cidr="10.0.0.0/16", availability_zones=AZS,
+                         nat_gateways=4)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+from aws_cdk import aws_ec2 as ec2, aws_ecs as ecs
+from cdk_demo.security_stack import SecurityStack
+
+
+def build_security_template(**kwargs):
+    app = core.App()
+    vpc_stack = core.Stack(app, "VpcStack")
+    vpc = ec2.Vpc(vpc_stack, "Vpc")
+    stack = SecurityStack(app, "SecurityStack", vpc=vpc, **kwargs)
+    return stack, assertions.Template.from_stack(stack)
+
+
+class SecurityStackTest(unittest.TestCase):
+
+    def test_db_security_group_admits_ecs_and_rds_proxy(self):
+        _, template = build_security_template()
+        db_sg_id = {"Fn::GetAtt": [assertions.Match.string_like_regexp("DBSG"), "GroupId"]}
+
+        template.has_resource_properties("AWS::EC2::SecurityGroup", {
+            "GroupName": "DBSG",
+            "SecurityGroupIngress": [assertions.Match.object_like({
+                "IpProtocol": "tcp",
+                "FromPort": 5432,
+                "ToPort": 5432,
+                "SourceSecurityGroupId": {"Fn::GetAtt": [assertions.Match.string_like_regexp("ECSSG"), "GroupId"]}
+            })]
+        })
+        template.has_resource_properties("AWS::EC2::SecurityGroupIngress", {
+            "IpProtocol": "tcp",
+            "FromPort": 5432,
+            "ToPort": 5432,
+            "GroupId": db_sg_id,
+            "SourceSecurityGroupId": db_sg_id
+        })
+
+    def test_lambda_role_can_send_email(self):
+        _, template = build_security_template()
+
+        template.has_resource_properties("AWS::IAM::Role", {
+            "AssumeRolePolicyDocument": assertions.Match.object_like({
+                "Statement": [assertions.Match.object_like({"Principal": {"Service": "lambda.amazonaws.com"}})]
+            }),
+            "Policies": [assertions.Match.object_like({
+                "PolicyName": "LambdaPolicy",
+                "PolicyDocument": assertions.Match.object_like({
+                    "Statement": [assertions.Match.object_like({
+                        "Action": assertions.Match.array_with(
+                            ["ses:SendEmail", "ses:SendTemplatedEmail", "ses:SendBulkTemplatedEmail"])
+                    })]
+                })
+            })]
+        })
+
+    def test_bridge_mode_opens_dynamic_host_ports(self):
+        stack, template = build_security_template()
+
+        template.has_resource_properties("AWS::EC2::SecurityGroup", {
+            "GroupName": "ECSSG",
+            "SecurityGroupIngress": assertions.Match.array_with([assertions.Match.object_like({
+                "FromPort": 31000,
+                "ToPort": 61000
+            })])
+        })
+        self.assertNotIn('ECSTaskSG', stack.outputs)
+
+    def test_awsvpc_mode_uses_task_security_group(self):
+        stack, template = build_security_template(network_mode=ecs.NetworkMode.AWS_VPC)
+
+        ecs_sg = template.find_resources("AWS::EC2::SecurityGroup", {"Properties": {"GroupName": "ECSSG"}})
+        ingress_ports = [rule["FromPort"] for sg in ecs_sg.values() for rule in sg["Properties"]["SecurityGroupIngress"]]
+        self.assertEqual(ingress_ports, [22])
+        template.has_resource_properties("AWS::EC2::SecurityGroup", {
+            "GroupName": "ECSTaskSG",
+            "SecurityGroupIngress": [assertions.Match.object_like({
+                "FromPort": 80,
+                "ToPort": 80,
+                "SourceSecurityGroupId": {"Fn::GetAtt": [assertions.Match.string_like_regexp("ALBSG"), "GroupId"]}
+            })]
+        })
+        template.has_resource_properties("AWS::EC2::SecurityGroup", {
+            "GroupName": "DBSG",
+            "SecurityGroupIngress": assertions.Match.array_with([assertions.Match.object_like({
+                "FromPort": 5432,
+                "SourceSecurityGroupId": {"Fn::GetAtt": [assertions.Match.string_like_regexp("ECSTaskSG"), "GroupId"]}
+            })])
+        })
+        self.assertIn('ECSTaskSG', stack.outputs)
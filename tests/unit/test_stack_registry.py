@@ -0,0 +1,76 @@
+import unittest
+import aws_cdk as core
+from cdk_demo.stack_registry import *
+
+BUILT = []
+
+
+def build_stack(app, construct_id, environment, settings, stacks):
+    BUILT.append((construct_id, environment.get('region'), sorted(stacks)))
+    return core.Stack(app, construct_id, env=core.Environment(region=environment.get('region')))
+
+
+def registry_config(**stack_overrides):
+    stacks = {
+        'network': {'id': "Network", 'env': "primary", 'builder': f"{__name__}:build_stack"},
+        'security': {'id': "Security", 'env': "primary", 'builder': f"{__name__}:build_stack",
+                     'depends_on': ["network"]},
+        'backend': {'id': "Backend", 'env': "primary", 'builder': f"{__name__}:build_stack",
+                    'depends_on': ["network", "security"]},
+        'replica': {'id': "Replica", 'env': "secondary", 'builder': f"{__name__}:build_stack",
+                    'depends_on': ["backend"]},
+    }
+    stacks.update(stack_overrides)
+    return {
+        'environments': {'primary': {'region': "us-east-1"}, 'secondary': {'region': "us-west-2"}},
+        'settings': {},
+        'stacks': stacks
+    }
+
+
+class StackRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        BUILT.clear()
+
+    def test_resolve_puts_dependencies_first(self):
+        registry = StackRegistry(core.App(), registry_config())
+        self.assertEqual(registry.resolve(["backend"]), ["network", "security", "backend"])
+        self.assertEqual(registry.resolve(), ["network", "security", "backend", "replica"])
+
+    def test_resolve_rejects_unknown_stack(self):
+        registry = StackRegistry(core.App(), registry_config())
+        with self.assertRaises(ValueError):
+            registry.resolve(["frontend"])
+
+    def test_resolve_rejects_cycles(self):
+        config = registry_config(network={'id': "Network", 'builder': f"{__name__}:build_stack",
+                                          'depends_on': ["backend"]})
+        with self.assertRaises(ValueError):
+            StackRegistry(core.App(), config).resolve(["backend"])
+
+    def test_parse_selection(self):
+        self.assertEqual(StackRegistry.parse_selection(None), [])
+        self.assertEqual(StackRegistry.parse_selection("backend, network"), ["backend", "network"])
+        self.assertEqual(StackRegistry.parse_selection(["elb"]), ["elb"])
+
+    def test_selective_build_only_constructs_dependencies(self):
+        app = core.App()
+        registry = StackRegistry(app, registry_config())
+        stacks = registry.build(["security"])
+
+        self.assertEqual(sorted(stacks), ["network", "security"])
+        self.assertEqual(BUILT, [("Network", "us-east-1", []), ("Security", "us-east-1", ["network"])])
+        self.assertEqual([stack.stack_name for stack in app.synth().stacks], ["Network", "Security"])
+
+    def test_timing_report_lists_constructed_stacks(self):
+        registry = StackRegistry(core.App(), registry_config())
+        registry.build(["replica"])
+        report = registry.timing_report()
+        for name in ["network", "security", "backend", "replica", "total"]:
+            self.assertIn(name, report)
+
+    def test_shipped_config_resolves(self):
+        registry = StackRegistry.from_file(core.App(), "stacks.json")
+        self.assertEqual(registry.resolve(["db_replication"]),
+                         ["network_west", "network", "security", "elb", "backend", "db_replication"])
@@ -0,0 +1,64 @@
+import json
+import unittest
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+from cdk_demo.stage_matrix import *
+
+
+def stacks_config():
+    with open(STACKS_CONFIG, encoding='utf-8') as config_file:
+        return json.load(config_file)
+
+
+class StageMatrixTest(unittest.TestCase):
+
+    def test_shipped_stages_load(self):
+        stages = load_stages()
+        self.assertEqual([stage.name for stage in stages],
+                         ["dev-us-east-1", "staging-us-east-1", "prod-us-east-1", "prod-eu-west-1"])
+        self.assertTrue(all(stage.account == "445362076974" for stage in stages))
+
+    def test_select_stages(self):
+        stages = load_stages()
+        self.assertEqual(select_stages(stages, "all"), stages)
+        self.assertEqual([stage.name for stage in select_stages(stages, "prod-eu-west-1,dev-us-east-1")],
+                         ["prod-eu-west-1", "dev-us-east-1"])
+        with self.assertRaises(ValueError):
+            select_stages(stages, "qa-us-east-1")
+
+    def test_stage_validation(self):
+        with self.assertRaises(ValueError):
+            StageConfig("test", "qa", "123456789012", "us-east-1", ["us-east-1a"]).validate()
+        with self.assertRaises(ValueError):
+            StageConfig("test", "dev", "123456789012", "us-east-1", ["us-east-1a"], resource_prefix="demo").validate()
+
+    def test_registry_config_lays_stage_over_shared_settings(self):
+        stage = StageConfig("staging", "staging", "123456789012", "eu-west-1", ["eu-west-1a"],
+                            resource_prefix="demo-staging-", sizing={'nat_gateways': 1})
+        config = stage.registry_config(stacks_config())
+
+        self.assertEqual(config['environments'], {'primary': {'account': "123456789012", 'region': "eu-west-1",
+                                                              'availability_zones': ["eu-west-1a"]}})
+        self.assertEqual(config['settings']['resource_prefix'], "demo-staging-")
+        self.assertEqual(config['settings']['environment'], "staging")
+        self.assertEqual(config['settings']['nat_gateways'], 1)
+        # The shared global database belongs to the dev app, not to every stage
+        self.assertNotIn('global_db_name', config['settings'])
+
+    def test_stage_applies_sizing(self):
+        app = core.App()
+        stage = DemoStage(app, select_stages(load_stages(), ["staging-us-east-1"])[0], stacks_config())
+        self.assertEqual(sorted(stage.registry.stacks), ["backend", "elb", "network", "security"])
+
+        backend = assertions.Template.from_stack(stage.registry.stacks['backend'])
+        backend.has_resource_properties("AWS::AutoScaling::AutoScalingGroup", {"MinSize": "1", "MaxSize": "4"})
+        backend.has_resource_properties("AWS::RDS::DBCluster", {
+            "DBClusterIdentifier": "cdkdemostagingdbstaging",
+            "ServerlessV2ScalingConfiguration": {"MinCapacity": 0.5, "MaxCapacity": 4}
+        })
+        backend.has_resource_properties("AWS::Lambda::EventSourceMapping", {
+            "BatchSize": 50, "MaximumBatchingWindowInSeconds": 5
+        })
+        backend.resource_count_is("AWS::RDS::GlobalCluster", 0)
+        network = assertions.Template.from_stack(stage.registry.stacks['network'])
+        network.resource_count_is("AWS::EC2::NatGateway", 1)
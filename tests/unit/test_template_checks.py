@@ -0,0 +1,114 @@
+import json
+import os
+import unittest
+import pytest
+from cdk_demo.template_checks import *
+
+SNAPSHOT_DIR = os.path.join(os.path.dirname(__file__), "snapshots")
+# UPDATE_SNAPSHOTS=1 python -m pytest tests/unit/test_template_checks.py records new snapshots
+UPDATE_SNAPSHOTS = os.environ.get('UPDATE_SNAPSHOTS') == "1"
+# Only the first changes are shown, the rest are counted
+MAX_DIFF_LINES = 40
+
+
+def target_group(interval, threshold):
+    return {"Type": "AWS::ElasticLoadBalancingV2::TargetGroup",
+            "Properties": {"HealthCheckIntervalSeconds": interval, "UnhealthyThresholdCount": threshold}}
+
+
+def queue_consumer(visibility_timeout, lambda_timeout, through_alias=False):
+    resources = {
+        "Queue": {"Type": "AWS::SQS::Queue", "Properties": {"VisibilityTimeout": visibility_timeout}},
+        "Function": {"Type": "AWS::Lambda::Function", "Properties": {"Timeout": lambda_timeout}},
+        "Mapping": {"Type": "AWS::Lambda::EventSourceMapping", "Properties": {
+            "EventSourceArn": {"Fn::GetAtt": ["Queue", "Arn"]},
+            "FunctionName": {"Ref": "Alias" if through_alias else "Function"}
+        }}
+    }
+    if through_alias:
+        resources["Alias"] = {"Type": "AWS::Lambda::Alias", "Properties": {"FunctionName": {"Ref": "Function"}}}
+    return {"Resources": resources}
+
+
+class TemplateChecksTest(unittest.TestCase):
+
+    def test_canonicalize_drops_toolkit_noise(self):
+        template = {
+            "Resources": {
+                "Function": {"Type": "AWS::Lambda::Function", "Properties": {"Code": {"S3Key": "a" * 64 + ".zip"}}},
+                "CDKMetadata": {"Type": "AWS::CDK::Metadata", "Properties": {}}
+            },
+            "Parameters": {"BootstrapVersion": {"Type": "String"}},
+            "Rules": {"CheckBootstrapVersion": {}}
+        }
+        self.assertEqual(canonicalize(template), {"Resources": {
+            "Function": {"Properties": {"Code": {"S3Key": "<asset-hash>.zip"}}, "Type": "AWS::Lambda::Function"}
+        }})
+
+    def test_structural_diff(self):
+        old = {"Resources": {"A": {"Properties": {"Port": 80, "Tags": [1, 2]}}, "B": {}}}
+        new = {"Resources": {"A": {"Properties": {"Port": 443, "Tags": [1, 2]}}, "C": {}}}
+        self.assertEqual(structural_diff(old, new), [
+            "~ Resources.A.Properties.Port: 80 -> 443",
+            "- Resources.B",
+            "+ Resources.C"
+        ])
+        self.assertEqual(structural_diff(old, old), [])
+
+    def test_slow_health_checks_exceed_budget(self):
+        budgets = ResourceBudgets()
+        self.assertEqual(budgets.check({"Resources": {"Api": target_group(15, 3)}}), [])
+        violations = budgets.check({"Resources": {"Api": target_group(70, 10)}})
+        self.assertEqual(len(violations), 1)
+        self.assertIn("700s", violations[0])
+        # Left out, AWS defaults to 30s x 2
+        self.assertEqual(budgets.check({"Resources": {"Api": {
+            "Type": "AWS::ElasticLoadBalancingV2::TargetGroup", "Properties": {}}}}), [])
+
+    def test_asg_max_capacity_budget(self):
+        asg = {"Type": "AWS::AutoScaling::AutoScalingGroup", "Properties": {"MinSize": "0", "MaxSize": "1"}}
+        self.assertEqual(len(ResourceBudgets().check({"Resources": {"ASG": asg}})), 1)
+        self.assertEqual(ResourceBudgets(min_asg_max_capacity=1).check({"Resources": {"ASG": asg}}), [])
+
+    def test_visibility_timeout_ratio_budget(self):
+        budgets = ResourceBudgets()
+        self.assertEqual(budgets.check(queue_consumer(180, 30)), [])
+        self.assertEqual(len(budgets.check(queue_consumer(60, 30))), 1)
+        self.assertEqual(len(budgets.check(queue_consumer(60, 30, through_alias=True))), 1)
+
+
+@pytest.mark.usefixtures("shared_app_templates")
+class AppTemplateTest(unittest.TestCase):
+    # self.templates holds the primary region stacks of stacks.json, synthesized once per session
+
+    def test_templates_match_snapshots(self):
+        for stack_id, template in self.templates.items():
+            with self.subTest(stack=stack_id):
+                path = os.path.join(SNAPSHOT_DIR, f"{stack_id}.json")
+                current = canonicalize(template)
+                if UPDATE_SNAPSHOTS:
+                    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+                    with open(path, "w", encoding='utf-8') as snapshot_file:
+                        json.dump(current, snapshot_file, indent=1, sort_keys=True)
+                        snapshot_file.write("\n")
+                    continue
+                # A missing snapshot fails too, otherwise a deleted one would pass unnoticed
+                if not os.path.exists(path):
+                    self.fail(f"{stack_id} has no snapshot at {path}, rerun with UPDATE_SNAPSHOTS=1 to record it")
+                with open(path, encoding='utf-8') as snapshot_file:
+                    changes = structural_diff(json.load(snapshot_file), current)
+                if changes:
+                    shown = "\n".join(changes[:MAX_DIFF_LINES])
+                    more = f"\n... {len(changes) - MAX_DIFF_LINES} more" if len(changes) > MAX_DIFF_LINES else ""
+                    self.fail(f"{stack_id} differs from {path}, rerun with UPDATE_SNAPSHOTS=1 if intended:\n"
+                              f"{shown}{more}")
+
+    def test_templates_within_budgets(self):
+        budgets = ResourceBudgets()
+        for stack_id, template in self.templates.items():
+            with self.subTest(stack=stack_id):
+                self.assertEqual(budgets.check(template), [])
+
+    def test_all_primary_stacks_are_covered(self):
+        self.assertEqual(sorted(self.templates), ["cdk-demo-BackendStack", "cdk-demo-ElbStack",
+                                                  "cdk-demo-NetworkStack", "cdk-demo-SecurityStack"])